@@ -0,0 +1,76 @@
+"""
+Benchmark: Parsen/Aggregieren vieler .dly-Dateien im Worker-Thread vs. im Prozesspool (AGGREGATE_WORKERS).
+Gemessen werden Durchsatz (Stationen/s) und die maximale Verzögerung der Event-Loop, d.h. wie lange
+z.B. ein gleichzeitiger /stations-query-Aufruf warten müsste.
+
+Aufruf aus dem Projektverzeichnis:
+    python -m benchmarks.bench_aggregate_pool
+    python -m benchmarks.bench_aggregate_pool --stations 32 --workers 1 2 4
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from src import aggregate_pool
+from src.tests.ghcn_fixtures import make_dly
+from src.station_aggregates import MonthlyAggregates, aggregate_dly_file
+
+
+async def run(paths: list, concurrency: int) -> tuple[float, float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    max_lag = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal max_lag
+        while not done:
+            t0 = time.perf_counter()
+            await asyncio.sleep(0.001)
+            max_lag = max(max_lag, time.perf_counter() - t0 - 0.001)
+
+    async def one(path):
+        async with semaphore:
+            return await aggregate_pool.run_cpu_bound(aggregate_dly_file, path)
+
+    tick = asyncio.create_task(ticker())
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(one(p) for p in paths))
+    elapsed = time.perf_counter() - t0
+    done = True
+    await tick
+    assert all(isinstance(r, MonthlyAggregates) for r in results)
+    return elapsed, max_lag
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, default=16)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, os.cpu_count() or 1])
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i in range(args.stations):
+            path = os.path.join(directory, f"BENCH{i:06d}.dly")
+            with open(path, "wb") as f:
+                f.write(make_dly(f"BENCH{i:06d}", 1850, 2024, elements=("TMAX", "TMIN", "PRCP", "SNOW"), seed=i))
+            paths.append(path)
+        size = sum(os.path.getsize(p) for p in paths)
+        print(f"{args.stations} Stationen, {size / 1e6:.0f} MB, {os.cpu_count()} CPUs")
+
+        for workers in args.workers:
+            aggregate_pool.AGGREGATE_WORKERS = workers
+            try:
+                asyncio.run(run(paths[:1], 1))  # Pool starten, Worker importieren
+                elapsed, max_lag = asyncio.run(run(paths, args.concurrency))
+            finally:
+                aggregate_pool.shutdown_aggregate_pool()
+            label = "Thread" if workers == 0 else f"{workers} Prozesse"
+            print(f"{label:12s} {elapsed * 1000:8.0f} ms   {args.stations / elapsed:7.1f} Stationen/s   "
+                  f"max. Loop-Verzögerung {max_lag * 1000:6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
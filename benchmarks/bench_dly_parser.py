@@ -0,0 +1,138 @@
+"""
+Benchmark: bisheriger zeilenweiser .dly-Parser vs. vektorisierter Parser (src/dly_parser.py).
+
+Aufruf aus dem Projektverzeichnis:
+    python -m benchmarks.bench_dly_parser                  # synthetische Station 1850-2024
+    python -m benchmarks.bench_dly_parser --file USW00094846.dly --start 1950 --end 2020
+"""
+import argparse
+import statistics
+import time
+from src.tests.ghcn_fixtures import make_dly
+from src.station_aggregates import MonthlyAggregates
+
+
+def legacy_station_data(payload: bytes, start_year: int, end_year: int, latitude=None) -> list:
+    """
+    Der ursprüngliche Parser aus get_station_data_from_ghcn (Zeilen-/Tagesschleife in Python),
+    unverändert bis auf den Download, als Vergleichsbasis.
+    """
+    lines = payload.decode("utf-8", errors="replace").splitlines()
+    sy, ey = start_year, end_year
+    annual_data = {}
+    seasonal_data = {}
+
+    def get_seasons(year, month):
+        if latitude is not None and latitude < 0:
+            if month in [12, 1, 2]:
+                return "summer", year
+            elif month in [3, 4, 5]:
+                return "autumn", year
+            elif month in [6, 7, 8]:
+                return "winter", year
+            return "spring", year
+        if month == 12:
+            return "winter", year + 1
+        elif month in [1, 2]:
+            return "winter", year
+        elif month in [3, 4, 5]:
+            return "spring", year
+        elif month in [6, 7, 8]:
+            return "summer", year
+        return "autumn", year
+
+    for line in lines:
+        if len(line) < 269:
+            continue
+        original_year = int(line[11:15])
+        month = int(line[15:17])
+        element = line[17:21]
+        if element not in ["TMIN", "TMAX"]:
+            continue
+        season, effective_year = get_seasons(original_year, month)
+        annual_in_range = sy <= original_year <= ey
+        seasonal_in_range = sy <= effective_year <= ey
+        key = "tmin_vals" if element == "TMIN" else "tmax_vals"
+        for day_idx in range(31):
+            offset = 21 + day_idx * 8
+            val_str = line[offset:offset + 8][0:5].strip()
+            if val_str == "-9999" or not val_str:
+                continue
+            try:
+                val = int(val_str) / 10.0
+            except ValueError:
+                continue
+            if annual_in_range:
+                annual_data.setdefault(original_year, {"tmin_vals": [], "tmax_vals": []})[key].append(val)
+            if seasonal_in_range:
+                seasons = seasonal_data.setdefault(effective_year, {
+                    s: {"tmin_vals": [], "tmax_vals": []} for s in ("spring", "summer", "autumn", "winter")
+                })
+                seasons[season][key].append(val)
+
+    def calc(vals):
+        return {
+            "min": round(sum(vals["tmin_vals"]) / len(vals["tmin_vals"]), 1) if vals["tmin_vals"] else None,
+            "max": round(sum(vals["tmax_vals"]) / len(vals["tmax_vals"]), 1) if vals["tmax_vals"] else None,
+        }
+
+    empty = {"tmin_vals": [], "tmax_vals": []}
+    output = []
+    for y in range(sy, ey + 1):
+        seasons = seasonal_data.get(y, {})
+        entry = {"year": y, "annual": calc(annual_data.get(y, empty))}
+        for s in ("spring", "summer", "autumn", "winter"):
+            entry[s] = calc(seasons.get(s, empty))
+        output.append(entry)
+    return output
+
+
+def vectorized_station_data(payload: bytes, start_year: int, end_year: int, latitude=None) -> list:
+    return MonthlyAggregates.from_dly(payload).to_station_data(start_year, end_year, latitude)
+
+
+def measure(fn, repeat: int) -> list:
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", help="echte .dly-Datei statt synthetischer Daten")
+    parser.add_argument("--start", type=int, default=1900)
+    parser.add_argument("--end", type=int, default=2024)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            payload = f.read()
+    else:
+        payload = make_dly("BENCH000001", 1850, 2024, elements=("TMAX", "TMIN", "PRCP", "SNOW", "SNWD", "TAVG"))
+
+    n_lines = payload.count(b"\n")
+    print(f"Datei: {len(payload) / 1e6:.1f} MB, {n_lines} Zeilen, Zeitraum {args.start}-{args.end}")
+
+    legacy = legacy_station_data(payload, args.start, args.end)
+    vectorized = vectorized_station_data(payload, args.start, args.end)
+    differing = sum(1 for a, b in zip(legacy, vectorized) if a != b)
+    print(f"Abweichende Jahre (nur exakte .x5-Rundungsgrenzen erwartet): {differing} von {len(legacy)}")
+
+    results = {
+        "legacy (Zeilenschleife)": measure(lambda: legacy_station_data(payload, args.start, args.end), args.repeat),
+        "vektorisiert (parse + aggregate)": measure(lambda: vectorized_station_data(payload, args.start, args.end), args.repeat),
+        "vektorisiert (nur parse)": measure(lambda: MonthlyAggregates.from_dly(payload), args.repeat),
+    }
+    baseline = statistics.median(results["legacy (Zeilenschleife)"])
+    for name, timings in results.items():
+        median = statistics.median(timings)
+        print(f"{name:36s} median {median * 1000:8.1f} ms   "
+              f"{n_lines / median:10.0f} Zeilen/s   Faktor {baseline / median:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
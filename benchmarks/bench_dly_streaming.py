@@ -0,0 +1,56 @@
+"""
+Benchmark: .dly-Download komplett puffern vs. blockweise parsen (Streaming, siehe stream_monthly_aggregates).
+Gemessen werden Laufzeit und Spitzen-Speicher (tracemalloc) für eine Station ohne Cache-Eintrag,
+ausgeliefert von einem lokalen NOAA-Ersatz (GhcnStubServer).
+
+Aufruf aus dem Projektverzeichnis:
+    python -m benchmarks.bench_dly_streaming                       # Zeitraum 1860-1870 (früher Abbruch)
+    python -m benchmarks.bench_dly_streaming --start 1850 --end 2024
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+import tracemalloc
+from src import station_aggregates
+from src.dly_cache import DlyCache
+from src.tests.ghcn_fixtures import GhcnStubServer, make_dly
+from src.station_aggregates import AggregateStore, load_monthly_aggregates
+
+
+def run_once(base_url: str, station_id: str, end_year: int, streaming: bool) -> tuple[float, int]:
+    station_aggregates.DLY_STREAMING = streaming
+    with tempfile.TemporaryDirectory() as directory:
+        cache = DlyCache(directory, base_url)
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        asyncio.run(load_monthly_aggregates(station_id, cache, AggregateStore(cache), end_year))
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--start", type=int, default=1860)
+    parser.add_argument("--end", type=int, default=1870)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    station_id = "BENCH000001"
+    payload = make_dly(station_id, 1850, 2024, elements=("TMAX", "TMIN", "PRCP", "SNOW", "SNWD", "TAVG"))
+    print(f"Datei: {len(payload) / 1e6:.1f} MB, Zeitraum {args.start}-{args.end}")
+
+    with GhcnStubServer({f"/all/{station_id}.dly": payload}) as server:
+        base_url = server.base_url + "/all"
+        for name, streaming in (("gepuffert", False), ("Streaming", True)):
+            runs = [run_once(base_url, station_id, args.end, streaming) for _ in range(args.repeat)]
+            median = statistics.median(t for t, _ in runs)
+            peak = max(p for _, p in runs)
+            print(f"{name:10s} median {median * 1000:8.1f} ms   Spitzen-Speicher {peak / 1e6:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark: Serialisierungsaufwand pro Anfrage vorher (response_model bzw. jsonable_encoder + JSONResponse)
+und nachher (direkte Byte-Serialisierung aus src/json_response.py).
+
+Aufruf aus dem Projektverzeichnis:
+    python -m benchmarks.bench_serialization
+    python -m benchmarks.bench_serialization --count 500 --years 150
+"""
+import argparse
+import statistics
+import time
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from src import Station, StationCatalog, get_stations_in_radius
+from src.tests.ghcn_fixtures import make_dly
+from src.json_response import FastJSONResponse, stations_json
+from src.station_aggregates import MonthlyAggregates
+
+
+def synthetic_catalog(n: int) -> StationCatalog:
+    stations = []
+    for i in range(n):
+        stations.append({"id": f"BENCH{i:06d}", "name": f"STATION {i}", "latitude": (i * 7.31) % 180 - 90,
+                         "longitude": (i * 13.7) % 360 - 180, "distance": 0.0,
+                         "inventory_start_year": 1900, "inventory_end_year": 2024})
+    return StationCatalog.from_dicts(stations)
+
+
+_STATIONS_ADAPTER = TypeAdapter(List[Station])
+
+
+def stations_before(stations: list) -> bytes:
+    # Entspricht FastAPI mit response_model=List[Station]: validieren, encodieren, JSONResponse
+    return JSONResponse(jsonable_encoder(_STATIONS_ADAPTER.validate_python(stations))).body
+
+
+def data_before(data: dict) -> bytes:
+    # Entspricht der Rückgabe eines dicts ohne response_model
+    return JSONResponse(jsonable_encoder(data)).body
+
+
+def measure(fn, arg, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - t0)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=100, help="Stationen in der /stations-query-Antwort")
+    parser.add_argument("--years", type=int, default=100, help="Jahre in der /station/data-Antwort")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    catalog = synthetic_catalog(50000)
+    stations = get_stations_in_radius(catalog, 0.0, 0.0, 20000, args.count)
+    payload = make_dly("BENCH000001", 2024 - args.years + 1, 2024)
+    data = {"station_id": "BENCH000001",
+            "data": MonthlyAggregates.from_dly(payload).to_station_data(2024 - args.years + 1, 2024, 50.0)}
+
+    assert stations_before(stations) == stations_json(stations)
+    assert data_before(data) == FastJSONResponse(data).body
+
+    cases = [
+        (f"/stations-query ({len(stations)} Stationen)", stations_before, stations_json, stations),
+        (f"/station/data ({args.years} Jahre)", data_before, lambda d: FastJSONResponse(d).body, data),
+    ]
+    for name, before, after, arg in cases:
+        t_before = measure(before, arg, args.repeat)
+        t_after = measure(after, arg, args.repeat)
+        print(f"{name:34s} vorher {t_before * 1e6:9.1f} µs   nachher {t_after * 1e6:8.1f} µs   "
+              f"Faktor {t_before / t_after:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
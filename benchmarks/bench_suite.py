@@ -0,0 +1,280 @@
+"""
+Benchmark-Suite gegen einen lokal gestarteten Server (uvicorn main:app), der statt NOAA einen
+lokalen Ersatz (GhcnStubServer) mit synthetischen Dateien kontrollierter Größe verwendet:
+ghcnd-stations.csv und ghcnd-inventory.txt mit --catalog-sizes Stationen, .dly-Dateien mit --years Jahren.
+
+Gemessen werden:
+  startup         Zeit vom Prozessstart bis zur ersten erfolgreichen /stations-query,
+                  ohne Katalog-Snapshot (kalt) und mit Snapshot (warm)
+  stations_query  Latenz je Katalog-Größe, Radius und count (Query-Cache ausgeschaltet)
+  station_data    Latenz und Durchsatz je Stationslänge und Parallelität, einmal ohne Cache-Eintrag
+                  (Download + Parsen) und einmal erneut (Monatsaggregate bereits vorhanden)
+
+Die Ergebnisse werden als JSON geschrieben (inkl. Commit), damit Läufe verschiedener Commits
+verglichen werden können; mit --compare wird eine frühere Ergebnisdatei gegenübergestellt.
+
+Aufruf aus dem Projektverzeichnis:
+    python -m benchmarks.bench_suite
+    python -m benchmarks.bench_suite --catalog-sizes 10000 130000 --output bench_results/neu.json
+    python -m benchmarks.bench_suite --compare bench_results/alt.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+import numpy as np
+from src.tests.ghcn_fixtures import GhcnStubServer, make_dly, make_inventory, make_station_list, make_stations_csv
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAST_YEAR = 2024
+
+
+def summarize(timings: list) -> dict:
+    arr = np.array(timings) * 1000
+    return {"n": len(timings), "mean_ms": round(float(arr.mean()), 3),
+            "p50_ms": round(float(np.percentile(arr, 50)), 3), "p95_ms": round(float(np.percentile(arr, 95)), 3),
+            "p99_ms": round(float(np.percentile(arr, 99)), 3), "max_ms": round(float(arr.max()), 3)}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ServerProcess:
+    """
+    Startet 'uvicorn main:app' als eigenen Prozess mit den übergebenen Umgebungsvariablen.
+    Die Ausgabe des Servers landet in 'log_path'.
+    """
+
+    def __init__(self, env: dict, log_path: str):
+        self.env = {**os.environ, **env}
+        self.log_path = log_path
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.process = None
+
+    def __enter__(self) -> "ServerProcess":
+        self._log = open(self.log_path, "ab")
+        self.started = time.perf_counter()
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(self.port)],
+            cwd=PROJECT_DIR, env=self.env, stdout=self._log, stderr=subprocess.STDOUT)
+        return self
+
+    def wait_ready(self, timeout: float = 300) -> float:
+        """
+        Wartet, bis /stations-query antwortet; Rückgabe: Sekunden seit dem Prozessstart.
+        """
+        url = f"{self.base_url}/stations-query?latitude=0&longitude=0&radius=1&count=1"
+        while time.perf_counter() - self.started < timeout:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server beendet (Exit-Code {self.process.returncode}), siehe {self.log_path}")
+            try:
+                if httpx.get(url, timeout=5).status_code == 200:
+                    return time.perf_counter() - self.started
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.02)
+        raise TimeoutError(f"Server nach {timeout} s nicht bereit, siehe {self.log_path}")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self._log.close()
+        return False
+
+
+def bench_stations_query(base_url: str, radii: list, counts: list, requests: int, seed: int) -> list:
+    rnd = random.Random(seed)
+    results = []
+    with httpx.Client(base_url=base_url, timeout=30) as client:
+        for radius in radii:
+            for count in counts:
+                timings = []
+                for _ in range(requests):
+                    params = {"latitude": round(rnd.uniform(-60, 80), 5), "longitude": round(rnd.uniform(-180, 180), 5),
+                              "radius": radius, "count": count}
+                    t0 = time.perf_counter()
+                    r = client.get("/stations-query", params=params)
+                    timings.append(time.perf_counter() - t0)
+                    r.raise_for_status()
+                results.append({"radius_km": radius, "count": count, **summarize(timings)})
+    return results
+
+
+async def _run_station_data(base_url: str, station_ids: list, first_year: int, concurrency: int) -> tuple:
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    timings = []
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        async def one(station_id):
+            async with semaphore:
+                t0 = time.perf_counter()
+                r = await client.get("/station/data", params={"stationId": station_id, "startYear": first_year,
+                                                              "endYear": LAST_YEAR})
+                timings.append(time.perf_counter() - t0)
+                r.raise_for_status()
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(station_id) for station_id in station_ids))
+        elapsed = time.perf_counter() - t0
+    return timings, elapsed
+
+
+def bench_station_data(base_url: str, plan: list) -> list:
+    results = []
+    for years, concurrency, station_ids in plan:
+        first_year = LAST_YEAR - years + 1
+        for phase in ("cold", "warm"):
+            timings, elapsed = asyncio.run(_run_station_data(base_url, station_ids, first_year, concurrency))
+            results.append({"years": years, "concurrency": concurrency, "phase": phase,
+                            "throughput_rps": round(len(station_ids) / elapsed, 2), **summarize(timings)})
+    return results
+
+
+def station_data_plan(stations: list, years_list: list, concurrencies: list, requests: int) -> list:
+    """
+    Ordnet jeder Kombination (Jahre, Parallelität) eigene Stationen zu, damit der kalte Durchlauf
+    tatsächlich ohne Cache-Eintrag startet.
+    """
+    ids = iter(station_id for station_id, *_ in stations)
+    return [(years, concurrency, [next(ids) for _ in range(requests)])
+            for years in years_list for concurrency in concurrencies]
+
+
+def run_suite(args) -> dict:
+    results = {"startup": [], "stations_query": [], "station_data": []}
+    payloads = {years: make_dly("SYNTHETIC00", LAST_YEAR - years + 1, LAST_YEAR, seed=years) for years in args.years}
+
+    for catalog_size in args.catalog_sizes:
+        stations = make_station_list(catalog_size, seed=args.seed)
+        files = {"/ghcnd-stations.csv": make_stations_csv(stations), "/ghcnd-inventory.txt": make_inventory(stations)}
+        plan = []
+        if catalog_size == args.catalog_sizes[0]:
+            plan = station_data_plan(stations, args.years, args.concurrency, args.data_requests)
+            for years, _, station_ids in plan:
+                for station_id in station_ids:
+                    files[f"/all/{station_id}.dly"] = payloads[years]
+
+        with GhcnStubServer(files) as stub, tempfile.TemporaryDirectory() as directory:
+            env = {
+                "GHCN_STATIONS_CSV_URL": stub.base_url + "/ghcnd-stations.csv",
+                "GHCN_INVENTORY_URL": stub.base_url + "/ghcnd-inventory.txt",
+                "GHCN_DAILY_BASE_URL": stub.base_url + "/all",
+                "CATALOG_SNAPSHOT_PATH": os.path.join(directory, "station_catalog.bin"),
+                "DLY_CACHE_DIR": os.path.join(directory, "dly"),
+                "CATALOG_REFRESH_INTERVAL": "0",
+                "QUERY_CACHE_MAX_ENTRIES": "0",
+            }
+            log_path = os.path.join(args.log_dir or directory, f"server-{catalog_size}.log")
+
+            for phase in ("cold", "warm"):
+                with ServerProcess(env, log_path) as server:
+                    seconds = server.wait_ready()
+                    results["startup"].append({"catalog_size": catalog_size, "phase": phase,
+                                               "seconds": round(seconds, 3)})
+                    print(f"Start ({catalog_size} Stationen, {phase}): {seconds:.2f} s")
+                    if phase == "cold":
+                        continue
+                    for row in bench_stations_query(server.base_url, args.radii, args.counts, args.query_requests,
+                                                    args.seed):
+                        results["stations_query"].append({"catalog_size": catalog_size, **row})
+                        print(f"/stations-query {catalog_size:7d} Stationen, {row['radius_km']:6g} km, "
+                              f"count {row['count']:4d}: p50 {row['p50_ms']:7.2f} ms  p99 {row['p99_ms']:7.2f} ms")
+                    for row in bench_station_data(server.base_url, plan):
+                        results["station_data"].append(row)
+                        print(f"/station/data {row['years']:4d} Jahre, {row['concurrency']:3d} parallel, "
+                              f"{row['phase']}: p50 {row['p50_ms']:8.2f} ms  p99 {row['p99_ms']:8.2f} ms  "
+                              f"{row['throughput_rps']:8.1f} Anfragen/s")
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=PROJECT_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _keyed(report: dict) -> dict:
+    """
+    Ergebnisse als (Bereich, Parameter) → Zeile, um zwei Läufe zeilenweise zu vergleichen.
+    """
+    keyed = {}
+    for section, rows in report["results"].items():
+        for row in rows:
+            params = tuple((k, v) for k, v in row.items() if not k.endswith(("_ms", "_rps")) and k not in ("n", "seconds"))
+            keyed[(section, params)] = row
+    return keyed
+
+
+def compare(old: dict, new: dict) -> None:
+    print(f"\nVergleich {old.get('commit', '')[:10] or '?'} → {new.get('commit', '')[:10] or '?'} "
+          "(Faktor > 1 = langsamer)")
+    old_rows = _keyed(old)
+    for key, row in _keyed(new).items():
+        before = old_rows.get(key)
+        if before is None:
+            continue
+        metric = "seconds" if "seconds" in row else "p50_ms"
+        if before[metric]:
+            label = " ".join(f"{k}={v}" for k, v in key[1])
+            print(f"{key[0]:15s} {label:55s} {metric} {before[metric]:9.3f} → {row[metric]:9.3f}  "
+                  f"Faktor {row[metric] / before[metric]:5.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--catalog-sizes", type=int, nargs="+", default=[10000, 130000])
+    parser.add_argument("--radii", type=float, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--counts", type=int, nargs="+", default=[5, 100])
+    parser.add_argument("--query-requests", type=int, default=200, help="Anfragen je Radius/count")
+    parser.add_argument("--years", type=int, nargs="+", default=[10, 50, 150], help="Länge der .dly-Dateien")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--data-requests", type=int, default=32, help="Stationen je Jahre/Parallelität")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="frühere Ergebnisdatei zum Vergleich")
+    parser.add_argument("--log-dir", help="Verzeichnis für die Server-Logs (Standard: temporär)")
+    args = parser.parse_args()
+    if args.log_dir:
+        os.makedirs(args.log_dir, exist_ok=True)
+
+    report = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "parameters": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "log_dir")},
+        "results": run_suite(args),
+    }
+    if os.path.dirname(args.output):
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Ergebnisse geschrieben: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
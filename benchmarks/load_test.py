@@ -0,0 +1,159 @@
+"""
+Lasttest für /station/data: viele Nutzer öffnen gleichzeitig Stationen mit langer Historie,
+die noch nicht im Cache liegen. Der Server (uvicorn main:app) läuft als eigener Prozess gegen
+einen langsamen lokalen NOAA-Ersatz (GhcnStubServer mit --upstream-delay).
+
+Ausgegeben werden p50/p99 der Latenz (erfolgreiche und abgewiesene Anfragen getrennt),
+die Anzahl der Antworten je Statuscode und der Spitzenwert des Arbeitsspeichers (RSS)
+des Serverprozesses. Die Zulassungskontrolle wird über die Optionen bzw. die
+Umgebungsvariablen aus src/admission.py eingestellt.
+
+Aufruf aus dem Projektverzeichnis:
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --users 200 --years 170 --max-concurrent 4 --max-queue 16
+    python -m benchmarks.load_test --max-concurrent 1000 --max-queue 0     # praktisch ohne Begrenzung
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+import httpx
+from benchmarks.bench_suite import LAST_YEAR, ServerProcess, git_commit, summarize
+from src.tests.ghcn_fixtures import GhcnStubServer, make_dly, make_inventory, make_station_list, make_stations_csv
+
+
+class RssSampler:
+    """
+    Liest regelmäßig den Speicherbedarf eines Prozesses aus /proc (Linux) und merkt sich den Höchstwert.
+    """
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self) -> "RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, self._read("VmHWM:"), self._read("VmRSS:"))
+
+    def _read(self, field: str) -> int:
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith(field):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
+
+async def drive(base_url: str, station_ids: list, first_year: int, users: int, timeout: float) -> dict:
+    """
+    Jeder Nutzer fragt nacheinander seine Stationen ab; alle Nutzer starten gleichzeitig.
+    """
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    ok, rejected, statuses = [], [], {}
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def user(ids):
+            for station_id in ids:
+                t0 = time.perf_counter()
+                try:
+                    r = await client.get("/station/data", params={"stationId": station_id, "startYear": first_year,
+                                                                  "endYear": LAST_YEAR})
+                    status = str(r.status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                elapsed = time.perf_counter() - t0
+                statuses[status] = statuses.get(status, 0) + 1
+                (ok if status == "200" else rejected).append(elapsed)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(user(station_ids[i::users]) for i in range(users)))
+        elapsed = time.perf_counter() - t0
+
+    return {
+        "requests": len(station_ids),
+        "seconds": round(elapsed, 3),
+        "statuses": statuses,
+        "ok": summarize(ok) if ok else None,
+        "rejected": summarize(rejected) if rejected else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100, help="gleichzeitige Nutzer")
+    parser.add_argument("--requests", type=int, default=200, help="Anfragen insgesamt (verschiedene Stationen)")
+    parser.add_argument("--years", type=int, default=150, help="Länge der .dly-Dateien in Jahren")
+    parser.add_argument("--upstream-delay", type=float, default=0.5, help="Antwortverzögerung des NOAA-Ersatzes (s)")
+    parser.add_argument("--max-concurrent", type=int, help="UPSTREAM_MAX_CONCURRENT")
+    parser.add_argument("--max-queue", type=int, help="UPSTREAM_MAX_QUEUE")
+    parser.add_argument("--queue-timeout", type=float, help="UPSTREAM_QUEUE_TIMEOUT")
+    parser.add_argument("--memory-budget", type=int, help="DLY_MEMORY_BUDGET (Bytes)")
+    parser.add_argument("--streaming", choices=("0", "1"), help="DLY_STREAMING")
+    parser.add_argument("--timeout", type=float, default=120, help="Client-Timeout je Anfrage (s)")
+    parser.add_argument("--output", help="Ergebnisse zusätzlich als JSON schreiben")
+    args = parser.parse_args()
+
+    stations = make_station_list(args.requests, seed=1)
+    first_year = LAST_YEAR - args.years + 1
+    payload = make_dly("SYNTHETIC00", first_year, LAST_YEAR)
+    files = {"/ghcnd-stations.csv": make_stations_csv(stations), "/ghcnd-inventory.txt": make_inventory(stations)}
+    files.update((f"/all/{station_id}.dly", payload) for station_id, *_ in stations)
+
+    settings = {"UPSTREAM_MAX_CONCURRENT": args.max_concurrent, "UPSTREAM_MAX_QUEUE": args.max_queue,
+                "UPSTREAM_QUEUE_TIMEOUT": args.queue_timeout, "DLY_MEMORY_BUDGET": args.memory_budget,
+                "DLY_STREAMING": args.streaming}
+    settings = {key: str(value) for key, value in settings.items() if value is not None}
+
+    with GhcnStubServer(files) as stub, tempfile.TemporaryDirectory() as directory:
+        env = {
+            "GHCN_STATIONS_CSV_URL": stub.base_url + "/ghcnd-stations.csv",
+            "GHCN_INVENTORY_URL": stub.base_url + "/ghcnd-inventory.txt",
+            "GHCN_DAILY_BASE_URL": stub.base_url + "/all",
+            "CATALOG_SNAPSHOT_PATH": os.path.join(directory, "station_catalog.bin"),
+            "DLY_CACHE_DIR": os.path.join(directory, "dly"),
+            "CATALOG_REFRESH_INTERVAL": "0",
+            **settings,
+        }
+        with ServerProcess(env, os.path.join(directory, "server.log")) as server:
+            server.wait_ready()
+            # Erst nach dem Start verzögern, damit nur die .dly-Downloads langsam sind
+            stub.delay = args.upstream_delay
+            with RssSampler(server.process.pid) as sampler:
+                result = asyncio.run(drive(server.base_url, [s[0] for s in stations], first_year, args.users,
+                                           args.timeout))
+        peak_rss = sampler.peak_bytes or resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+
+    result.update({"peak_rss_mb": round(peak_rss / 2 ** 20, 1), "payload_mb": round(len(payload) / 2 ** 20, 2),
+                   "settings": settings, "users": args.users, "upstream_delay": args.upstream_delay})
+    print(f"{result['requests']} Anfragen von {args.users} Nutzern in {result['seconds']:.1f} s, "
+          f"Status: {result['statuses']}")
+    for name in ("ok", "rejected"):
+        if result[name]:
+            print(f"  {name:8s} p50 {result[name]['p50_ms']:9.1f} ms   p99 {result[name]['p99_ms']:9.1f} ms")
+    print(f"  Spitzen-RSS des Servers: {result['peak_rss_mb']:.1f} MB (.dly-Datei: {result['payload_mb']:.2f} MB)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"commit": git_commit(), **result}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Offline-Import der GHCN-Daily-Daten in den lokalen Stationsspeicher (src/station_store.py).
+
+Quelle ist entweder das komplette Archiv ghcnd_all.tar.gz (wird beim Lesen entpackt, ohne es
+vorher auf die Platte zu schreiben) oder ein Verzeichnis mit .dly-Dateien. Die Dateien werden
+parallel in mehreren Prozessen geparst; pro Station wird eine Datei mit den Monatsaggregaten
+(TMIN, TMAX, TAVG, PRCP) abgelegt. Mit STATION_STORE_DIR=<store> beantwortet der Server /station/data
+anschließend aus diesem Speicher statt von NOAA.
+
+Aufruf aus dem Projektverzeichnis:
+    python ingest.py ghcnd_all.tar.gz --store cache/store
+    python ingest.py /data/ghcnd_all --store cache/store --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import tarfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from src.station_store import STATION_STORE_DIR, ingest_dly, ingest_dly_file
+
+
+class IngestProgress:
+    """
+    Zählt verarbeitete Stationen und Bytes und gibt regelmäßig den Durchsatz aus.
+    """
+
+    def __init__(self, report_every: int = 1000):
+        self.report_every = report_every
+        self.stations = 0
+        self.bytes = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+
+    def add(self, n_bytes: int) -> None:
+        self.stations += 1
+        self.bytes += n_bytes
+        if self.report_every and self.stations % self.report_every == 0:
+            print(self.line())
+
+    def line(self) -> str:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return (f"{self.stations} Stationen, {self.bytes / 1e6:.1f} MB in {elapsed:.1f} s: "
+                f"{self.stations / elapsed:.1f} Stationen/s, {self.bytes / 1e6 / elapsed:.1f} MB/s"
+                + (f", {self.failed} fehlgeschlagen" if self.failed else ""))
+
+
+def iter_tar_members(path: str):
+    """
+    Liefert (station_id, payload) für alle .dly-Dateien eines (gz-komprimierten) tar-Archivs.
+    Das Archiv wird als Stream gelesen ("r|*"), d.h. nur die aktuelle Datei liegt im Speicher.
+    """
+    with tarfile.open(path, "r|*") as archive:
+        for member in archive:
+            if not member.isfile() or not member.name.endswith(".dly"):
+                continue
+            station_id = os.path.basename(member.name)[:-len(".dly")]
+            yield station_id, archive.extractfile(member).read()
+
+
+def iter_directory(path: str):
+    for name in sorted(os.listdir(path)):
+        if name.endswith(".dly"):
+            yield os.path.join(path, name)
+
+
+def ingest(source: str, store_dir: str, workers: int, report_every: int = 1000) -> IngestProgress:
+    """
+    Importiert alle .dly-Dateien aus 'source' (tar-Archiv oder Verzeichnis) nach 'store_dir'.
+    workers = 0 verarbeitet alles im aktuellen Prozess.
+    """
+    if os.path.isdir(source):
+        tasks = ((ingest_dly_file, store_dir, path) for path in iter_directory(source))
+    else:
+        tasks = ((ingest_dly, store_dir, station_id, payload) for station_id, payload in iter_tar_members(source))
+
+    progress = IngestProgress(report_every)
+    if workers <= 0:
+        for fn, *args in tasks:
+            _collect(progress, fn, *args)
+        return progress
+
+    # Höchstens 4 Dateien pro Worker gleichzeitig unterwegs, damit der Speicherbedarf begrenzt bleibt
+    max_pending = 4 * workers
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = set()
+        for fn, *args in tasks:
+            pending.add(pool.submit(fn, *args))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    _collect(progress, future.result)
+        for future in pending:
+            _collect(progress, future.result)
+    return progress
+
+
+def _collect(progress: IngestProgress, fn, *args) -> None:
+    try:
+        n_bytes = fn(*args)
+    except (OSError, ValueError) as e:
+        progress.failed += 1
+        print(f"Import fehlgeschlagen: {e}")
+        return
+    progress.add(n_bytes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="ghcnd_all.tar.gz oder Verzeichnis mit .dly-Dateien")
+    parser.add_argument("--store", default=STATION_STORE_DIR or os.path.join("cache", "store"),
+                        help="Zielverzeichnis des Stationsspeichers")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Anzahl paralleler Prozesse (0 = im aktuellen Prozess)")
+    parser.add_argument("--report-every", type=int, default=1000)
+    args = parser.parse_args()
+
+    progress = ingest(args.source, args.store, args.workers, args.report_every)
+    print(f"Fertig: {progress.line()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,144 @@
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, Query, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from contextlib import asynccontextmanager
-from src import load_station_data, Station, get_station_data_from_ghcn
-from src import fetch_stations_query
+from src import Station, get_station_data_from_ghcn
+from src import fetch_stations_query, StationCatalog, get_stations_data_from_ghcn
+from src.get_stations_data import STATION_BATCH_MAX_STATIONS
+from src.query_cache import cached_stations_query, stations_query_cache
+from src.json_response import FastJSONResponse, dumps
+from src.get_region_data import REGION_MAX_STATIONS, WEIGHTINGS, get_region_data_from_ghcn, iter_region_data
+from src.derived_metrics import BASELINE_END, BASELINE_START, parse_metrics
+from src.station_aggregates import check_year_range
+from src.catalog_snapshot import read_catalog_snapshot, build_catalog_snapshot, refresh_catalog_snapshot
+from src.catalog_snapshot import CATALOG_REFRESH_INTERVAL, CATALOG_LAZY_LOAD, CATALOG_LOAD_WAIT
+from src.catalog_snapshot import CATALOG_RETRY_DELAY, CATALOG_RETRY_MAX
+from src.http_client import close_http_client
+from src.aggregate_pool import shutdown_aggregate_pool
+from src.metrics import PROFILE_HEADER, REQUEST_SECONDS, finish_profile, render_prometheus, start_profile
 from typing import List, Optional
+import asyncio
+import time
 
-ALL_STATIONS: list = []
+ALL_STATIONS: Optional[StationCatalog] = None
+# Fortschritt des Katalog-Ladens für /health und /ready
+CATALOG_STATUS = {"state": "loading", "source": None, "attempts": 0, "error": None,
+                  "started": time.time(), "loaded": None}
+_catalog_loaded: Optional[asyncio.Event] = None
+# Retry-After (Sekunden) für Anfragen, die auf den Katalog warten
+_CATALOG_RETRY_AFTER = 5
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global ALL_STATIONS
-    ALL_STATIONS = load_station_data()
+    global ALL_STATIONS, _catalog_loaded
+    _catalog_loaded = asyncio.Event()
+    CATALOG_STATUS.update(state="loading", source=None, attempts=0, error=None, started=time.time(), loaded=None)
+    catalog_task = None
+    snapshot = read_catalog_snapshot()
+    if snapshot is not None:
+        # Sofort aus dem lokalen Snapshot starten und im Hintergrund bei NOAA nachfragen
+        ALL_STATIONS, header = snapshot
+        mark_catalog_loaded("snapshot")
+        print(f"Stationskatalog aus Snapshot geladen: {len(ALL_STATIONS)} Stationen")
+        catalog_task = asyncio.create_task(refresh_station_catalog(header, delay=0))
+    elif CATALOG_LAZY_LOAD:
+        # Anfragen werden sofort angenommen; /stations-query wartet kurz bzw. antwortet mit 503
+        catalog_task = asyncio.create_task(load_station_catalog())
+    else:
+        ALL_STATIONS, header = await build_catalog_snapshot()
+        mark_catalog_loaded("noaa")
+        if CATALOG_REFRESH_INTERVAL > 0:
+            catalog_task = asyncio.create_task(refresh_station_catalog(header, delay=CATALOG_REFRESH_INTERVAL))
     yield
+    if catalog_task is not None:
+        catalog_task.cancel()
+    await close_http_client()
+    shutdown_aggregate_pool()
+
+def mark_catalog_loaded(source: str):
+    CATALOG_STATUS.update(state="ready", source=source, error=None, loaded=time.time())
+    if _catalog_loaded is not None:
+        _catalog_loaded.set()
+
+async def load_station_catalog(retry_delay: float = CATALOG_RETRY_DELAY, retry_max: float = CATALOG_RETRY_MAX):
+    """
+    Lädt den Katalog im Hintergrund von NOAA (build_catalog_snapshot). Schlägt der Download fehl,
+    läuft der Server ohne Katalog weiter und es wird nach 'retry_delay' Sekunden erneut versucht
+    (mit jeder Wiederholung doppelt so lange, höchstens 'retry_max'). Danach folgt die regelmäßige
+    Aktualisierung wie beim Start aus dem Snapshot.
+    """
+    global ALL_STATIONS
+    delay = retry_delay
+    while True:
+        CATALOG_STATUS["attempts"] += 1
+        try:
+            catalog, header = await build_catalog_snapshot()
+            break
+        except Exception as e:
+            CATALOG_STATUS.update(state="retrying", error=str(e) or type(e).__name__)
+            print(f"Laden des Stationskatalogs fehlgeschlagen, neuer Versuch in {delay:g} s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, retry_max)
+            CATALOG_STATUS["state"] = "loading"
+    ALL_STATIONS = catalog
+    mark_catalog_loaded("noaa")
+    print(f"Stationskatalog geladen: {len(ALL_STATIONS)} Stationen")
+    if CATALOG_REFRESH_INTERVAL > 0:
+        await refresh_station_catalog(header, delay=CATALOG_REFRESH_INTERVAL)
+
+def catalog_status() -> dict:
+    stations = ALL_STATIONS
+    status = dict(CATALOG_STATUS)
+    if stations is not None:
+        # Auch ein direkt gesetzter Katalog (z.B. in Tests) gilt als geladen
+        status["state"] = "ready"
+    status["stations"] = len(stations) if stations is not None else None
+    started, loaded = status.pop("started"), status.pop("loaded")
+    status["seconds"] = round((loaded if loaded is not None else time.time()) - started, 3)
+    return status
+
+async def require_catalog() -> StationCatalog:
+    """
+    Liefert den Stationskatalog; lädt er noch, wird bis zu CATALOG_LOAD_WAIT Sekunden gewartet und
+    danach mit 503 (und Retry-After) geantwortet.
+    """
+    stations = ALL_STATIONS
+    if stations is None and _catalog_loaded is not None and CATALOG_LOAD_WAIT > 0:
+        try:
+            await asyncio.wait_for(_catalog_loaded.wait(), CATALOG_LOAD_WAIT)
+        except asyncio.TimeoutError:
+            pass
+        stations = ALL_STATIONS
+    if stations is None:
+        raise HTTPException(status_code=503, headers={"Retry-After": str(_CATALOG_RETRY_AFTER)}, detail={
+            "error": "Service Unavailable",
+            "message": "Station catalog is still loading, please retry later",
+            "catalog": catalog_status(),
+        })
+    return stations
+
+async def refresh_station_catalog(header: dict, delay: float = 0, interval: float = CATALOG_REFRESH_INTERVAL):
+    """
+    Aktualisiert den Snapshot im Hintergrund (If-None-Match/If-Modified-Since), zuerst nach 'delay'
+    Sekunden und danach alle 'interval' Sekunden (0 = nur einmal).
+    Nur bei geändertem Inhalt wird der neue Katalog (inkl. räumlichem Index) vollständig in einem
+    Worker-Thread aufgebaut und erst dann ALL_STATIONS zugewiesen; sonst bleibt der bisherige Katalog
+    (und damit der Query-Cache) erhalten. Laufende Anfragen arbeiten mit ihrer Referenz auf den alten Stand weiter.
+    """
+    global ALL_STATIONS
+    await asyncio.sleep(delay)
+    while True:
+        try:
+            result = await refresh_catalog_snapshot(header)
+        except Exception as e:
+            print(f"Aktualisierung des Stationskatalogs fehlgeschlagen: {e}")
+            result = None
+        if result is not None:
+            ALL_STATIONS, header = result
+            print(f"Stationskatalog aktualisiert: {len(ALL_STATIONS)} Stationen")
+        if interval <= 0:
+            return
+        await asyncio.sleep(interval)
 
 app = FastAPI(lifespan=lifespan)
 
@@ -27,10 +154,38 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "Retry-After"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+
+    """
+    Misst die Dauer jeder Anfrage (climatelens_request_seconds, nach Route und Status).
+    Mit dem Header X-Profile (PROFILE_HEADER) enthält die Antwort zusätzlich einen
+    Server-Timing-Header mit der Aufschlüsselung nach Phasen (download, parse, query, serialize, ...).
+    """
+
+    token = start_profile() if PROFILE_HEADER in request.headers else None
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except Exception:
+        if token is not None:
+            finish_profile(token)
+        raise
+    elapsed = time.perf_counter() - started
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(elapsed, path=route.path if route is not None else "unmatched",
+                            status=response.status_code)
+    if token is not None:
+        timing = finish_profile(token)
+        total = f"total;dur={elapsed * 1000:.2f}"
+        response.headers["Server-Timing"] = f"{timing}, {total}" if timing else total
+    return response
+
 @app.get("/stations-query", response_model=List[Station])
-def fetch_stations_query_endpoint(
+async def fetch_stations_query_endpoint(
     latitude: float = Query(...),
     longitude: float = Query(...),
     radius: float = Query(...),
@@ -44,50 +199,230 @@ def fetch_stations_query_endpoint(
       GET /stations-query?latitude=52.52&longitude=13.405&radius=50&count=5&startYear=1980&endYear=2020
     """
 
-    filtered_stations = ALL_STATIONS
-    if startYear is not None or endYear is not None:
-        filtered = []
-        for st in ALL_STATIONS:
-            inv_start = st.get("inventory_start_year")
-            inv_end = st.get("inventory_end_year")
-            if startYear is not None:
-                if inv_start is None or inv_start > startYear:
-                    continue
-            if endYear is not None:
-                if inv_end is None or inv_end < endYear:
-                    continue
-            filtered.append(st)
-        filtered_stations = filtered
+    # Der Jahresfilter wird direkt in der räumlichen Suche angewendet.
+    # Die Antwort kommt bereits serialisiert aus dem Query-Cache (siehe query_cache.py);
+    # response_model bleibt für die OpenAPI-Dokumentation erhalten.
+    # Solange der Katalog noch lädt, wird kurz gewartet und sonst mit 503 geantwortet.
+    stations = await require_catalog()
+    body = await asyncio.to_thread(cached_stations_query, latitude, longitude, radius, count, stations,
+                                   startYear, endYear)
+    return Response(content=body, media_type="application/json")
+
+@app.get("/health")
+def fetch_health():
+
+    """
+    Lebenszeichen: antwortet immer mit 200, auch während der Katalog noch lädt (Fortschritt unter "catalog").
+    """
+
+    return {"status": "ok", "catalog": catalog_status()}
+
+@app.get("/ready")
+def fetch_ready():
+
+    """
+    Bereitschaft: 200, sobald der Stationskatalog geladen ist, vorher 503 mit dem Ladefortschritt
+    (state: loading/retrying, attempts, error, seconds).
+    Ohne Katalog beantwortet werden /health, /metrics, /cache/stats und /station/data mit latitude;
+    /stations-query, /stations/data, /region/data und /station/data ohne latitude warten kurz auf den
+    Katalog und antworten sonst mit 503.
+    """
+
+    status = catalog_status()
+    if status["state"] != "ready":
+        return FastJSONResponse({"status": "unavailable", "catalog": status}, status_code=503)
+    return {"status": "ready", "catalog": status}
+
+@app.get("/cache/stats")
+def fetch_cache_stats():
+
+    """
+    Treffer-/Fehlschlagzähler der Caches, z.B. zur Wahl von QUERY_CACHE_MAX_ENTRIES.
+    """
+
+    return {"stations_query": stations_query_cache.stats()}
+
+@app.get("/metrics")
+def fetch_metrics():
 
-    return fetch_stations_query(latitude, longitude, radius, count, filtered_stations)
+    """
+    Metriken im Prometheus-Textformat (Phasendauern, Downloadgrößen, Kandidatenzahlen, Cache-Zugriffe).
+    """
+
+    return Response(content=render_prometheus(), media_type="text/plain; version=0.0.4")
 
 @app.get("/station/data")
-def fetch_station_data(
+async def fetch_station_data(
     stationId: str = Query(...),
     startYear: Optional[str] = Query(None),
-    endYear: Optional[str] = Query(None)
+    endYear: Optional[str] = Query(None),
+    latitude: Optional[float] = Query(None),
+    metrics: Optional[str] = Query(None),
+    baselineStart: int = Query(BASELINE_START),
+    baselineEnd: int = Query(BASELINE_END)
 ):
 
     """
     GET-Endpoint:
     Beispiel:
       GET /station/data?stationId=USW00094846&startYear=2000&endYear=2020
+    Zusätzliche Kennzahlen (Monatsmittel, Anomalien, Trends; TMIN/TMAX/TAVG/PRCP):
+      GET /station/data?stationId=USW00094846&startYear=1950&endYear=2020&metrics=monthly,anomalies,trends
+          &baselineStart=1961&baselineEnd=1990
+    Mit latitude (Breitengrad der Station, z.B. aus /stations-query) antwortet der Endpoint auch,
+    solange der Stationskatalog noch lädt.
     """
 
-    # Ermittle anhand der ALL_STATIONS den Latitude-Wert der Station
-    latitude = None
-    for st in ALL_STATIONS:
-        if st["id"] == stationId:
-            latitude = st["latitude"]
-            break
+    try:
+        derived = parse_metrics(metrics)
+        check_year_range(baselineStart, baselineEnd, "baselineStart", "baselineEnd")
+        if latitude is not None and not -90 <= latitude <= 90:
+            raise ValueError("latitude must be between -90 and 90")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={
+            "error": "Bad Request",
+            "message": str(e),
+        })
 
-    data = get_station_data_from_ghcn(
+    # Ermittle anhand des station_id-Index von ALL_STATIONS den Latitude-Wert der Station
+    # (ohne sie wäre die Jahreszeiten-Zuordnung der Südhalbkugel falsch). Lädt der Katalog noch,
+    # genügt der übergebene latitude-Wert; fehlt auch dieser, wird kurz gewartet bzw. mit 503 geantwortet.
+    # Unbekannte IDs werden direkt abgewiesen, ohne den NOAA-Download anzustoßen.
+    stations = ALL_STATIONS
+    if stations is None and latitude is None:
+        stations = await require_catalog()
+    if stations is not None and len(stations) > 0:
+        row = stations.find(stationId)
+        if row is None:
+            raise HTTPException(status_code=404, detail={
+                "station_id": stationId,
+                "error": "Not Found",
+                "message": "Unknown station id",
+            })
+        latitude = float(stations.latitude[row])
+
+    data = await get_station_data_from_ghcn(
         station_id=stationId,
         start_year=startYear,
         end_year=endYear,
-        latitude=latitude
+        latitude=latitude,
+        metrics=derived,
+        baseline=(baselineStart, baselineEnd)
+    )
+    return FastJSONResponse(data)
+
+@app.get("/stations/data")
+async def fetch_stations_data(
+    stationIds: Optional[List[str]] = Query(None),
+    latitude: Optional[float] = Query(None),
+    longitude: Optional[float] = Query(None),
+    radius: Optional[float] = Query(None),
+    count: Optional[int] = Query(None),
+    startYear: int = Query(...),
+    endYear: int = Query(...)
+):
+
+    """
+    Sammel-Endpoint: Daten mehrerer Stationen in einer Antwort, gleichzeitig geladen.
+    Die Stationen werden entweder direkt per ID oder wie bei /stations-query per Umkreissuche gewählt.
+    startYear und endYear sind Pflicht, damit Umfang und Speicherbedarf pro Station begrenzt bleiben.
+    Beispiele:
+      GET /stations/data?stationIds=PLM00012375&stationIds=ZI000067775&startYear=2000&endYear=2010
+      GET /stations/data?latitude=52.52&longitude=13.405&radius=50&count=5&startYear=2000&endYear=2010
+    """
+
+    try:
+        check_year_range(startYear, endYear, "startYear", "endYear")
+        if len(stationIds or []) > STATION_BATCH_MAX_STATIONS:
+            raise ValueError(f"At most {STATION_BATCH_MAX_STATIONS} stations per request")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={
+            "error": "Bad Request",
+            "message": str(e),
+        })
+
+    errors = []
+    if stationIds:
+        # Wie bei /station/data wird der Katalog für die Hemisphären-Zuordnung benötigt
+        stations = await require_catalog()
+        selected = []
+        for station_id in stationIds:
+            if len(stations) == 0:
+                selected.append({"id": station_id})
+                continue
+            row = stations.find(station_id)
+            if row is None:
+                errors.append({"station_id": station_id, "error": "Not Found", "message": "Unknown station id"})
+                continue
+            station = stations.station(row)
+            selected.append({key: station[key] for key in ("id", "name", "latitude", "longitude")})
+    elif None not in (latitude, longitude, radius, count):
+        # Der Jahresfilter wird wie bei /stations-query direkt in der räumlichen Suche angewendet
+        stations = await require_catalog()
+        selected = fetch_stations_query(latitude, longitude, radius, count, stations, startYear, endYear)
+    else:
+        raise HTTPException(status_code=400, detail={
+            "error": "Bad Request",
+            "message": "Either stationIds or latitude, longitude, radius and count are required",
+        })
+
+    if len(selected) > STATION_BATCH_MAX_STATIONS:
+        raise HTTPException(status_code=400, detail={
+            "error": "Bad Request",
+            "message": f"At most {STATION_BATCH_MAX_STATIONS} stations per request",
+        })
+
+    data = await get_stations_data_from_ghcn(
+        selected,
+        start_year=str(startYear),
+        end_year=str(endYear)
     )
-    return data
+    data["errors"] = errors + data["errors"]
+    return FastJSONResponse(data)
+
+@app.get("/region/data")
+async def fetch_region_data(
+    latitude: float = Query(...),
+    longitude: float = Query(...),
+    radius: float = Query(...),
+    startYear: int = Query(...),
+    endYear: int = Query(...),
+    count: int = Query(REGION_MAX_STATIONS),
+    weighting: str = Query("none"),
+    power: float = Query(2.0),
+    stream: bool = Query(False)
+):
+
+    """
+    Regionalmittel: Jahres- und Jahreszeitenmittel (min/max) über alle Stationen im Umkreis,
+    ungewichtet oder invers distanzgewichtet (weighting=idw, Gewicht 1 / Distanz^power).
+    Mit stream=true wird NDJSON geliefert: Zwischenergebnisse, sobald weitere Stationen geladen sind,
+    und als letzte Zeile das Endergebnis ("type": "result").
+    Beispiel:
+      GET /region/data?latitude=52.52&longitude=13.405&radius=100&startYear=1980&endYear=2020&weighting=idw
+    """
+
+    try:
+        check_year_range(startYear, endYear, "startYear", "endYear")
+        if weighting not in WEIGHTINGS or not 0 < count <= REGION_MAX_STATIONS:
+            raise ValueError(f"weighting must be one of {', '.join(WEIGHTINGS)} and 0 < count <= {REGION_MAX_STATIONS}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={
+            "error": "Bad Request",
+            "message": str(e),
+        })
+
+    stations = await require_catalog()
+    selected = fetch_stations_query(latitude, longitude, radius, count, stations, startYear, endYear)
+    if not stream:
+        data = await get_region_data_from_ghcn(selected, startYear, endYear, weighting, power)
+        return FastJSONResponse(data)
+
+    async def lines():
+        async for part in iter_region_data(selected, startYear, endYear, weighting, power):
+            yield dumps(part) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 if __name__ == "__main__":
     import uvicorn
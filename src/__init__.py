@@ -1,5 +1,8 @@
 from .Station import Station
-from .load_station_data import load_station_data
+from .station_index import StationIndex
+from .station_catalog import StationCatalog
 from .get_stations_in_radius import get_stations_in_radius
 from .fetch_stations_query import fetch_stations_query
-from .get_station_data import get_station_data_from_ghcn
\ No newline at end of file
+from .get_station_data import get_station_data_from_ghcn
+from .get_stations_data import get_stations_data_from_ghcn
+from .get_region_data import get_region_data_from_ghcn
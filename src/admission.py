@@ -0,0 +1,119 @@
+import asyncio
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+from .metrics import ADMISSION_EVENTS, stage
+
+# Maximal gleichzeitige .dly-Downloads von NOAA (über alle Anfragen)
+UPSTREAM_MAX_CONCURRENT = int(os.environ.get("UPSTREAM_MAX_CONCURRENT", "8"))
+# Anzahl der Downloads, die auf einen freien Platz warten dürfen; weitere werden sofort abgewiesen (503)
+UPSTREAM_MAX_QUEUE = int(os.environ.get("UPSTREAM_MAX_QUEUE", "32"))
+# Maximale Wartezeit in der Warteschlange (Sekunden), danach ebenfalls 503
+UPSTREAM_QUEUE_TIMEOUT = float(os.environ.get("UPSTREAM_QUEUE_TIMEOUT", "10"))
+# Wert des Retry-After-Headers (Sekunden) bei Ablehnung
+UPSTREAM_RETRY_AFTER = int(os.environ.get("UPSTREAM_RETRY_AFTER", "5"))
+# Speicherbudget je Anfrage: so viele Bytes einer .dly-Datei werden höchstens auf einmal im
+# Arbeitsspeicher gehalten bzw. geparst; größere Dateien laufen über die Cache-Datei und blockweise
+DLY_MEMORY_BUDGET = int(os.environ.get("DLY_MEMORY_BUDGET", str(32 * 1024 * 1024)))
+
+
+class UpstreamOverloaded(Exception):
+    """
+    Die Warteschlange für NOAA-Downloads ist voll oder die Wartezeit ist abgelaufen.
+    """
+
+    def __init__(self, retry_after: int = UPSTREAM_RETRY_AFTER):
+        super().__init__(f"Zu viele gleichzeitige Downloads, erneut versuchen in {retry_after} s")
+        self.retry_after = retry_after
+
+
+class MemoryBudgetExceeded(Exception):
+    """
+    Eine Datei überschreitet das Speicherbudget und kann nicht über die Cache-Datei verarbeitet werden.
+    """
+
+
+class AdmissionLimiter:
+    """
+    Zulassungskontrolle für Upstream-Downloads:
+    - höchstens max_concurrent gleichzeitig,
+    - bis zu max_queue weitere warten (höchstens queue_timeout Sekunden),
+    - darüber hinaus wird sofort mit UpstreamOverloaded abgelehnt (→ 503 mit Retry-After).
+    So wachsen Speicherbedarf und Wartezeiten unter Last nicht unbegrenzt; Anfragen, die ohnehin
+    nicht rechtzeitig beantwortet werden könnten, scheitern schnell statt nach dem HTTP-Timeout.
+    Freie Plätze werden in Ankunftsreihenfolge vergeben. Nur innerhalb einer Event-Loop verwenden.
+    """
+
+    def __init__(self, max_concurrent: int = UPSTREAM_MAX_CONCURRENT, max_queue: int = UPSTREAM_MAX_QUEUE,
+                 queue_timeout: float = UPSTREAM_QUEUE_TIMEOUT, retry_after: int = UPSTREAM_RETRY_AFTER):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self._waiters: deque = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Belegt einen Platz für die Dauer des Kontexts. Der gelieferte Aufruf gibt ihn schon vorher frei
+        (z.B. für den Rest eines Downloads, auf den niemand mehr wartet); weitere Aufrufe sind wirkungslos.
+        """
+        await self.acquire()
+        held = True
+
+        def release():
+            nonlocal held
+            if held:
+                held = False
+                self.release()
+
+        try:
+            yield release
+        finally:
+            release()
+
+    async def acquire(self) -> None:
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            ADMISSION_EVENTS.inc(result="admitted")
+            return
+        if len(self._waiters) >= self.max_queue:
+            ADMISSION_EVENTS.inc(result="rejected")
+            raise UpstreamOverloaded(self.retry_after)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        ADMISSION_EVENTS.inc(result="queued")
+        try:
+            with stage("admission_wait"):
+                await asyncio.wait_for(waiter, self.queue_timeout if self.queue_timeout > 0 else None)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # Der Platz wurde bereits übergeben: bei Abbruch gleich wieder freigeben
+                self.release()
+                raise
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+            if isinstance(e, asyncio.TimeoutError):
+                ADMISSION_EVENTS.inc(result="timeout")
+                raise UpstreamOverloaded(self.retry_after) from None
+            raise
+
+    def release(self) -> None:
+        # Der Platz geht direkt an den nächsten Wartenden über (active bleibt unverändert)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+upstream_admission = AdmissionLimiter()
@@ -0,0 +1,50 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+# Anzahl der Prozesse für das Parsen/Aggregieren von .dly-Dateien.
+# 0 = im Worker-Thread des eigenen Prozesses (teilt sich den GIL mit der Event-Loop)
+AGGREGATE_WORKERS = int(os.environ.get("AGGREGATE_WORKERS", "0"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_aggregate_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Liefert den Prozesspool (wird beim ersten Aufruf gestartet) oder None, falls AGGREGATE_WORKERS = 0.
+    Die Worker werden per "spawn" gestartet, damit sie weder Threads noch die Event-Loop des
+    Elternprozesses erben.
+    """
+    global _pool
+    if AGGREGATE_WORKERS <= 0:
+        return None
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=AGGREGATE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+async def run_cpu_bound(fn, *args):
+    """
+    Führt 'fn(*args)' im Prozesspool aus, ohne Pool in einem Worker-Thread.
+    'fn' und die Argumente müssen picklebar sein; es sollten nur kompakte Ergebnisse
+    (z.B. Monatsaggregate statt Tageswerte) zurückgegeben werden.
+    Fällt ein Worker-Prozess aus, wird der Pool verworfen und die Aufgabe im Thread wiederholt.
+    """
+    pool = get_aggregate_pool()
+    if pool is not None:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+        except BrokenProcessPool as e:
+            print(f"Prozesspool für Aggregation ausgefallen, verwende Thread: {e}")
+            shutdown_aggregate_pool()
+    return await asyncio.to_thread(fn, *args)
+
+
+def shutdown_aggregate_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,283 @@
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+from typing import Optional
+import numpy as np
+import httpx
+from .http_client import get_http_client
+from .load_station_data import STATIONS_CSV_URL, parse_station_data
+from .load_station_inventory import INVENTORY_URL, parse_station_inventory
+from .metrics import DOWNLOAD_BYTES, record_count, stage
+from .station_catalog import StationCatalog
+from .station_index import StationIndex
+
+try:
+    import fcntl
+except ImportError:  # z.B. Windows: kein Datei-Locking, jeder Worker aktualisiert selbst
+    fcntl = None
+
+SNAPSHOT_PATH = os.environ.get("CATALOG_SNAPSHOT_PATH", os.path.join("cache", "station_catalog.bin"))
+# Abstand (Sekunden) zwischen zwei Abfragen bei NOAA, ob sich Stationsliste/Inventar geändert haben (0 = nur beim Start)
+CATALOG_REFRESH_INTERVAL = int(os.environ.get("CATALOG_REFRESH_INTERVAL", str(6 * 3600)))
+# Ohne Snapshot den Katalog im Hintergrund laden und sofort Anfragen annehmen (0 = Start blockiert bis zum Download)
+CATALOG_LAZY_LOAD = os.environ.get("CATALOG_LAZY_LOAD", "1") != "0"
+# So lange (Sekunden) wartet /stations-query auf einen noch ladenden Katalog, bevor mit 503 geantwortet wird
+CATALOG_LOAD_WAIT = float(os.environ.get("CATALOG_LOAD_WAIT", "2"))
+# Wartezeit (Sekunden) vor dem nächsten Ladeversuch nach einem Fehler; verdoppelt sich bis CATALOG_RETRY_MAX
+CATALOG_RETRY_DELAY = float(os.environ.get("CATALOG_RETRY_DELAY", "5"))
+CATALOG_RETRY_MAX = float(os.environ.get("CATALOG_RETRY_MAX", "300"))
+
+SNAPSHOT_MAGIC = b"CLCATLG\0"
+SNAPSHOT_FORMAT_VERSION = 3
+_ALIGNMENT = 64
+
+# Spalten des StationCatalog bzw. StationIndex, die im Snapshot abgelegt werden
+_CATALOG_COLUMNS = ["ids", "names", "latitude", "longitude", "start_year", "end_year", "id_order"]
+_INDEX_COLUMNS = ["order", "cell_start", "cell_min_start", "cell_max_end"]
+
+
+def write_catalog_snapshot(catalog: StationCatalog, meta: dict, path: str = SNAPSHOT_PATH) -> None:
+    """
+    Schreibt den Katalog als Binär-Snapshot:
+      [Magic (8 Byte)][Header-Länge (uint32)][JSON-Header][Spalten, je auf 64 Byte ausgerichtet]
+    Der Header enthält Formatversion, ETag/Last-Modified und SHA-1 der NOAA-Dateien sowie
+    dtype/shape/offset jeder Spalte. Die Datei wird zuerst unter einem temporären Namen
+    geschrieben und dann atomar ersetzt, damit Leser nie eine halbe Datei sehen.
+    """
+    arrays = {name: getattr(catalog, name) for name in _CATALOG_COLUMNS}
+    arrays.update({name: getattr(catalog.index, name) for name in _INDEX_COLUMNS})
+
+    columns = {}
+    offset = 0
+    for name, arr in arrays.items():
+        offset = _align(offset)
+        columns[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        offset += arr.nbytes
+
+    header = dict(meta)
+    header.update({
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "created": time.time(),
+        "cell_size": catalog.index.cell_size,
+        "columns": columns,
+    })
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = _align(len(SNAPSHOT_MAGIC) + 4 + len(header_bytes))
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        for name, arr in arrays.items():
+            f.seek(data_start + columns[name]["offset"])
+            f.write(np.ascontiguousarray(arr).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_catalog_snapshot(path: str = SNAPSHOT_PATH) -> Optional[tuple[StationCatalog, dict]]:
+    """
+    Lädt einen Snapshot per mmap. Die Spalten sind schreibgeschützte Sichten auf die
+    gemappte Datei, d.h. alle uvicorn-Worker teilen sich dieselben Seiten im Page-Cache.
+    Rückgabe: (catalog, header) oder None, falls kein gültiger Snapshot vorliegt.
+    """
+    try:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    header = _read_header(mm)
+    if header is None:
+        mm.close()
+        return None
+
+    data_start = _align(len(SNAPSHOT_MAGIC) + 4 + header["header_length"])
+    arrays = {}
+    try:
+        for name, col in header["columns"].items():
+            dtype = np.dtype(col["dtype"])
+            count = int(np.prod(col["shape"]))
+            arrays[name] = np.frombuffer(mm, dtype=dtype, count=count, offset=data_start + col["offset"])
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"Katalog-Snapshot {path} ist beschädigt: {e}")
+        return None
+
+    index = StationIndex.from_arrays(*(arrays[name] for name in _INDEX_COLUMNS), header["cell_size"])
+    catalog = StationCatalog(*(arrays[name] for name in _CATALOG_COLUMNS[:-1]), index=index,
+                             id_order=arrays["id_order"])
+    return catalog, header
+
+
+def read_snapshot_header(path: str = SNAPSHOT_PATH) -> Optional[dict]:
+    """
+    Liest nur den Header eines Snapshots (z.B. um zu prüfen, ob ein anderer Worker ihn erneuert hat).
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(len(SNAPSHOT_MAGIC) + 4)
+            if len(head) < len(SNAPSHOT_MAGIC) + 4:
+                return None
+            (length,) = struct.unpack("<I", head[len(SNAPSHOT_MAGIC):])
+            return _read_header(head + f.read(length))
+    except OSError:
+        return None
+
+
+async def build_catalog_snapshot(path: str = SNAPSHOT_PATH) -> tuple[StationCatalog, dict]:
+    """
+    Lädt Stationsliste und Inventar vollständig (und gleichzeitig) von NOAA, baut den Katalog
+    und schreibt den Snapshot. Parsen und Schreiben laufen in einem Worker-Thread.
+    """
+    print("Starte Download der Stationsliste...")
+    print("Downloading station inventory...")
+    stations_resp, inventory_resp = await asyncio.gather(
+        _conditional_get(STATIONS_CSV_URL, None),
+        _conditional_get(INVENTORY_URL, None),
+        return_exceptions=True,
+    )
+    if isinstance(stations_resp, BaseException):
+        raise stations_resp
+    if isinstance(inventory_resp, BaseException):
+        if not isinstance(inventory_resp, httpx.HTTPError):
+            raise inventory_resp
+        # Ohne Inventar wird trotzdem gestartet (Stationen ohne Jahresangaben)
+        print(f"Error downloading inventory: {inventory_resp}")
+        inventory_resp = None
+    return await asyncio.to_thread(_build_from_responses, stations_resp, inventory_resp, path)
+
+
+async def refresh_catalog_snapshot(current: dict, path: str = SNAPSHOT_PATH) -> Optional[tuple[StationCatalog, dict]]:
+    """
+    Prüft per If-None-Match/If-Modified-Since, ob sich ghcnd-stations.csv oder ghcnd-inventory.txt
+    gegenüber dem Snapshot-Header 'current' geändert haben.
+    - Hat inzwischen ein anderer Worker einen neueren Snapshot geschrieben, wird dieser geladen.
+    - Liefert NOAA für beide Dateien 304 oder denselben Inhalt (SHA-1 wie im Header), bleibt alles
+      unverändert (Rückgabe None); es wird nichts geparst.
+    - Andernfalls wird neu geparst, der Snapshot ersetzt und (catalog, header) zurückgegeben.
+    Nur ein Worker gleichzeitig führt die Aktualisierung durch (Datei-Lock neben dem Snapshot).
+    """
+    async with _snapshot_lock(path):
+        on_disk = read_snapshot_header(path)
+        if on_disk is not None and on_disk.get("created", 0) > current.get("created", 0):
+            return await asyncio.to_thread(read_catalog_snapshot, path)
+
+        stations_resp, inventory_resp = await asyncio.gather(
+            _conditional_get(STATIONS_CSV_URL, current.get("stations")),
+            _conditional_get(INVENTORY_URL, current.get("inventory")),
+        )
+        if stations_resp.status_code == 304 and inventory_resp.status_code == 304:
+            print("Stationskatalog ist aktuell (304 Not Modified).")
+            return None
+        if _unchanged(stations_resp, current.get("stations")) and _unchanged(inventory_resp, current.get("inventory")):
+            print("Stationskatalog ist aktuell (Inhalt unverändert).")
+            return None
+
+        # Für den zusammengeführten Katalog werden beide Dateien vollständig benötigt
+        if stations_resp.status_code == 304:
+            stations_resp = await _conditional_get(STATIONS_CSV_URL, None)
+        if inventory_resp.status_code == 304:
+            inventory_resp = await _conditional_get(INVENTORY_URL, None)
+        return await asyncio.to_thread(_build_from_responses, stations_resp, inventory_resp, path)
+
+
+def _build_from_responses(stations_resp: httpx.Response, inventory_resp: Optional[httpx.Response],
+                          path: str) -> tuple[StationCatalog, dict]:
+    with stage("catalog_parse"):
+        inventory = parse_station_inventory(inventory_resp.text.splitlines()) if inventory_resp is not None else {}
+        catalog = parse_station_data(stations_resp.text.splitlines(), inventory)
+    meta = {
+        "stations": _validators(stations_resp),
+        "inventory": _validators(inventory_resp) if inventory_resp is not None else {},
+    }
+    try:
+        write_catalog_snapshot(catalog, meta, path)
+    except OSError as e:
+        print(f"Katalog-Snapshot konnte nicht geschrieben werden: {e}")
+        return catalog, meta
+    print(f"Katalog-Snapshot geschrieben: {path} ({len(catalog)} Stationen)")
+    # Den frisch geschriebenen Snapshot gemappt verwenden, damit auch dieser Worker den Page-Cache teilt
+    return read_catalog_snapshot(path) or (catalog, meta)
+
+
+async def _conditional_get(url: str, validators: Optional[dict]) -> httpx.Response:
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    with stage("catalog_download"):
+        r = await get_http_client().get(url, headers=headers)
+    if r.status_code != 304:
+        r.raise_for_status()
+        record_count(DOWNLOAD_BYTES, "catalog_bytes", len(r.content), source="catalog")
+    return r
+
+
+def _validators(r: httpx.Response) -> dict:
+    return {"etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified"),
+            "sha1": hashlib.sha1(r.content).hexdigest()}
+
+
+def _unchanged(r: httpx.Response, validators: Optional[dict]) -> bool:
+    # Manche Server liefern trotz gleichem Inhalt 200 (z.B. ohne ETag); dann entscheidet die Prüfsumme
+    return r.status_code == 304 or (validators or {}).get("sha1") == hashlib.sha1(r.content).hexdigest()
+
+
+def _read_header(buf) -> Optional[dict]:
+    prefix = len(SNAPSHOT_MAGIC) + 4
+    if len(buf) < prefix or bytes(buf[:len(SNAPSHOT_MAGIC)]) != SNAPSHOT_MAGIC:
+        return None
+    (length,) = struct.unpack("<I", bytes(buf[len(SNAPSHOT_MAGIC):prefix]))
+    try:
+        header = json.loads(bytes(buf[prefix:prefix + length]))
+    except ValueError:
+        return None
+    if header.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        return None
+    header["header_length"] = length
+    return header
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+class _snapshot_lock:
+    """
+    Exklusiver Datei-Lock (fcntl.flock) neben dem Snapshot, damit nicht mehrere Worker
+    gleichzeitig bei NOAA nachfragen und den Snapshot schreiben.
+    Mit "async with" wird der (blockierende) Lock in einem Worker-Thread angefordert.
+    """
+
+    def __init__(self, path: str):
+        self.lock_path = f"{path}.lock"
+        self.fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+            self.fd = open(self.lock_path, "a")
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            self.fd.close()
+            self.fd = None
+        return False
+
+    async def __aenter__(self):
+        return await asyncio.to_thread(self.__enter__)
+
+    async def __aexit__(self, *exc):
+        return self.__exit__(*exc)
@@ -0,0 +1,159 @@
+import os
+from typing import Optional
+import numpy as np
+from .station_aggregates import ELEMENTS, SEASONS, MonthlyAggregates
+
+# Auswählbare Kennzahlen für /station/data?metrics=...
+DERIVED_METRICS = ("monthly", "anomalies", "trends")
+# Standard-Referenzzeitraum für Anomalien (WMO-Klimanormalperiode)
+BASELINE_START = int(os.environ.get("BASELINE_START", "1961"))
+BASELINE_END = int(os.environ.get("BASELINE_END", "1990"))
+# Mindestanzahl an Jahren mit Daten für einen Trend
+TREND_MIN_YEARS = 5
+
+_PERIODS = ("annual",) + SEASONS
+# Temperaturen (Zehntel °C) und Niederschlag (Zehntel mm) werden in °C bzw. mm/Tag ausgegeben
+_SCALE = 10.0
+
+
+def parse_metrics(value: Optional[str]) -> tuple:
+    """
+    Zerlegt den Parameter metrics ("monthly,anomalies,trends") und prüft die Namen.
+    Unbekannte Namen führen zu einem ValueError.
+    """
+    if not value:
+        return ()
+    names = tuple(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+    unknown = [name for name in names if name not in DERIVED_METRICS]
+    if unknown:
+        raise ValueError(f"Unknown metrics: {', '.join(unknown)} (available: {', '.join(DERIVED_METRICS)})")
+    return names
+
+
+def derived_metrics(aggregates: MonthlyAggregates, start_year: int, end_year: int, latitude: Optional[float],
+                    metrics: tuple, baseline: tuple = (BASELINE_START, BASELINE_END)) -> dict:
+    """
+    Berechnet die gewünschten Kennzahlen aus den Monatsaggregaten einer Station für alle
+    Elemente (TMIN, TMAX, TAVG, PRCP) gemeinsam als Array-Operationen:
+      monthly:   Monatsmittel je Jahr
+      anomalies: Abweichung der Monats-, Jahres- und Jahreszeitenmittel vom Mittel des
+                 Referenzzeitraums 'baseline' (start, end)
+      trends:    lineare Trends der Jahres- und Jahreszeitenmittel je Jahrzehnt
+    Alle Werte sind Mittel der Tageswerte: °C für Temperaturen, mm/Tag für PRCP. Fehlt TAVG,
+    wird es aus (TMIN + TMAX) / 2 gebildet. Der Zeitraum wird auf die vorhandenen Jahre begrenzt.
+    """
+    result = {}
+    if len(aggregates.sums) == 0:
+        return {name: [] if name != "trends" else {} for name in metrics}
+    start_year = max(start_year, aggregates.first_year)
+    end_year = min(end_year, aggregates.first_year + len(aggregates.sums) - 1)
+    if start_year > end_year:
+        return {name: [] if name != "trends" else {} for name in metrics}
+    years = list(range(start_year, end_year + 1))
+
+    monthly = _monthly_means(aggregates, start_year, end_year)
+    if "monthly" in metrics:
+        result["monthly"] = [{"year": year, **_by_element(monthly[i].T)} for i, year in enumerate(years)]
+
+    if "anomalies" in metrics or "trends" in metrics:
+        periods = _period_means(aggregates, start_year, end_year, latitude)
+
+    if "anomalies" in metrics:
+        first, last = baseline
+        reference_monthly = _nanmean(_monthly_means(aggregates, first, last), axis=0)
+        reference_periods = _period_means(aggregates, first, last, latitude)
+        anomalies_monthly = monthly - reference_monthly
+        anomalies = {key: periods[key] - _nanmean(reference_periods[key], axis=0) for key in _PERIODS}
+        result["baseline"] = {"start": first, "end": last}
+        result["anomalies"] = [
+            {"year": year, **{key: _by_element(anomalies[key][i]) for key in _PERIODS},
+             "monthly": _by_element(anomalies_monthly[i].T)}
+            for i, year in enumerate(years)
+        ]
+
+    if "trends" in metrics:
+        result["trends"] = {key: _trends(np.array(years, dtype=np.float64), periods[key]) for key in _PERIODS}
+    return result
+
+
+def _monthly_means(aggregates: MonthlyAggregates, first: int, last: int) -> np.ndarray:
+    """
+    Monatsmittel [Jahr, Monat, Element] in ELEMENTS-Reihenfolge; NaN ohne Daten.
+    """
+    if first > last:
+        return np.full((0, 12, len(ELEMENTS)), np.nan)
+    sums = aggregates._block(aggregates.sums, first, last)
+    counts = aggregates._block(aggregates.counts, first, last)
+    return _with_tavg(_divide(sums, counts))
+
+
+def _period_means(aggregates: MonthlyAggregates, first: int, last: int, latitude: Optional[float]) -> dict:
+    """
+    Jahres- und Jahreszeitenmittel je Periode als [Jahr, Element] (siehe season_totals).
+    """
+    if first > last:
+        return {key: np.full((0, len(ELEMENTS)), np.nan) for key in _PERIODS}
+    sums = aggregates.season_totals(aggregates.sums, first, last, latitude)
+    counts = aggregates.season_totals(aggregates.counts, first, last, latitude)
+    return {key: _with_tavg(_divide(sums[key], counts[key])) for key in _PERIODS}
+
+
+def _divide(sums: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(counts > 0, sums / (_SCALE * counts), np.nan)
+
+
+def _with_tavg(means: np.ndarray) -> np.ndarray:
+    """
+    Ergänzt fehlende TAVG-Werte durch den Mittelwert aus TMIN und TMAX (letzte Achse = Element).
+    """
+    tavg = ELEMENTS.index("TAVG")
+    fallback = (means[..., ELEMENTS.index("TMIN")] + means[..., ELEMENTS.index("TMAX")]) / 2
+    means[..., tavg] = np.where(np.isnan(means[..., tavg]), fallback, means[..., tavg])
+    return means
+
+
+def _nanmean(values: np.ndarray, axis: int) -> np.ndarray:
+    """
+    Mittel ohne NaN; ohne Werte NaN (statt einer RuntimeWarning wie bei np.nanmean).
+    """
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=axis)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(count > 0, np.where(valid, values, 0).sum(axis=axis) / count, np.nan)
+
+
+def _trends(years: np.ndarray, values: np.ndarray) -> dict:
+    """
+    Steigung der Regressionsgeraden je Element (Einheit pro Jahrzehnt) über alle Jahre mit Daten,
+    für alle Elemente gleichzeitig; mit weniger als TREND_MIN_YEARS Jahren None.
+    """
+    valid = ~np.isnan(values)
+    n = valid.sum(axis=0)
+    x = np.where(valid, years[:, None], 0.0)
+    y = np.where(valid, values, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_mean = x.sum(axis=0) / n
+        y_mean = y.sum(axis=0) / n
+        dx = np.where(valid, years[:, None] - x_mean, 0.0)
+        slope = (dx * (y - y_mean)).sum(axis=0) / (dx * dx).sum(axis=0) * 10
+    slope = np.where(n >= TREND_MIN_YEARS, slope, np.nan)
+    return {element: {"per_decade": _round(slope[e], 3), "years": int(n[e])} for e, element in enumerate(ELEMENTS)}
+
+
+def _by_element(values: np.ndarray) -> dict:
+    """
+    values: Array mit Elementen auf der ersten Achse → {"TMIN": ..., "TMAX": ..., ...}
+    """
+    rounded = np.round(values, 2)
+    return {element: _none_for_nan(rounded[e].tolist()) for e, element in enumerate(ELEMENTS)}
+
+
+def _none_for_nan(value):
+    if isinstance(value, list):
+        return [None if v != v else v for v in value]
+    return None if value != value else value
+
+
+def _round(value: float, digits: int) -> Optional[float]:
+    return None if value != value else round(float(value), digits)
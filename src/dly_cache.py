@@ -0,0 +1,445 @@
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Optional
+import httpx
+from .admission import DLY_MEMORY_BUDGET, AdmissionLimiter, MemoryBudgetExceeded, UpstreamOverloaded
+from .admission import upstream_admission
+from .http_client import get_http_client
+from .metrics import DOWNLOAD_BYTES, cache_event, record_count, stage
+
+GHCN_DAILY_BASE_URL = os.environ.get("GHCN_DAILY_BASE_URL", "https://www1.ncdc.noaa.gov/pub/data/ghcn/daily/all")
+DLY_CACHE_DIR = os.environ.get("DLY_CACHE_DIR", os.path.join("cache", "dly"))
+DLY_CACHE_MAX_BYTES = int(os.environ.get("DLY_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Nach Ablauf dieser Zeit (Sekunden) wird ein Eintrag per ETag/Last-Modified bei NOAA revalidiert
+DLY_CACHE_MAX_AGE = int(os.environ.get("DLY_CACHE_MAX_AGE", str(24 * 3600)))
+# Blockgröße beim schrittweisen Lesen einer .dly-Datei (siehe DlyCache.stream)
+DLY_STREAM_CHUNK_BYTES = int(os.environ.get("DLY_STREAM_CHUNK_BYTES", str(256 * 1024)))
+
+# GHCN-Stations-IDs bestehen aus Buchstaben und Ziffern; alles andere wird nicht als Dateiname verwendet
+_STATION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+
+class DlyCache:
+    """
+    Größenbegrenzter Datei-Cache für die rohen GHCN-.dly-Dateien.
+    - Pro Station: <station_id>.dly (Rohdaten) und <station_id>.json (ETag, Last-Modified, Prüfzeitpunkt)
+    - Einträge, die älter als max_age sind, werden per If-None-Match/If-Modified-Since revalidiert
+    - Überschreitet der Cache max_bytes, werden die am längsten nicht genutzten Dateien gelöscht (LRU
+      anhand der Zugriffszeit, die bei jedem Treffer gesetzt wird)
+    - Gleichzeitige Anfragen für dieselbe Station warten auf einen gemeinsamen Download (auch beim
+      schrittweisen Download über stream())
+    - Downloads benötigen einen Platz der Zulassungskontrolle (siehe admission.py); der Inhalt
+      wird nur bis memory_budget Bytes im Arbeitsspeicher gehalten, größere Dateien nur in die Cache-Datei geschrieben
+    Downloads laufen über den gemeinsamen asynchronen UpstreamClient; Dateizugriffe
+    werden in Threads ausgelagert, damit die Event-Loop nicht blockiert.
+    """
+
+    def __init__(self, directory: str = DLY_CACHE_DIR, base_url: str = GHCN_DAILY_BASE_URL,
+                 max_bytes: int = DLY_CACHE_MAX_BYTES, max_age: int = DLY_CACHE_MAX_AGE,
+                 chunk_size: int = DLY_STREAM_CHUNK_BYTES, admission: Optional[AdmissionLimiter] = None,
+                 memory_budget: int = DLY_MEMORY_BUDGET):
+        self.directory = directory
+        self.base_url = base_url.rstrip("/")
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.chunk_size = chunk_size
+        self.admission = admission or upstream_admission
+        self.memory_budget = memory_budget
+
+        self._inflight: dict[str, asyncio.Future] = {}
+        # consumer der Downloads über stream(), je Station (Teilmenge von _inflight)
+        self._streams: dict[str, object] = {}
+        self._size_guard = threading.Lock()
+        self._total_bytes: Optional[int] = None
+
+    def url_for(self, station_id: str) -> str:
+        return f"{self.base_url}/{station_id}.dly"
+
+    async def fetch(self, station_id: str) -> bytes:
+        """
+        Liefert den Inhalt der .dly-Datei aus dem Cache oder lädt ihn (bedingt) neu.
+        Fehler beim Download werden als httpx.HTTPError weitergegeben; ist bereits
+        eine ältere Kopie vorhanden, wird diese bei Netzwerkfehlern weiterverwendet.
+        Ist die Zulassungskontrolle ausgelastet, folgt UpstreamOverloaded.
+        Ungültige Stations-IDs führen zu einem ValueError.
+        """
+        meta, payload = await self._single_flight(self._checked(station_id))
+        if payload is None:
+            payload = await asyncio.to_thread(self._read_hit, self._paths(station_id)[0])
+        return payload
+
+    async def ensure(self, station_id: str) -> dict:
+        """
+        Wie fetch, liefert aber nur die Metadaten des (ggf. aktualisierten) Eintrags.
+        meta["revision"] (SHA-1 des Inhalts) ändert sich genau dann, wenn sich die Datei ändert;
+        darüber können abgeleitete Daten (z.B. Monatsaggregate) ohne erneutes Lesen validiert werden.
+        """
+        meta, payload = await self._single_flight(self._checked(station_id))
+        if payload is None:
+            self._touch(self._paths(station_id)[0])
+        elif meta.get("stored") is False:
+            # Ohne Cache-Datei kann der Inhalt nicht später gelesen werden
+            meta = dict(meta, payload=payload)
+        return meta
+
+    def has_entry(self, station_id: str) -> bool:
+        """
+        True, wenn für die Station bereits eine Datei im Cache liegt oder gerade geladen wird.
+        """
+        data_path, meta_path = self._paths(self._checked(station_id))
+        return station_id in self._inflight or (os.path.exists(meta_path) and os.path.exists(data_path))
+
+    def streaming(self, station_id: str) -> bool:
+        """
+        True, wenn für die Station gerade ein Download über stream() läuft.
+        """
+        return station_id in self._streams
+
+    def stream(self, station_id: str, consumer_factory) -> tuple[asyncio.Future, Optional[object]]:
+        """
+        Lädt die .dly-Datei schrittweise (ohne Revalidierung, d.h. für Stationen ohne Cache-Eintrag).
+        consumer_factory() liefert ein Objekt, dessen consume(download, release_slot) die Blöcke des
+        DlyDownload liest (sie werden parallel in eine temporäre Datei geschrieben), die vollständig
+        gelesene Datei per commit() in den Cache übernimmt und deren Metadaten zurückgibt.
+        Der Download läuft wie bei ensure() als gemeinsamer Task je Station und auch dann zu Ende,
+        wenn kein Aufrufer mehr wartet; mit release_slot() gibt der consumer dann den Platz der
+        Zulassungskontrolle vorzeitig frei. Rückgabe: (task, consumer); läuft für die Station bereits
+        ein Download, werden dessen Task und consumer geliefert (None bei einem Download über ensure()).
+        """
+        station_id = self._checked(station_id)
+        task = self._inflight.get(station_id)
+        if task is not None:
+            return task, self._streams.get(station_id)
+        consumer = consumer_factory()
+        self._streams[station_id] = consumer
+        return self._flight(station_id, lambda: self._stream(station_id, consumer)), consumer
+
+    def read(self, station_id: str) -> bytes:
+        """
+        Liest einen zuvor per ensure() bereitgestellten Eintrag (blockierend, für Worker-Threads).
+        """
+        return self._read_hit(self._paths(self._checked(station_id))[0])
+
+    def data_path(self, station_id: str) -> str:
+        """
+        Pfad der .dly-Datei eines per ensure() bereitgestellten Eintrags (z.B. für Worker-Prozesse).
+        """
+        return self._paths(self._checked(station_id))[0]
+
+    def sidecar_path(self, station_id: str, suffix: str) -> str:
+        """
+        Pfad für abgeleitete Dateien einer Station; sie werden zusammen mit dem Eintrag verdrängt.
+        """
+        return os.path.join(self.directory, f"{self._checked(station_id)}{suffix}")
+
+    async def _single_flight(self, station_id: str) -> tuple[dict, Optional[bytes]]:
+        """
+        Führt _ensure je Station nur einmal gleichzeitig aus; weitere Aufrufer warten auf dasselbe Ergebnis.
+        Der Download läuft als eigener Task weiter, auch wenn der auslösende Request abgebrochen wird.
+        """
+        return await asyncio.shield(self._flight(station_id, lambda: self._ensure(station_id)))
+
+    def _flight(self, station_id: str, factory) -> asyncio.Future:
+        """
+        Laufender Download der Station oder ein neuer Task aus factory(); höchstens einer je Station.
+        """
+        task = self._inflight.get(station_id)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[station_id] = task
+            task.add_done_callback(lambda t: self._finish(station_id, t))
+        return task
+
+    def _finish(self, station_id: str, task: asyncio.Future) -> None:
+        if self._inflight.get(station_id) is task:
+            del self._inflight[station_id]
+            self._streams.pop(station_id, None)
+        if not task.cancelled():
+            task.exception()  # als abgerufen markieren, falls kein Aufrufer mehr wartet
+
+    async def _ensure(self, station_id: str) -> tuple[dict, Optional[bytes]]:
+        data_path, meta_path = self._paths(station_id)
+        meta = self._read_meta(meta_path)
+        if meta is not None and os.path.exists(data_path):
+            if time.time() - meta.get("checked", 0) < self.max_age:
+                cache_event("dly", "hit")
+                return meta, None
+            return await self._revalidate(station_id, data_path, meta_path, meta)
+        return await self._download(station_id, data_path, meta_path, None)
+
+    async def _revalidate(self, station_id: str, data_path: str, meta_path: str, meta: dict) -> tuple[dict, Optional[bytes]]:
+        try:
+            return await self._download(station_id, data_path, meta_path, meta)
+        except httpx.HTTPStatusError:
+            raise
+        except (httpx.HTTPError, UpstreamOverloaded) as e:
+            print(f"Revalidierung von {station_id} fehlgeschlagen, verwende Cache: {e}")
+            cache_event("dly", "stale")
+            return meta, None
+
+    async def _stream(self, station_id: str, consumer) -> tuple[dict, Optional[bytes]]:
+        async with self.admission.slot() as release_slot, get_http_client().stream(self.url_for(station_id)) as r:
+            if r.status_code == 404:
+                self._remove(station_id)
+            r.raise_for_status()
+            cache_event("dly", "miss")
+            download = DlyDownload(self, station_id, r)
+            try:
+                meta = await consumer.consume(download, release_slot)
+            finally:
+                download.timer.finish()
+                record_count(DOWNLOAD_BYTES, "download_bytes", download.size, source="dly")
+                await asyncio.to_thread(download.discard)
+        return meta, None
+
+    async def _download(self, station_id: str, data_path: str, meta_path: str, meta: Optional[dict]) -> tuple[dict, Optional[bytes]]:
+        headers = {}
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        async with self.admission.slot(), get_http_client().stream(self.url_for(station_id), headers=headers) as r:
+            if r.status_code == 304 and meta is not None:
+                cache_event("dly", "revalidated")
+                meta["checked"] = time.time()
+                self._write_meta(meta_path, meta)
+                return meta, None
+            if r.status_code == 404:
+                self._remove(station_id)
+            r.raise_for_status()
+
+            cache_event("dly", "miss")
+            download = DlyDownload(self, station_id, r)
+            try:
+                payload = await download.read_all(self.memory_budget)
+                meta = await asyncio.to_thread(download.commit)
+            finally:
+                download.timer.finish()
+                record_count(DOWNLOAD_BYTES, "download_bytes", download.size, source="dly")
+                await asyncio.to_thread(download.discard)
+
+        if payload is None and not meta["stored"]:
+            raise MemoryBudgetExceeded(f"{station_id}.dly ({download.size} Bytes) überschreitet das Speicherbudget "
+                                       f"({self.memory_budget} Bytes) und konnte nicht im Cache abgelegt werden")
+        return meta, payload
+
+    def _read_hit(self, data_path: str) -> bytes:
+        with open(data_path, "rb") as f:
+            payload = f.read()
+        self._touch(data_path)
+        return payload
+
+    @staticmethod
+    def _touch(data_path: str) -> None:
+        # Zugriffszeit explizit setzen (noatime-Mounts), sie bestimmt die LRU-Reihenfolge
+        try:
+            os.utime(data_path, (time.time(), os.path.getmtime(data_path)))
+        except OSError:
+            pass
+
+    def _account(self, delta: int) -> None:
+        with self._size_guard:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._entries())
+            else:
+                self._total_bytes += delta
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """
+        Löscht die am längsten nicht genutzten Einträge, bis der Cache wieder unter max_bytes liegt.
+        """
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for station_id, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(station_id)
+            total -= size
+        self._total_bytes = total
+
+    def _entries(self) -> list:
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith(".dly"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((name[:-4], st.st_size, st.st_atime))
+        return entries
+
+    def _paths(self, station_id: str) -> tuple[str, str]:
+        base = os.path.join(self.directory, station_id)
+        return f"{base}.dly", f"{base}.json"
+
+    @staticmethod
+    def _checked(station_id: str) -> str:
+        if not _STATION_ID_PATTERN.match(station_id):
+            raise ValueError(f"Ungültige Stations-ID: {station_id!r}")
+        return station_id
+
+    @staticmethod
+    def _read_meta(meta_path: str) -> Optional[dict]:
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_meta(meta_path: str, meta: dict) -> None:
+        try:
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+        except OSError as e:
+            print(f"Schreiben der Cache-Metadaten fehlgeschlagen: {e}")
+
+    def _remove(self, station_id: str) -> None:
+        """
+        Entfernt den Eintrag einer Station inkl. aller Zusatzdateien (<station_id>.*).
+        """
+        for path in glob.glob(os.path.join(glob.escape(self.directory), f"{station_id}.*")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class DlyDownload:
+    """
+    Eine laufende .dly-Übertragung (siehe DlyCache.stream).
+    feed() schreibt jeden empfangenen Block in die temporäre Cache-Datei, aktualisiert die
+    Prüfsumme und gibt die darin abgeschlossenen Zeilen zurück; eine angefangene Zeile wird
+    bis zum nächsten Block gepuffert. Der Speicherbedarf hängt so nur von der Blockgröße ab.
+    feed(), finish(), commit() und discard() blockieren und sind für Worker-Threads gedacht.
+    """
+
+    def __init__(self, cache: DlyCache, station_id: str, response: httpx.Response):
+        self.cache = cache
+        self.station_id = station_id
+        self.response = response
+        self.size = 0
+        self.complete = False
+        # Wartezeit auf Daten von NOAA, über alle Blöcke summiert
+        self.timer = stage("download", accumulate=True)
+        self._sha1 = hashlib.sha1()
+        self._rest = b""
+        self._tmp = None
+        self._tmp_path: Optional[str] = None
+        try:
+            os.makedirs(cache.directory, exist_ok=True)
+            fd, self._tmp_path = tempfile.mkstemp(prefix=f".{station_id}-", suffix=".tmp", dir=cache.directory)
+            self._tmp = os.fdopen(fd, "wb")
+        except OSError as e:
+            print(f"Schreiben in den .dly-Cache fehlgeschlagen: {e}")
+
+    async def chunks(self):
+        iterator = self.response.aiter_bytes(self.cache.chunk_size)
+        while True:
+            with self.timer:
+                chunk = await anext(iterator, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    async def read_all(self, budget: int) -> Optional[bytes]:
+        """
+        Liest die Übertragung vollständig in die temporäre Datei und liefert den Inhalt, solange er
+        höchstens 'budget' Bytes umfasst; bei größeren Dateien None (Inhalt nur in der Datei).
+        """
+        parts = []
+        async for chunk in self.chunks():
+            await asyncio.to_thread(self._append, chunk)
+            if parts is not None:
+                parts.append(chunk)
+                if self.size > budget:
+                    parts = None
+        self.complete = True
+        return b"".join(parts) if parts is not None else None
+
+    def feed(self, chunk: bytes) -> bytes:
+        self._append(chunk)
+        data = self._rest + chunk
+        cut = data.rfind(b"\n") + 1
+        self._rest = data[cut:]
+        return data[:cut]
+
+    def finish(self) -> bytes:
+        """
+        Markiert die Übertragung als vollständig und liefert eine ggf. verbliebene letzte Zeile.
+        """
+        self.complete = True
+        rest, self._rest = self._rest, b""
+        return rest
+
+    def commit(self) -> dict:
+        """
+        Übernimmt die vollständig gelesene Datei in den Cache und liefert ihre Metadaten.
+        """
+        meta = {
+            "etag": self.response.headers.get("ETag"),
+            "last_modified": self.response.headers.get("Last-Modified"),
+            "checked": time.time(),
+            "size": self.size,
+            "revision": self._sha1.hexdigest(),
+            "stored": False,
+        }
+        if not self.complete or self._tmp is None:
+            return meta
+
+        data_path, meta_path = self.cache._paths(self.station_id)
+        try:
+            self._tmp.close()
+            old_size = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+            os.replace(self._tmp_path, data_path)
+        except OSError as e:
+            print(f"Schreiben in den .dly-Cache fehlgeschlagen: {e}")
+            return meta
+        self._tmp = self._tmp_path = None
+        meta["stored"] = True
+        self.cache._write_meta(meta_path, meta)
+        self.cache._account(self.size - old_size)
+        return meta
+
+    def discard(self) -> None:
+        if self._tmp is None:
+            return
+        try:
+            self._tmp.close()
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+        self._tmp = self._tmp_path = None
+
+    def _append(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        self._sha1.update(chunk)
+        self._write(chunk)
+
+    def _write(self, chunk: bytes) -> None:
+        if self._tmp is None:
+            return
+        try:
+            self._tmp.write(chunk)
+        except OSError as e:
+            print(f"Schreiben in den .dly-Cache fehlgeschlagen: {e}")
+            self.discard()
+
+
+dly_cache = DlyCache()
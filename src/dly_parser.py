@@ -0,0 +1,138 @@
+import numpy as np
+
+# Aufbau einer .dly-Zeile (siehe GHCND_documentation.pdf):
+#   ID 0-11, YEAR 11-15, MONTH 15-17, ELEMENT 17-21,
+#   danach 31 × (VALUE 5 Zeichen, MFLAG, QFLAG, SFLAG) = 8 Zeichen pro Tag
+LINE_LENGTH = 269
+_VALUE_COLUMNS = (21 + 8 * np.arange(31)[:, None] + np.arange(5)[None, :]).ravel()
+_QFLAG_COLUMNS = 21 + 8 * np.arange(31) + 6
+_MISSING = -9999
+
+_DIGIT_0 = ord("0")
+_SPACE = ord(" ")
+_MINUS = ord("-")
+
+
+class DlyMatrix:
+    """
+    Tageswerte einer Station als dichte Matrix:
+      values: int32-Array [Jahr, Monat, Element, Tag] in Originaleinheiten (z.B. Zehntel °C)
+      valid:  bool-Array gleicher Form (False für -9999, nicht lesbare oder - optional - QFLAG-markierte Werte)
+    Jahr 0 der ersten Achse entspricht first_year.
+    """
+
+    def __init__(self, first_year: int, elements: tuple, values: np.ndarray, valid: np.ndarray):
+        self.first_year = first_year
+        self.elements = elements
+        self.values = values
+        self.valid = valid
+
+    @property
+    def n_years(self) -> int:
+        return self.values.shape[0]
+
+    def monthly_sums(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Summen und Anzahlen gültiger Tageswerte je [Jahr, Monat, Element].
+        """
+        sums = np.where(self.valid, self.values, 0).sum(axis=-1, dtype=np.int64)
+        counts = self.valid.sum(axis=-1, dtype=np.int32)
+        return sums, counts
+
+
+def parse_dly(payload: bytes, elements: tuple, mask_qflag: bool = False) -> DlyMatrix:
+    """
+    Vektorisierter Parser für .dly-Dateien.
+    Die Datei wird als Byte-Matrix (Zeilen × 269 Zeichen) gelesen; alle 31 Wertespalten werden
+    gemeinsam dekodiert, statt jede Zeile und jeden Tag einzeln in Python zu verarbeiten.
+    Es werden nur Zeilen der übergebenen 'elements' berücksichtigt.
+    Mit mask_qflag=True werden Werte mit gesetztem Qualitäts-Flag (QFLAG) verworfen.
+    """
+    rows = _as_row_matrix(payload)
+    n_el = len(elements)
+    if len(rows) == 0:
+        return _empty(elements)
+
+    element_codes = np.ascontiguousarray(rows[:, 17:21]).view("S4").ravel()
+    element_idx = np.full(len(rows), -1, dtype=np.int8)
+    for i, element in enumerate(elements):
+        element_idx[element_codes == element.encode("ascii")] = i
+
+    year, year_ok = _parse_digits(rows[:, 11:15])
+    month, month_ok = _parse_digits(rows[:, 15:17])
+    keep = (element_idx >= 0) & year_ok & month_ok & (month >= 1) & (month <= 12)
+    if not keep.any():
+        return _empty(elements)
+
+    rows = rows[keep]
+    element_idx = element_idx[keep]
+    year = year[keep]
+    month = month[keep]
+
+    values, valid = _parse_values(rows[:, _VALUE_COLUMNS].reshape(len(rows), 31, 5))
+    if mask_qflag:
+        valid &= rows[:, _QFLAG_COLUMNS] == _SPACE
+
+    first_year = int(year.min())
+    n_years = int(year.max()) - first_year + 1
+    matrix_values = np.zeros((n_years, 12, n_el, 31), dtype=np.int32)
+    matrix_valid = np.zeros((n_years, 12, n_el, 31), dtype=bool)
+    target = (year - first_year, month - 1, element_idx)
+    matrix_values[target] = values
+    matrix_valid[target] = valid
+    return DlyMatrix(first_year, elements, matrix_values, matrix_valid)
+
+
+def _as_row_matrix(payload: bytes) -> np.ndarray:
+    """
+    Liefert die Zeilen als uint8-Matrix (n × 269). Liegen alle Zeilen in Standardlänge vor,
+    wird der Puffer ohne Kopie umgeformt; sonst werden die Zeilen einzeln zugeschnitten.
+    """
+    raw = np.frombuffer(payload, dtype=np.uint8)
+    for line_end in (b"\n", b"\r\n"):
+        width = LINE_LENGTH + len(line_end)
+        if len(raw) and len(raw) % width == 0:
+            matrix = raw.reshape(-1, width)
+            if (matrix[:, LINE_LENGTH] == line_end[0]).all():
+                return matrix[:, :LINE_LENGTH]
+
+    lines = [line[:LINE_LENGTH] for line in payload.splitlines() if len(line) >= LINE_LENGTH]
+    if not lines:
+        return np.zeros((0, LINE_LENGTH), dtype=np.uint8)
+    return np.frombuffer(b"".join(lines), dtype=np.uint8).reshape(-1, LINE_LENGTH)
+
+
+def _parse_digits(chars: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Dekodiert eine Matrix aus reinen Ziffernfeldern (z.B. Jahr, Monat) zeilenweise.
+    """
+    digits = chars.astype(np.int32) - _DIGIT_0
+    ok = ((digits >= 0) & (digits <= 9)).all(axis=1)
+    value = np.zeros(len(chars), dtype=np.int32)
+    for k in range(chars.shape[1]):
+        value = value * 10 + digits[:, k]
+    return value, ok
+
+
+def _parse_values(chars: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Dekodiert die 5-stelligen, rechtsbündigen Wertefelder (z.B. "  -12", "-9999").
+    Leere, nicht lesbare und fehlende (-9999) Felder sind ungültig.
+    """
+    digits = chars.astype(np.int32) - _DIGIT_0
+    is_digit = (digits >= 0) & (digits <= 9)
+    is_minus = chars == _MINUS
+    allowed = is_digit | is_minus | (chars == _SPACE)
+
+    value = np.zeros(chars.shape[:2], dtype=np.int32)
+    for k in range(chars.shape[2]):
+        value = np.where(is_digit[..., k], value * 10 + digits[..., k], value)
+    value = np.where(is_minus.any(axis=-1), -value, value)
+
+    valid = is_digit.any(axis=-1) & allowed.all(axis=-1) & (is_minus.sum(axis=-1) <= 1) & (value != _MISSING)
+    return value, valid
+
+
+def _empty(elements: tuple) -> DlyMatrix:
+    shape = (0, 12, len(elements), 31)
+    return DlyMatrix(0, elements, np.zeros(shape, dtype=np.int32), np.zeros(shape, dtype=bool))
@@ -1,3 +1,4 @@
+from typing import Optional
 from fastapi import Query
 from . import get_stations_in_radius, Station
 
@@ -6,16 +7,18 @@ def fetch_stations_query(
     longitude: float = Query(...),
     radius: float = Query(...),
     count: int = Query(...),
-        all_stations=None
+        all_stations=None,
+        start_year: Optional[int] = None,
+        end_year: Optional[int] = None
 ):
     """
     Beispiel:
-      GET /stations-query?latitude=52.52&longitude=13.405&radius=50&count=5
+      GET /stations-query?latitude=52.52&longitude=13.405&radius=50&count=5&startYear=1980&endYear=2020
     """
     if all_stations is None:
         all_stations = []
     if not all_stations:
         return []
 
-    stations = get_stations_in_radius(all_stations, latitude, longitude, radius, count)
+    stations = get_stations_in_radius(all_stations, latitude, longitude, radius, count, start_year, end_year)
     return stations
\ No newline at end of file
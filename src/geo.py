@@ -0,0 +1,32 @@
+import math
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0  # Erdradius in km
+
+
+def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Berechnet die Distanz (in km) zwischen zwei Koordinaten via Haversine-Formel.
+    """
+    R = EARTH_RADIUS_KM
+    d_lat = math.radians(lat2 - lat1)
+    d_lon = math.radians(lon2 - lon1)
+    a = (math.sin(d_lat / 2) ** 2
+         + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lon / 2) ** 2)
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    distance = R * c
+    return distance
+
+
+def haversine_distance_np(lat1: float, lon1: float, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """
+    Vektorisierte Variante von haversine_distance: Distanz (in km) von einem Punkt
+    zu allen Koordinaten in lat2/lon2 in einem einzigen NumPy-Durchlauf.
+    """
+    R = EARTH_RADIUS_KM
+    d_lat = np.radians(lat2 - lat1)
+    d_lon = np.radians(lon2 - lon1)
+    a = (np.sin(d_lat / 2) ** 2
+         + math.cos(math.radians(lat1)) * np.cos(np.radians(lat2)) * np.sin(d_lon / 2) ** 2)
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return R * c
@@ -0,0 +1,196 @@
+import asyncio
+import os
+from typing import Optional
+import numpy as np
+from fastapi import HTTPException
+from .dly_cache import DlyCache
+from .get_station_data import load_station_aggregates
+from .get_stations_data import STATION_BATCH_CONCURRENCY
+from .metrics import stage
+from .station_aggregates import ELEMENTS, SEASONS
+from .station_store import StationStore
+
+# Obergrenze für die Anzahl der Stationen einer Regionalabfrage
+REGION_MAX_STATIONS = int(os.environ.get("REGION_MAX_STATIONS", "500"))
+# Abstand (Sekunden) zwischen Zwischenergebnissen beim Streaming (NDJSON)
+REGION_PARTIAL_INTERVAL = float(os.environ.get("REGION_PARTIAL_INTERVAL", "0.5"))
+# Stationen näher als dieser Abstand (km) erhalten bei der Distanzgewichtung dasselbe Gewicht
+REGION_IDW_MIN_DISTANCE = float(os.environ.get("REGION_IDW_MIN_DISTANCE_KM", "1.0"))
+# Anzahl der Stationen, die gemeinsam verrechnet werden (begrenzt die Zwischen-Arrays)
+REGION_COMBINE_BLOCK = 32
+
+WEIGHTINGS = ("none", "idw")
+_PERIODS = ("annual",) + SEASONS
+_TEMPERATURES = [ELEMENTS.index("TMIN"), ELEMENTS.index("TMAX")]
+
+
+class RegionalAccumulator:
+    """
+    Gewichtete Summen der Jahres- und Jahreszeitenmittel (TMIN/TMAX) aller bisher geladenen Stationen,
+    als Arrays [Periode, Jahr, Element]. Stationen werden blockweise hinzugefügt; je höchstens
+    REGION_COMBINE_BLOCK Stationen werden gemeinsam verrechnet. Fehlende Werte einer Station (NaN) gehen weder
+    in die Summe noch in die Gewichte ein, das Regionalmittel eines Jahres stützt sich also nur auf
+    die Stationen mit Daten.
+    """
+
+    def __init__(self, start_year: int, end_year: int):
+        self.start_year = start_year
+        self.end_year = end_year
+        shape = (len(_PERIODS), end_year - start_year + 1, len(_TEMPERATURES))
+        self.weighted = np.zeros(shape)
+        self.weights = np.zeros(shape)
+        self.stations = np.zeros(shape[:2], dtype=np.int64)
+
+    def add(self, batch: list) -> None:
+        """
+        batch: Liste von (MonthlyAggregates, latitude, weight); verrechnet in Blöcken zu REGION_COMBINE_BLOCK
+        """
+        for i in range(0, len(batch), REGION_COMBINE_BLOCK):
+            self._add_block(batch[i:i + REGION_COMBINE_BLOCK])
+
+    def _add_block(self, batch: list) -> None:
+        if not batch:
+            return
+        means = self._period_means([aggregates for aggregates, _, _ in batch],
+                                   np.array([latitude is not None and latitude < 0 for _, latitude, _ in batch]))
+        weights = np.array([weight for _, _, weight in batch])[:, None, None, None]
+        valid = ~np.isnan(means)
+        self.weighted += np.where(valid, means * weights, 0.0).sum(axis=0)
+        self.weights += (valid * weights).sum(axis=0)
+        self.stations += valid.any(axis=-1).sum(axis=0)
+
+    def _period_means(self, batch: list, south: np.ndarray) -> np.ndarray:
+        """
+        Jahres- und Jahreszeitenmittel [Station, Periode, Jahr, Element] für alle Stationen des Blocks.
+        Die Monatswerte werden dazu auf einen gemeinsamen Jahresbereich (inkl. Vorjahr für den
+        Dezember) gebracht und per Matrixprodukt mit der Zuordnung Monat → Periode summiert
+        (Jahreszeiten wie in MonthlyAggregates.season_totals).
+        """
+        first, last = self.start_year - 1, self.end_year
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sums = _period_totals(np.stack([a._block(a.sums, first, last)[..., _TEMPERATURES] for a in batch]), south)
+            counts = _period_totals(np.stack([a._block(a.counts, first, last)[..., _TEMPERATURES] for a in batch]),
+                                    south)
+            means = np.where(counts > 0, sums / (10.0 * counts), np.nan)
+        return means.transpose(0, 3, 1, 2)
+
+    def to_region_data(self) -> list:
+        """
+        Regionalmittel je Jahr im Format von /station/data, ergänzt um die Anzahl beteiligter Stationen.
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            means = np.round(np.where(self.weights > 0, self.weighted / self.weights, np.nan), 1).tolist()
+        stations = self.stations.tolist()
+        output_data = []
+        for i, year in enumerate(range(self.start_year, self.end_year + 1)):
+            if not stations[0][i]:
+                continue
+            entry = {"year": year}
+            for p, key in enumerate(_PERIODS):
+                tmin, tmax = means[p][i]
+                entry[key] = {"min": None if tmin != tmin else tmin, "max": None if tmax != tmax else tmax,
+                              "stations": stations[p][i]}
+            output_data.append(entry)
+        return output_data
+
+
+def _month_weights(seasons: dict) -> np.ndarray:
+    weights = np.zeros((12, len(_PERIODS)))
+    weights[:, 0] = 1.0
+    for p, key in enumerate(SEASONS, start=1):
+        weights[seasons[key], p] = 1.0
+    return weights
+
+
+# Monat → Periode (annual, spring, summer, autumn, winter); der Dezember des Vorjahres für den
+# Winter der Nordhalbkugel wird in _period_totals ergänzt
+_NORTH = _month_weights({"spring": [2, 3, 4], "summer": [5, 6, 7], "autumn": [8, 9, 10], "winter": [0, 1]})
+_SOUTH = _month_weights({"spring": [8, 9, 10], "summer": [11, 0, 1], "autumn": [2, 3, 4], "winter": [5, 6, 7]})
+
+
+def _period_totals(arr: np.ndarray, south: np.ndarray) -> np.ndarray:
+    """
+    arr: [Station, Jahr (ab Vorjahr), Monat, Element] → Summen [Station, Jahr, Element, Periode].
+    'south' markiert Stationen der Südhalbkugel.
+    """
+    months = np.moveaxis(arr, 2, -1).astype(np.float64)
+    prev, cur = months[:, :-1], months[:, 1:]
+    totals = cur @ _NORTH
+    totals[..., _PERIODS.index("winter")] += prev[..., 11]
+    if south.any():
+        totals = np.where(south[:, None, None, None], cur @ _SOUTH, totals)
+    return totals
+
+
+def station_weight(station: dict, weighting: str, power: float) -> float:
+    if weighting == "idw":
+        return 1.0 / max(float(station.get("distance") or 0.0), REGION_IDW_MIN_DISTANCE) ** power
+    return 1.0
+
+
+async def iter_region_data(stations: list, start_year: int, end_year: int, weighting: str = "none",
+                           power: float = 2.0, concurrency: int = STATION_BATCH_CONCURRENCY,
+                           partial_interval: float = REGION_PARTIAL_INTERVAL, cache: Optional[DlyCache] = None,
+                           store: Optional[StationStore] = None):
+    """
+    Lädt die Monatsaggregate aller 'stations' (Dicts mit "id", "latitude", "distance", z.B. aus
+    fetch_stations_query; höchstens 'concurrency' gleichzeitig) und kombiniert sie zum Regionalmittel.
+    Liefert alle 'partial_interval' Sekunden ein Zwischenergebnis
+      {"type": "partial", "stations_total": n, "stations_done": k, "data": [...]}
+    und zum Schluss
+      {"type": "result", "stations_total": n, "stations_used": k, "weighting": ..., "data": [...], "errors": [...]}.
+    Stationen ohne Daten erscheinen wie bei /stations/data unter "errors".
+    Wird der Generator vorzeitig geschlossen (z.B. Client getrennt), werden offene Ladevorgänge abgebrochen.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    accumulator = RegionalAccumulator(start_year, end_year)
+
+    async def load(station: dict):
+        async with semaphore:
+            try:
+                return station, await load_station_aggregates(station["id"], end_year, cache, store), None
+            except HTTPException as e:
+                return station, None, e.detail
+
+    pending = {asyncio.ensure_future(load(station)) for station in stations}
+    done_count, used, errors = 0, 0, []
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=partial_interval if partial_interval > 0 else None)
+            batch = []
+            for task in done:
+                station, aggregates, error = task.result()
+                if error is not None:
+                    errors.append(error)
+                else:
+                    batch.append((aggregates, station.get("latitude"), station_weight(station, weighting, power)))
+            done_count += len(done)
+            used += len(batch)
+            with stage("region_combine"):
+                await asyncio.to_thread(accumulator.add, batch)
+            # Ohne neue Stationen seit dem letzten Zwischenergebnis wird keines gesendet
+            if pending and done:
+                yield {"type": "partial", "stations_total": len(stations), "stations_done": done_count,
+                       "data": accumulator.to_region_data()}
+    finally:
+        for task in pending:
+            task.cancel()
+
+    order = {station["id"]: i for i, station in enumerate(stations)}
+    errors.sort(key=lambda error: order.get(error.get("station_id"), len(order)))
+    yield {"type": "result", "stations_total": len(stations), "stations_used": used, "weighting": weighting,
+           "data": accumulator.to_region_data(), "errors": errors}
+
+
+async def get_region_data_from_ghcn(stations: list, start_year: int, end_year: int, weighting: str = "none",
+                                    power: float = 2.0, concurrency: int = STATION_BATCH_CONCURRENCY,
+                                    cache: Optional[DlyCache] = None, store: Optional[StationStore] = None) -> dict:
+    """
+    Wie iter_region_data, liefert aber nur das Endergebnis.
+    """
+    result = None
+    async for result in iter_region_data(stations, start_year, end_year, weighting, power, concurrency, 0,
+                                         cache, store):
+        pass
+    del result["type"]
+    return result
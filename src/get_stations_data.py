@@ -0,0 +1,55 @@
+import asyncio
+import os
+from typing import Optional
+from fastapi import HTTPException
+from .dly_cache import DlyCache
+from .get_station_data import get_station_data_from_ghcn
+
+# Anzahl der Stationen, die bei einer Sammelanfrage gleichzeitig geladen und aggregiert werden
+STATION_BATCH_CONCURRENCY = int(os.environ.get("STATION_BATCH_CONCURRENCY", "8"))
+# Obergrenze für die Anzahl der Stationen pro Sammelanfrage
+STATION_BATCH_MAX_STATIONS = int(os.environ.get("STATION_BATCH_MAX_STATIONS", "100"))
+
+
+async def get_stations_data_from_ghcn(stations: list, start_year: Optional[str], end_year: Optional[str],
+                                      concurrency: int = STATION_BATCH_CONCURRENCY,
+                                      cache: Optional[DlyCache] = None) -> dict:
+    """
+    Lädt die Jahres- und Jahreszeitenmittel mehrerer Stationen (siehe get_station_data_from_ghcn).
+    'stations' ist eine Liste von Dicts mit mindestens "id" und optional "latitude"
+    (z.B. das Ergebnis von fetch_stations_query); weitere Felder werden in die Antwort übernommen.
+    Es werden höchstens 'concurrency' Stationen gleichzeitig verarbeitet. Stationen ohne Daten
+    führen nicht zum Abbruch, sondern erscheinen mit der Fehlermeldung unter "errors".
+    Rückgabe:
+      {"stations": [{"station_id": ..., <Stationsfelder>, "data": [...]}, ...],
+       "errors": [{"station_id": ..., "error": ..., "message": ...}, ...]}
+    Die Reihenfolge entspricht der Reihenfolge in 'stations'.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def load(station: dict):
+        async with semaphore:
+            try:
+                result = await get_station_data_from_ghcn(
+                    station_id=station["id"],
+                    start_year=start_year,
+                    end_year=end_year,
+                    latitude=station.get("latitude"),
+                    cache=cache,
+                )
+            except HTTPException as e:
+                return None, e.detail
+        entry = {"station_id": station["id"]}
+        entry.update((key, value) for key, value in station.items() if key != "id")
+        entry["data"] = result["data"]
+        return entry, None
+
+    # Doppelte IDs nur einmal laden (erstes Vorkommen bestimmt die Position)
+    unique = {}
+    for station in stations:
+        unique.setdefault(station["id"], station)
+    results = await asyncio.gather(*(load(station) for station in unique.values()))
+    return {
+        "stations": [entry for entry, _ in results if entry is not None],
+        "errors": [error for _, error in results if error is not None],
+    }
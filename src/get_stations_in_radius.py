@@ -1,34 +1,44 @@
-import math
-from typing import List
+from typing import List, Optional
+import numpy as np
 from src import Station
+from .geo import haversine_distance, haversine_distance_np
+from .metrics import QUERY_CANDIDATES, record_count, stage
+from .station_catalog import StationCatalog
+from .station_index import select_nearest
 
+# Toleranz für die Vorauswahl: Die Sortierung erfolgt nach der auf 2 Stellen gerundeten Distanz,
+# daher kann eine Station mit bis zu 0.01 km größerer Rohdistanz noch unter die ersten 'count' fallen.
+_ROUNDING_SLACK_KM = 0.011
 
-def get_stations_in_radius(all_stations: list[Station], lat: float, lon: float, radius_km: float, count: int) -> List[Station]:
+
+def get_stations_in_radius(all_stations: StationCatalog, lat: float, lon: float, radius_km: float, count: int,
+                           start_year: Optional[int] = None, end_year: Optional[int] = None) -> List[Station]:
     """
     Filtert ALL_STATIONS nach Stationen, die im Umkreis liegen,
     sortiert nach Distanz aufsteigend und schneidet auf 'count' zu.
+    Über den räumlichen Index des Katalogs werden nur Stationen in der Nähe betrachtet;
+    deren Distanzen werden in einem vektorisierten Haversine-Durchlauf berechnet.
+    Optional werden nur Stationen berücksichtigt, deren Inventar start_year/end_year abdeckt.
     """
-    results = []
-    for st in all_stations:
-        dist = haversine_distance(lat, lon, st["latitude"], st["longitude"])
-        if dist <= radius_km:
-            st_copy = st.copy()
-            st_copy["distance"] = round(dist, 2)
-            results.append(st_copy)
-
-    results.sort(key=lambda s: s["distance"])
-    return results[:count]
+    with stage("query"):
+        rows = all_stations.index.candidates(lat, lon, radius_km, start_year, end_year)
+        record_count(QUERY_CANDIDATES, "candidates", len(rows), stage="index")
+        if start_year is not None or end_year is not None:
+            with stage("year_filter"):
+                rows = rows[all_stations.covers_years(rows, start_year, end_year)]
+        dists = haversine_distance_np(lat, lon, all_stations.latitude[rows], all_stations.longitude[rows])
+        in_radius = dists <= radius_km
+        rows = rows[in_radius]
+        dists = dists[in_radius]
+        record_count(QUERY_CANDIDATES, "in_radius", len(rows), stage="radius")
 
+        # Nur die Kandidaten, die nach dem Runden überhaupt unter die ersten 'count' fallen können,
+        # werden als Python-Objekte weiterverarbeitet.
+        if 0 < count < len(rows):
+            kth = np.partition(dists, count - 1)[count - 1]
+            keep = dists <= kth + _ROUNDING_SLACK_KM
+            rows = rows[keep]
+            dists = dists[keep]
 
-def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """
-    Berechnet die Distanz (in km) zwischen zwei Koordinaten via Haversine-Formel.
-    """
-    R = 6371.0  # Erdradius in km
-    d_lat = math.radians(lat2 - lat1)
-    d_lon = math.radians(lon2 - lon1)
-    a = (math.sin(d_lat / 2) ** 2
-         + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lon / 2) ** 2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    distance = R * c
-    return distance
\ No newline at end of file
+        hits = [(round(dist, 2), row) for dist, row in zip(dists.tolist(), rows.tolist())]
+        return [all_stations.station(row, distance=dist) for dist, row in select_nearest(hits, count)]
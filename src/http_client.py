@@ -0,0 +1,81 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+from urllib.parse import urlsplit
+import httpx
+
+# Gesamtzahl gleichzeitiger Verbindungen des Pools bzw. davon offen gehaltene Keep-Alive-Verbindungen
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "32"))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", "16"))
+# Maximal gleichzeitige Anfragen je Upstream-Host (z.B. www1.ncdc.noaa.gov)
+HTTP_MAX_PER_HOST = int(os.environ.get("HTTP_MAX_PER_HOST", "8"))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "30"))
+
+
+class UpstreamClient:
+    """
+    Gemeinsamer asynchroner HTTP-Client für alle NOAA-Downloads.
+    Hält einen Keep-Alive-Verbindungspool (keine neue TLS-Verbindung pro Anfrage) und
+    begrenzt die gleichzeitigen Anfragen je Host, damit langsame Downloads weder den
+    Pool noch andere Endpunkte blockieren.
+    """
+
+    def __init__(self, max_connections: int = HTTP_MAX_CONNECTIONS, max_keepalive: int = HTTP_MAX_KEEPALIVE,
+                 max_per_host: int = HTTP_MAX_PER_HOST, timeout: float = HTTP_TIMEOUT):
+        self.max_per_host = max_per_host
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+            timeout=httpx.Timeout(timeout),
+            follow_redirects=True,
+        )
+        self._host_slots: dict[str, asyncio.Semaphore] = {}
+
+    def _slot(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = asyncio.Semaphore(self.max_per_host)
+        return slot
+
+    async def get(self, url: str, headers: Optional[dict] = None) -> httpx.Response:
+        async with self._slot(url):
+            return await self.client.get(url, headers=headers)
+
+    @asynccontextmanager
+    async def stream(self, url: str, headers: Optional[dict] = None):
+        """
+        GET-Anfrage, deren Body schrittweise gelesen wird (response.aiter_bytes()).
+        Der Host-Slot bleibt belegt, bis der Kontext verlassen wird.
+        """
+        async with self._slot(url):
+            async with self.client.stream("GET", url, headers=headers) as response:
+                yield response
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+_client: Optional[UpstreamClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_http_client() -> UpstreamClient:
+    """
+    Liefert den prozessweiten Client. Er ist an die laufende Event-Loop gebunden und wird
+    neu angelegt, falls er aus einer anderen Loop (z.B. in Tests per asyncio.run) verwendet wird.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        _client = UpstreamClient()
+        _client_loop = loop
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client, _client_loop
+    if _client is not None and _client_loop is asyncio.get_running_loop():
+        await _client.aclose()
+    _client = None
+    _client_loop = None
@@ -0,0 +1,41 @@
+import json
+from fastapi import Response
+from .Station import Station
+from .metrics import stage
+
+try:
+    import orjson
+except ImportError:  # ohne orjson: gleiche Ausgabe über das json-Modul, nur langsamer
+    orjson = None
+
+# Felder des öffentlichen Station-Schemas (Reihenfolge wie im Antwortmodell)
+STATION_FIELDS = tuple(Station.model_fields)
+
+
+def dumps(content) -> bytes:
+    """
+    Serialisiert 'content' (dict/list aus str, int, float, None) kompakt als UTF-8-JSON.
+    """
+    with stage("serialize"):
+        if orjson is not None:
+            return orjson.dumps(content)
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def stations_json(stations: list) -> bytes:
+    """
+    Serialisiert Stations-Dicts (z.B. aus get_stations_in_radius) direkt im Format von List[Station],
+    ohne jedes Element per Pydantic zu validieren. Zusätzliche Felder (z.B. Inventarjahre) entfallen.
+    """
+    return dumps([{field: station[field] for field in STATION_FIELDS} for station in stations])
+
+
+class FastJSONResponse(Response):
+    """
+    JSON-Antwort, die ohne jsonable_encoder direkt aus den internen Strukturen serialisiert wird.
+    Für Endpunkte, deren Rückgabe nur aus JSON-Grundtypen besteht.
+    """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
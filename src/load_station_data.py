@@ -1,25 +1,17 @@
-import requests
 import csv
-from .load_station_inventory import load_station_inventory
+import os
+from .station_catalog import StationCatalog
 
-STATIONS_CSV_URL = "https://www1.ncdc.noaa.gov/pub/data/ghcn/daily/ghcnd-stations.csv"
+STATIONS_CSV_URL = os.environ.get("GHCN_STATIONS_CSV_URL", "https://www1.ncdc.noaa.gov/pub/data/ghcn/daily/ghcnd-stations.csv")
 
-def load_station_data() -> list:
-    all_stations: list = []
-    try:
-        print("Starte Download der Stationsliste...")
-        r = requests.get(STATIONS_CSV_URL, timeout=30)
-        r.raise_for_status()
-    except requests.RequestException as e:
-        print(f"Fehler beim Download der CSV: {e}")
-        raise
-
-    lines = r.text.splitlines()
+def parse_station_data(lines: list, inventory: dict) -> StationCatalog:
+    """
+    Parst die Zeilen der ghcnd-stations.csv und ergänzt die Inventar-Jahre.
+    Der Download erfolgt über den Katalog-Snapshot (siehe catalog_snapshot.build_catalog_snapshot).
+    """
+    ids, names, latitudes, longitudes, start_years, end_years = [], [], [], [], [], []
     reader = csv.reader(lines)
 
-    # Hole zusätzlich die Inventardaten
-    inventory = load_station_inventory()
-
     for row in reader:
         # Es werden mindestens 6 Spalten benötigt: id, lat, lon, elevation, state, name
         if len(row) < 6:
@@ -41,16 +33,11 @@ def load_station_data() -> list:
 
         # Füge Inventarinformationen hinzu, falls vorhanden
         inv = inventory.get(station_id, {})
-        station_obj = {
-            "id": station_id,
-            "name": name_str,
-            "latitude": lat,
-            "longitude": lon,
-            "distance": 0.0,
-            "inventory_start_year": inv.get("start_year"),
-            "inventory_end_year": inv.get("end_year")
-        }
-        all_stations.append(station_obj)
-
-    print(f"CSV-Download abgeschlossen. Anzahl geladener Stationen: {len(all_stations)}")
-    return all_stations
+        ids.append(station_id)
+        names.append(name_str)
+        latitudes.append(lat)
+        longitudes.append(lon)
+        start_years.append(inv.get("start_year"))
+        end_years.append(inv.get("end_year"))
+
+    return StationCatalog.from_columns(ids, names, latitudes, longitudes, start_years, end_years)
@@ -1,24 +1,14 @@
-import requests
+import os
 
-INVENTORY_URL = "https://noaa-ghcn-pds.s3.amazonaws.com/ghcnd-inventory.txt"
+INVENTORY_URL = os.environ.get("GHCN_INVENTORY_URL", "https://noaa-ghcn-pds.s3.amazonaws.com/ghcnd-inventory.txt")
 
-def load_station_inventory() -> dict:
+def parse_station_inventory(lines: list) -> dict:
     """
-    Lädt und parst die ghcnd-inventory.txt.
-    Für jedes Station-Element (nur TMIN/TMAX) wird das früheste
-    Startjahr und das späteste Endjahr ermittelt.
-    Rückgabe: dict, das für jede station_id ein Dict mit "start_year" und "end_year" enthält.
+    Parst die Zeilen der ghcnd-inventory.txt (nur TMIN/TMAX) zu
+    station_id → {"start_year": ..., "end_year": ...}.
+    Der Download erfolgt über den Katalog-Snapshot (siehe catalog_snapshot.build_catalog_snapshot).
     """
     inventory = {}
-    try:
-        print("Downloading station inventory...")
-        r = requests.get(INVENTORY_URL, timeout=30)
-        r.raise_for_status()
-    except requests.RequestException as e:
-        print(f"Error downloading inventory: {e}")
-        return inventory
-
-    lines = r.text.splitlines()
     for line in lines:
         # ghcnd-inventory.txt ist fixed-width formatiert:
         # station id: Spalte 0-11, Element: Spalte 11-15,
@@ -39,5 +29,4 @@ def load_station_inventory() -> dict:
         else:
             inventory[station_id]["start_year"] = min(inventory[station_id]["start_year"], first_year)
             inventory[station_id]["end_year"] = max(inventory[station_id]["end_year"], last_year)
-    print("Inventory download complete.")
     return inventory
\ No newline at end of file
@@ -0,0 +1,206 @@
+import contextvars
+import os
+import threading
+import time
+from typing import Optional
+
+# Request-Header, mit dem ein Client die Aufschlüsselung nach Phasen anfordert (Antwort: Server-Timing)
+PROFILE_HEADER = os.environ.get("METRICS_PROFILE_HEADER", "X-Profile")
+
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTE_BUCKETS = (1e3, 1e4, 1e5, 3e5, 1e6, 3e6, 1e7, 3e7, 1e8)
+COUNT_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+# Alle Metriken in der Reihenfolge ihrer Definition (Ausgabe über render_prometheus)
+REGISTRY: list = []
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: tuple, extra: str = "") -> str:
+        parts = [f'{name}="{value}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> list:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    """
+    Monoton steigender Zähler je Label-Kombination.
+    """
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{self._labels(key)} {value:g}")
+        return lines
+
+
+class Histogram(_Metric):
+    """
+    Histogramm mit festen Bucket-Grenzen (kumulativ ausgegeben, wie bei Prometheus üblich).
+    """
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = TIME_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = buckets
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return entry[2] if entry else 0
+
+    def render(self) -> list:
+        lines = super().render()
+        with self._lock:
+            for key, (bucket_counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    le = 'le="%g"' % bound
+                    lines.append(f"{self.name}_bucket{self._labels(key, le)} {bucket_count}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{self._labels(key, le)} {count}")
+                lines.append(f"{self.name}_sum{self._labels(key)} {total:g}")
+                lines.append(f"{self.name}_count{self._labels(key)} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("climatelens_stage_seconds", "Dauer der Verarbeitungsphasen", ("stage",))
+REQUEST_SECONDS = Histogram("climatelens_request_seconds", "Dauer der HTTP-Anfragen", ("path", "status"))
+DOWNLOAD_BYTES = Histogram("climatelens_download_bytes", "Übertragene Bytes je NOAA-Download", ("source",),
+                           buckets=BYTE_BUCKETS)
+DLY_LINES = Histogram("climatelens_dly_lines", "Geparste .dly-Zeilen je Station", buckets=COUNT_BUCKETS)
+QUERY_CANDIDATES = Histogram("climatelens_query_candidates", "Kandidaten aus dem räumlichen Index je Umkreissuche",
+                             ("stage",), buckets=COUNT_BUCKETS)
+CACHE_EVENTS = Counter("climatelens_cache_events_total", "Cache-Zugriffe nach Ergebnis", ("cache", "result"))
+ADMISSION_EVENTS = Counter("climatelens_upstream_admission_total",
+                           "Zulassung von NOAA-Downloads (admitted, queued, rejected, timeout)", ("result",))
+
+
+_profile: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("climatelens_profile", default=None)
+
+
+class stage:
+    """
+    Misst die Dauer einer Verarbeitungsphase:
+        with stage("parse"):
+            ...
+    Die Dauer geht in climatelens_stage_seconds ein und - falls für die aktuelle Anfrage ein
+    Profil aktiv ist (Header X-Profile) - in dessen Aufschlüsselung. Mehrfach durchlaufene
+    Phasen (z.B. blockweises Parsen) können mit einer Instanz und finish() als eine
+    Beobachtung gezählt werden.
+    """
+
+    def __init__(self, name: str, accumulate: bool = False):
+        self.name = name
+        self.accumulate = accumulate
+        self.elapsed = 0.0
+        self._started = 0.0
+
+    def __enter__(self) -> "stage":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.elapsed += time.perf_counter() - self._started
+        if not self.accumulate:
+            self.finish()
+        return False
+
+    def finish(self) -> None:
+        STAGE_SECONDS.observe(self.elapsed, stage=self.name)
+        add_to_profile(self.name, self.elapsed)
+
+
+def add_to_profile(name: str, seconds: float = 0.0, count: Optional[float] = None) -> None:
+    profile = _profile.get()
+    if profile is None:
+        return
+    entry = profile.setdefault(name, [0.0, None])
+    entry[0] += seconds
+    if count is not None:
+        entry[1] = (entry[1] or 0) + count
+
+
+def record_count(histogram: Histogram, name: str, value: float, **labels) -> None:
+    """
+    Beobachtet 'value' im Histogramm und übernimmt es unter 'name' ins aktive Anfrage-Profil.
+    """
+    histogram.observe(value, **labels)
+    add_to_profile(name, count=value)
+
+
+def cache_event(cache: str, result: str) -> None:
+    CACHE_EVENTS.inc(cache=cache, result=result)
+    add_to_profile(f"{cache}_{result}", count=1)
+
+
+def start_profile() -> contextvars.Token:
+    return _profile.set({})
+
+
+def finish_profile(token: contextvars.Token) -> str:
+    """
+    Beendet das Profil der Anfrage und liefert es als Server-Timing-Header, z.B.
+      download;dur=120.5, parse;dur=3.1, lines;desc="25848"
+    """
+    profile = _profile.get() or {}
+    _profile.reset(token)
+    parts = []
+    for name, (seconds, count) in profile.items():
+        part = name
+        if seconds:
+            part += f";dur={seconds * 1000:.2f}"
+        if count is not None:
+            part += f';desc="{count:g}"'
+        parts.append(part)
+    return ", ".join(parts)
+
+
+def render_prometheus() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
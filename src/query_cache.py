@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from .fetch_stations_query import fetch_stations_query
+from .json_response import stations_json
+from .metrics import cache_event
+
+# Maximale Anzahl gespeicherter /stations-query-Antworten (0 = Cache aus) und ihre Lebensdauer in Sekunden
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", "1024"))
+QUERY_CACHE_TTL = float(os.environ.get("QUERY_CACHE_TTL", "300"))
+# Koordinaten werden vor der Suche auf diese Anzahl Nachkommastellen gerundet (5 ≈ 1 m)
+QUERY_CACHE_COORD_DECIMALS = int(os.environ.get("QUERY_CACHE_COORD_DECIMALS", "5"))
+
+
+class QueryCache:
+    """
+    LRU-Cache mit Ablaufzeit für bereits serialisierte /stations-query-Antworten (JSON-Bytes).
+    Die Einträge gehören zu genau einem StationCatalog: wird ALL_STATIONS ersetzt
+    (z.B. nach einer Katalogaktualisierung), wird der Cache beim nächsten Zugriff geleert.
+    Treffer, Fehlschläge und Verdrängungen werden für stats() mitgezählt.
+    """
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES, ttl: float = QUERY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._catalog = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, catalog, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            self._bind(catalog)
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, catalog, key: tuple, body: bytes) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._bind(catalog)
+            self._entries[key] = (time.monotonic(), body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._catalog = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _bind(self, catalog) -> None:
+        if catalog is not self._catalog:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._catalog = catalog
+
+
+stations_query_cache = QueryCache()
+
+
+def cached_stations_query(latitude: float, longitude: float, radius: float, count: int, all_stations=None,
+                          start_year: Optional[int] = None, end_year: Optional[int] = None,
+                          cache: Optional[QueryCache] = None) -> bytes:
+    """
+    Wie fetch_stations_query, liefert aber die fertig serialisierte JSON-Antwort (List[Station]).
+    Breiten-/Längengrad werden auf QUERY_CACHE_COORD_DECIMALS Stellen gerundet und die Suche
+    am gerundeten Punkt ausgeführt, damit nahezu identische Anfragen (z.B. beim Verschieben
+    der Karte) denselben Cache-Eintrag treffen und dieser exakt zur Anfrage passt.
+    """
+    cache = cache or stations_query_cache
+    latitude = round(latitude, QUERY_CACHE_COORD_DECIMALS)
+    longitude = round(longitude, QUERY_CACHE_COORD_DECIMALS)
+    key = (latitude, longitude, float(radius), count, start_year, end_year)
+
+    body = cache.get(all_stations, key)
+    cache_event("stations_query", "hit" if body is not None else "miss")
+    if body is None:
+        stations = fetch_stations_query(latitude, longitude, radius, count, all_stations, start_year, end_year)
+        body = stations_json(stations)
+        cache.put(all_stations, key, body)
+    return body
@@ -0,0 +1,370 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+from .admission import DLY_MEMORY_BUDGET
+from .aggregate_pool import run_cpu_bound
+from .dly_cache import DlyCache
+from .dly_parser import parse_dly
+from .metrics import DLY_LINES, cache_event, record_count, stage
+
+# Elemente, für die Monatsaggregate gebildet werden (Reihenfolge = letzte Achse der Arrays)
+ELEMENTS = ("TMIN", "TMAX", "TAVG", "PRCP")
+SEASONS = ("spring", "summer", "autumn", "winter")
+
+AGGREGATE_FORMAT_VERSION = 2
+AGGREGATE_SUFFIX = ".agg.npz"
+# Anzahl der Stationen, deren Monatsaggregate zusätzlich im Arbeitsspeicher gehalten werden
+AGGREGATE_MEMORY_ENTRIES = int(os.environ.get("AGGREGATE_MEMORY_ENTRIES", "256"))
+# Stationen ohne Cache-Eintrag werden beim Herunterladen blockweise geparst (0 = komplette Datei puffern)
+DLY_STREAMING = os.environ.get("DLY_STREAMING", "1") != "0"
+# Frühestes zulässiges Jahr in Anfragen (die ältesten GHCN-Daily-Reihen beginnen 1763)
+YEAR_MIN = 1700
+
+
+def check_year_range(start: int, end: int, start_name: str, end_name: str) -> None:
+    """
+    Prüft einen Jahresbereich aus einer Anfrage: beide Jahre zwischen YEAR_MIN und dem laufenden
+    Jahr, start nicht nach end. Sonst ValueError (die Arrays werden über den ganzen Bereich angelegt).
+    """
+    last = time.gmtime().tm_year
+    for name, year in ((start_name, start), (end_name, end)):
+        if not YEAR_MIN <= year <= last:
+            raise ValueError(f"{name} must be between {YEAR_MIN} and {last}")
+    if start > end:
+        raise ValueError(f"{start_name} must not be after {end_name}")
+
+
+class MonthlyAggregates:
+    """
+    Monatliche Teilsummen und Anzahlen der Tageswerte einer Station.
+      sums:   int64-Array [Jahr, Monat, Element], Summe der Tageswerte in Zehntel °C bzw. Zehntel mm (PRCP)
+      counts: int32-Array [Jahr, Monat, Element], Anzahl gültiger Tageswerte
+    Jahres- und Jahreszeitenmittel für beliebige Zeiträume lassen sich daraus aus
+    ca. 12 × Jahre Zellen zusammensetzen, ohne die .dly-Datei erneut zu parsen.
+    lines: Anzahl der geparsten .dly-Zeilen (nur für Metriken; 0 bei gespeicherten Aggregaten)
+    """
+
+    def __init__(self, first_year: int, sums: np.ndarray, counts: np.ndarray, lines: int = 0):
+        self.first_year = first_year
+        self.sums = sums
+        self.counts = counts
+        self.lines = lines
+
+    @classmethod
+    def from_dly(cls, payload: bytes) -> "MonthlyAggregates":
+        """
+        Parst eine .dly-Datei vektorisiert (siehe dly_parser.py) und summiert die Tageswerte je Monat.
+        """
+        matrix = parse_dly(payload, ELEMENTS)
+        sums, counts = matrix.monthly_sums()
+        return cls(matrix.first_year, sums, counts, payload.count(b"\n"))
+
+    @classmethod
+    def empty(cls) -> "MonthlyAggregates":
+        return cls(0, np.zeros((0, 12, len(ELEMENTS)), dtype=np.int64), np.zeros((0, 12, len(ELEMENTS)), dtype=np.int32))
+
+    def _block(self, arr: np.ndarray, first: int, last: int) -> np.ndarray:
+        """
+        Ausschnitt [first, last] (Jahre, inklusive) von 'arr'; Jahre ohne Daten sind 0.
+        """
+        out = np.zeros((last - first + 1,) + arr.shape[1:], dtype=arr.dtype)
+        lo = max(first, self.first_year)
+        hi = min(last, self.first_year + len(arr) - 1)
+        if lo <= hi:
+            out[lo - first:hi - first + 1] = arr[lo - self.first_year:hi - self.first_year + 1]
+        return out
+
+    def season_totals(self, arr: np.ndarray, start_year: int, end_year: int, latitude: Optional[float]) -> dict:
+        """
+        Summiert 'arr' (sums oder counts) je Jahr für "annual" und die vier Jahreszeiten.
+        Berücksichtigt dabei die Hemisphäre:
+        - Südhalbkugel (latitude < 0):
+            Dezember, Januar, Februar → summer
+            März bis Mai → autumn
+            Juni bis August → winter
+            September bis November → spring
+        - Nordhalbkugel (default):
+            Dezember → winter (Zugehörigkeit zum Folgejahr)
+            Januar, Februar → winter
+            März bis Mai → spring
+            Juni bis August → summer
+            September bis November → autumn
+        Für "annual" wird immer das Kalenderjahr verwendet.
+        """
+        block = self._block(arr, start_year - 1, end_year)
+        prev, cur = block[:-1], block[1:]
+        totals = {"annual": cur.sum(axis=1)}
+        if latitude is not None and latitude < 0:
+            totals["summer"] = cur[:, [11, 0, 1]].sum(axis=1)
+            totals["autumn"] = cur[:, 2:5].sum(axis=1)
+            totals["winter"] = cur[:, 5:8].sum(axis=1)
+            totals["spring"] = cur[:, 8:11].sum(axis=1)
+        else:
+            totals["winter"] = prev[:, 11] + cur[:, 0:2].sum(axis=1)
+            totals["spring"] = cur[:, 2:5].sum(axis=1)
+            totals["summer"] = cur[:, 5:8].sum(axis=1)
+            totals["autumn"] = cur[:, 8:11].sum(axis=1)
+        return totals
+
+    def to_station_data(self, start_year: int, end_year: int, latitude: Optional[float]) -> list:
+        """
+        Jahres- und Jahreszeitenmittel (min = TMIN, max = TMAX, gerundet auf 0.1 °C)
+        für jedes Jahr in [start_year, end_year] im Antwortformat von /station/data.
+        """
+        if start_year > end_year:
+            return []
+
+        sums = self.season_totals(self.sums, start_year, end_year, latitude)
+        counts = self.season_totals(self.counts, start_year, end_year, latitude)
+        means = {}
+        for key in ("annual",) + SEASONS:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                values = sums[key] / (10.0 * counts[key])
+            means[key] = np.where(counts[key] > 0, values, np.nan).tolist()
+
+        tmin = ELEMENTS.index("TMIN")
+        tmax = ELEMENTS.index("TMAX")
+        output_data = []
+        for i, year in enumerate(range(start_year, end_year + 1)):
+            entry = {"year": year}
+            for key in ("annual",) + SEASONS:
+                entry[key] = {"min": _round(means[key][i][tmin]), "max": _round(means[key][i][tmax])}
+            output_data.append(entry)
+        return output_data
+
+
+class _MonthlyAccumulator:
+    """
+    Sammelt MonthlyAggregates blockweise aus aufeinanderfolgenden Teilen einer .dly-Datei.
+    Der Jahresbereich der Arrays wächst bei Bedarf mit.
+    """
+
+    def __init__(self):
+        self.aggregates = MonthlyAggregates.empty()
+        self.lines = 0
+
+    def add(self, part: MonthlyAggregates) -> None:
+        self.lines += part.lines
+        if len(part.sums) == 0:
+            return
+        current = self.aggregates
+        if len(current.sums) == 0:
+            self.aggregates = part
+            return
+
+        first = min(current.first_year, part.first_year)
+        last = max(current.first_year + len(current.sums), part.first_year + len(part.sums)) - 1
+        sums = current._block(current.sums, first, last)
+        counts = current._block(current.counts, first, last)
+        offset = part.first_year - first
+        sums[offset:offset + len(part.sums)] += part.sums
+        counts[offset:offset + len(part.counts)] += part.counts
+        self.aggregates = MonthlyAggregates(first, sums, counts)
+
+
+def _round(value: float) -> Optional[float]:
+    return None if value != value else round(value, 1)
+
+
+class AggregateStore:
+    """
+    Persistiert MonthlyAggregates je Station als <station_id>.agg.npz neben der .dly-Datei im DlyCache.
+    Ein Eintrag ist nur gültig, solange die Revision (SHA-1) der .dly-Datei übereinstimmt; er wird
+    zusammen mit der .dly-Datei aus dem Cache verdrängt. Die zuletzt genutzten Einträge werden
+    zusätzlich im Arbeitsspeicher gehalten.
+    """
+
+    def __init__(self, cache: DlyCache, memory_entries: int = AGGREGATE_MEMORY_ENTRIES):
+        self.cache = cache
+        self.memory_entries = memory_entries
+        self._memory: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, station_id: str, revision: Optional[str]) -> Optional[MonthlyAggregates]:
+        if not revision:
+            return None
+        with self._lock:
+            hit = self._memory.get((station_id, revision))
+            if hit is not None:
+                self._memory.move_to_end((station_id, revision))
+                return hit
+
+        try:
+            with np.load(self.cache.sidecar_path(station_id, AGGREGATE_SUFFIX)) as data:
+                if int(data["format"]) != AGGREGATE_FORMAT_VERSION or str(data["revision"]) != revision:
+                    return None
+                aggregates = MonthlyAggregates(int(data["first_year"]), data["sums"], data["counts"])
+        except (OSError, KeyError, ValueError):
+            return None
+        self._remember(station_id, revision, aggregates)
+        return aggregates
+
+    def save(self, station_id: str, revision: Optional[str], aggregates: MonthlyAggregates) -> None:
+        if not revision:
+            return
+        self._remember(station_id, revision, aggregates)
+        path = self.cache.sidecar_path(station_id, AGGREGATE_SUFFIX)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                np.savez(f, format=AGGREGATE_FORMAT_VERSION, revision=revision,
+                         first_year=aggregates.first_year, sums=aggregates.sums, counts=aggregates.counts)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Speichern der Monatsaggregate für {station_id} fehlgeschlagen: {e}")
+
+    def _remember(self, station_id: str, revision: str, aggregates: MonthlyAggregates) -> None:
+        with self._lock:
+            self._memory[(station_id, revision)] = aggregates
+            self._memory.move_to_end((station_id, revision))
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+
+async def load_monthly_aggregates(station_id: str, cache: DlyCache, store: AggregateStore,
+                                  end_year: Optional[int] = None) -> MonthlyAggregates:
+    """
+    Stellt die .dly-Datei über den Cache bereit und liefert die zugehörigen Monatsaggregate.
+    Die Datei wird nur geparst, wenn für ihre aktuelle Revision noch keine Aggregate gespeichert sind.
+    Das Parsen läuft über run_cpu_bound (Prozesspool oder Worker-Thread, siehe aggregate_pool.py);
+    an den Pool wird nur der Pfad der Cache-Datei übergeben, zurück kommen die Monatsaggregate.
+    Liegt die Station noch nicht im Cache, wird sie beim Herunterladen blockweise geparst
+    (siehe stream_monthly_aggregates); mit end_year kann das Ergebnis dann vor dem Ende des Downloads vorliegen.
+    Netzwerkfehler werden als httpx.HTTPError weitergegeben.
+    """
+    if DLY_STREAMING and (cache.streaming(station_id) or not cache.has_entry(station_id)):
+        return await stream_monthly_aggregates(station_id, cache, store, end_year)
+    return await _load_cached(station_id, cache, store)
+
+
+async def _load_cached(station_id: str, cache: DlyCache, store: AggregateStore) -> MonthlyAggregates:
+    meta = await cache.ensure(station_id)
+    revision = meta.get("revision")
+    aggregates = await asyncio.to_thread(store.load, station_id, revision)
+    if aggregates is not None:
+        cache_event("aggregates", "hit")
+        return aggregates
+
+    cache_event("aggregates", "miss")
+    payload = meta.get("payload")
+    with stage("parse"):
+        if payload is not None:
+            aggregates = await run_cpu_bound(MonthlyAggregates.from_dly, payload)
+        else:
+            aggregates = await run_cpu_bound(aggregate_dly_file, cache.data_path(station_id), cache.memory_budget)
+    record_count(DLY_LINES, "lines", aggregates.lines)
+    await asyncio.to_thread(store.save, station_id, revision, aggregates)
+    return aggregates
+
+
+async def stream_monthly_aggregates(station_id: str, cache: DlyCache, store: AggregateStore,
+                                    end_year: Optional[int] = None) -> MonthlyAggregates:
+    """
+    Parst die .dly-Datei, während sie empfangen wird, statt den kompletten Body zu puffern.
+    Gleichzeitige Anfragen für dieselbe Station teilen sich Download und Parsen (siehe DlyCache.stream).
+    Da .dly-Dateien nach Jahr sortiert sind, steht das Ergebnis bereit, sobald eine Zeile nach
+    end_year empfangen wurde; der Download läuft dann im Hintergrund zu Ende, damit die Datei in
+    den Cache übernommen und ihre Aggregate gespeichert werden.
+    """
+    task, stream = cache.stream(station_id, lambda: _StreamedAggregates(station_id, store))
+    if stream is None:
+        # Für die Station läuft bereits ein gewöhnlicher Download
+        await asyncio.shield(task)
+        return await _load_cached(station_id, cache, store)
+    return await stream.result(task, end_year)
+
+
+class _StreamedAggregates:
+    """
+    Consumer für DlyCache.stream: aggregiert die empfangenen Blöcke und weckt wartende Anfragen
+    nach jedem Block, damit sie mit den bis dahin vollständigen Jahren antworten können.
+    Wartet keine Anfrage mehr, läuft der Rest des Downloads nur noch für den Cache weiter und gibt
+    seinen Platz der Zulassungskontrolle frei.
+    """
+
+    def __init__(self, station_id: str, store: AggregateStore):
+        self.station_id = station_id
+        self.store = store
+        self.last_year: Optional[int] = None
+        self.waiters = 0
+        self._accumulator = _MonthlyAccumulator()
+        self._release_slot = None
+        self._changed = asyncio.get_running_loop().create_future()
+
+    async def consume(self, download, release_slot) -> dict:
+        self._release_slot = release_slot
+        if self.waiters == 0:
+            release_slot()
+        # Blockweises Parsen wird als eine Phase "parse" gezählt
+        timer = stage("parse", accumulate=True)
+        try:
+            async for chunk in download.chunks():
+                lines = await asyncio.to_thread(download.feed, chunk)
+                with timer:
+                    await self._add(lines)
+            with timer:
+                await self._add(download.finish())
+        finally:
+            timer.finish()
+            record_count(DLY_LINES, "lines", self._accumulator.lines)
+        meta = await asyncio.to_thread(download.commit)
+        if meta["stored"]:
+            await asyncio.to_thread(self.store.save, self.station_id, meta["revision"], self._accumulator.aggregates)
+        return meta
+
+    async def result(self, task: asyncio.Future, end_year: Optional[int]) -> MonthlyAggregates:
+        """
+        Monatsaggregate, sobald eine Zeile nach end_year empfangen wurde (alle Jahre bis end_year
+        sind dann vollständig), sonst nach dem Ende des Downloads. Fehler werden weitergegeben.
+        """
+        self.waiters += 1
+        try:
+            while not task.done():
+                if end_year is not None and self.last_year is not None and self.last_year > end_year:
+                    return self._accumulator.aggregates
+                await asyncio.wait([task, self._changed], return_when=asyncio.FIRST_COMPLETED)
+            task.result()
+            return self._accumulator.aggregates
+        finally:
+            self.waiters -= 1
+            if self.waiters == 0 and self._release_slot is not None:
+                self._release_slot()
+
+    async def _add(self, lines: bytes) -> None:
+        if not lines:
+            return
+        self._accumulator.add(await run_cpu_bound(MonthlyAggregates.from_dly, lines))
+        last_line = lines[lines.rfind(b"\n", 0, len(lines) - 1) + 1:]
+        year = last_line[11:15]
+        if year.isdigit():
+            self.last_year = int(year)
+        changed, self._changed = self._changed, asyncio.get_running_loop().create_future()
+        changed.set_result(None)
+
+
+def aggregate_dly_file(path: str, block_bytes: int = DLY_MEMORY_BUDGET) -> MonthlyAggregates:
+    """
+    Liest und aggregiert eine .dly-Datei (läuft ggf. in einem Worker-Prozess).
+    Dateien über block_bytes werden in Blöcken aus vollständigen Zeilen gelesen und geparst,
+    damit der Speicherbedarf pro Anfrage begrenzt bleibt (0 = immer komplett).
+    """
+    with open(path, "rb") as f:
+        if block_bytes <= 0 or os.fstat(f.fileno()).st_size <= block_bytes:
+            return MonthlyAggregates.from_dly(f.read())
+
+        accumulator = _MonthlyAccumulator()
+        rest = b""
+        while block := f.read(block_bytes):
+            data = rest + block
+            cut = data.rfind(b"\n") + 1
+            rest = data[cut:]
+            accumulator.add(MonthlyAggregates.from_dly(data[:cut]))
+        accumulator.add(MonthlyAggregates.from_dly(rest))
+    aggregates = accumulator.aggregates
+    aggregates.lines = accumulator.lines
+    return aggregates
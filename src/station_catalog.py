@@ -0,0 +1,129 @@
+from typing import Optional
+import numpy as np
+from .station_index import StationIndex
+
+# Platzhalter für fehlende Inventar-Jahre in den int16-Spalten
+YEAR_MISSING = -1
+
+
+class StationCatalog:
+    """
+    Spaltenorientierter Stationskatalog (ALL_STATIONS).
+    Statt einer Liste von ~125k Dicts werden die Stationsdaten in zusammenhängenden
+    NumPy-Arrays gehalten:
+      - ids / names: Byte-Strings fester Breite (UTF-8)
+      - latitude / longitude: float64
+      - start_year / end_year: int16 (YEAR_MISSING, falls kein Inventar vorhanden)
+    Zusätzlich werden die nach station_id sortierte Zeilenreihenfolge (id_order, für die Suche per
+    np.searchsorted) sowie der räumliche StationIndex aufgebaut; beide können aus einem Snapshot
+    übernommen werden.
+    Die Zeilenreihenfolge entspricht der Reihenfolge in ghcnd-stations.csv.
+    """
+
+    def __init__(self, ids: np.ndarray, names: np.ndarray, latitude: np.ndarray, longitude: np.ndarray,
+                 start_year: np.ndarray, end_year: np.ndarray, index: Optional[StationIndex] = None,
+                 id_order: Optional[np.ndarray] = None):
+        self.ids = ids
+        self.names = names
+        self.latitude = latitude
+        self.longitude = longitude
+        self.start_year = start_year
+        self.end_year = end_year
+
+        # intp, da np.searchsorted einen 'sorter' anderen Typs bei jedem Aufruf kopiert
+        self.id_order = id_order if id_order is not None else np.argsort(ids, kind="stable").astype(np.intp)
+        self.index = index if index is not None else StationIndex(latitude, longitude, start_year, end_year)
+
+    @classmethod
+    def from_columns(cls, ids: list, names: list, latitude: list, longitude: list,
+                     start_year: list, end_year: list) -> "StationCatalog":
+        """
+        Baut den Katalog aus Python-Listen auf (z.B. direkt nach dem Parsen der CSV).
+        Fehlende Inventar-Jahre (None) werden als YEAR_MISSING abgelegt.
+        """
+        return cls(
+            ids=_to_bytes_array(ids),
+            names=_to_bytes_array(names),
+            latitude=np.asarray(latitude, dtype=np.float64),
+            longitude=np.asarray(longitude, dtype=np.float64),
+            start_year=np.asarray([YEAR_MISSING if y is None else y for y in start_year], dtype=np.int16),
+            end_year=np.asarray([YEAR_MISSING if y is None else y for y in end_year], dtype=np.int16),
+        )
+
+    @classmethod
+    def from_dicts(cls, stations: list) -> "StationCatalog":
+        """
+        Baut den Katalog aus einer Liste von Stations-Dicts im bisherigen ALL_STATIONS-Format auf.
+        """
+        return cls.from_columns(
+            ids=[st["id"] for st in stations],
+            names=[st["name"] for st in stations],
+            latitude=[st["latitude"] for st in stations],
+            longitude=[st["longitude"] for st in stations],
+            start_year=[st.get("inventory_start_year") for st in stations],
+            end_year=[st.get("inventory_end_year") for st in stations],
+        )
+
+    def covers_years(self, rows: np.ndarray, start_year: Optional[int], end_year: Optional[int]) -> np.ndarray:
+        """
+        Maske über 'rows': True, wenn das Inventar der Station den Zeitraum abdeckt
+        (Startjahr <= start_year bzw. Endjahr >= end_year; fehlendes Inventar zählt nie als Treffer).
+        """
+        mask = np.ones(len(rows), dtype=bool)
+        if start_year is not None:
+            starts = self.start_year[rows]
+            mask &= (starts != YEAR_MISSING) & (starts <= start_year)
+        if end_year is not None:
+            ends = self.end_year[rows]
+            mask &= (ends != YEAR_MISSING) & (ends >= end_year)
+        return mask
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, row: int) -> dict:
+        return self.station(row)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self.station(row)
+
+    def take(self, rows: np.ndarray) -> "StationCatalog":
+        """
+        Neuer Katalog aus den Zeilen 'rows' (in dieser Reihenfolge); der räumliche Index wird neu aufgebaut.
+        """
+        return StationCatalog(self.ids[rows], self.names[rows], self.latitude[rows], self.longitude[rows],
+                              self.start_year[rows], self.end_year[rows])
+
+    def find(self, station_id: str) -> Optional[int]:
+        """
+        Zeile der Station (binäre Suche über id_order) oder None, falls die ID unbekannt ist.
+        """
+        if len(self.ids) == 0:
+            return None
+        key = station_id.encode("utf-8")
+        pos = min(int(np.searchsorted(self.ids, key, sorter=self.id_order)), len(self.ids) - 1)
+        row = int(self.id_order[pos])
+        return row if self.ids[row] == key else None
+
+    def station(self, row: int, distance: float = 0.0) -> dict:
+        """
+        Liefert die Station in Zeile 'row' im bisherigen ALL_STATIONS-Dict-Format.
+        """
+        start_year = int(self.start_year[row])
+        end_year = int(self.end_year[row])
+        return {
+            "id": self.ids[row].decode(),
+            "name": self.names[row].decode(),
+            "latitude": float(self.latitude[row]),
+            "longitude": float(self.longitude[row]),
+            "distance": distance,
+            "inventory_start_year": None if start_year == YEAR_MISSING else start_year,
+            "inventory_end_year": None if end_year == YEAR_MISSING else end_year,
+        }
+
+
+def _to_bytes_array(values: list) -> np.ndarray:
+    encoded = [v.encode("utf-8") for v in values]
+    width = max((len(v) for v in encoded), default=1) or 1
+    return np.array(encoded, dtype=f"S{width}")
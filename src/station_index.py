@@ -0,0 +1,177 @@
+import heapq
+import math
+from typing import Optional
+import numpy as np
+from .geo import EARTH_RADIUS_KM
+
+# Kantenlänge einer Gitterzelle in Grad. 1° entspricht ca. 111 km in Nord-Süd-Richtung,
+# übliche Suchradien (10 - 500 km) treffen damit nur wenige Zellen.
+DEFAULT_CELL_SIZE_DEG = 1.0
+
+# Platzhalter für fehlende Inventar-Jahre (muss YEAR_MISSING im StationCatalog entsprechen)
+_YEAR_MISSING = -1
+_INT16_MAX = np.iinfo(np.int16).max
+
+
+class StationIndex:
+    """
+    Räumlicher Index (Lat/Lon-Gitter) über die Zeilen des StationCatalog.
+    Die Zeilennummern werden beim Aufbau einmalig nach Gitterzelle sortiert (CSR-Layout:
+    'order' + 'cell_start'). Eine Umkreissuche liefert nur die Zeilen der Zellen, die die
+    Bounding-Box des Suchkreises schneiden; zusammenhängende Längengrad-Bereiche eines
+    Breitenbands liegen dabei als ein einziger Slice vor.
+    Pro Zelle werden außerdem das früheste Inventar-Startjahr und das späteste Endjahr
+    gespeichert, sodass Zellen ohne passende Station bei einem Jahresfilter übersprungen werden.
+    """
+
+    def __init__(self, latitude: np.ndarray, longitude: np.ndarray, start_year: np.ndarray, end_year: np.ndarray,
+                 cell_size_deg: float = DEFAULT_CELL_SIZE_DEG):
+        self.cell_size = cell_size_deg
+        self.n_lat_cells = int(math.ceil(180.0 / cell_size_deg))
+        self.n_lon_cells = int(math.ceil(360.0 / cell_size_deg))
+        self.size = len(latitude)
+
+        lat_cells = np.clip(np.floor((latitude + 90.0) / cell_size_deg), 0, self.n_lat_cells - 1).astype(np.int64)
+        lon_cells = np.floor((longitude + 180.0) / cell_size_deg).astype(np.int64) % self.n_lon_cells
+        cell_ids = lat_cells * self.n_lon_cells + lon_cells
+
+        self.order = np.argsort(cell_ids, kind="stable").astype(np.int32)
+        self.cell_start = np.searchsorted(
+            cell_ids[self.order], np.arange(self.n_lat_cells * self.n_lon_cells + 1)
+        ).astype(np.int32)
+
+        # Jahres-Intervall je Zelle; fehlende Startjahre zählen als "nie", damit sie das Minimum nicht verfälschen
+        n_cells = self.n_lat_cells * self.n_lon_cells
+        self.cell_min_start = np.full(n_cells, _INT16_MAX, dtype=np.int16)
+        self.cell_max_end = np.full(n_cells, _YEAR_MISSING, dtype=np.int16)
+        non_empty = np.flatnonzero(self.cell_start[1:] > self.cell_start[:-1])
+        if len(non_empty):
+            sorted_start = np.where(start_year == _YEAR_MISSING, _INT16_MAX, start_year)[self.order]
+            sorted_end = np.asarray(end_year)[self.order]
+            seg_starts = self.cell_start[non_empty]
+            self.cell_min_start[non_empty] = np.minimum.reduceat(sorted_start, seg_starts)
+            self.cell_max_end[non_empty] = np.maximum.reduceat(sorted_end, seg_starts)
+
+    @classmethod
+    def from_arrays(cls, order: np.ndarray, cell_start: np.ndarray, cell_min_start: np.ndarray,
+                    cell_max_end: np.ndarray, cell_size_deg: float) -> "StationIndex":
+        """
+        Stellt einen bereits aufgebauten Index wieder her (z.B. aus dem Katalog-Snapshot),
+        ohne die Zellzuordnung neu zu berechnen.
+        """
+        index = cls.__new__(cls)
+        index.cell_size = cell_size_deg
+        index.n_lat_cells = int(math.ceil(180.0 / cell_size_deg))
+        index.n_lon_cells = int(math.ceil(360.0 / cell_size_deg))
+        index.size = len(order)
+        index.order = order
+        index.cell_start = cell_start
+        index.cell_min_start = cell_min_start
+        index.cell_max_end = cell_max_end
+        return index
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _lat_cell(self, lat: float) -> int:
+        return min(max(int(math.floor((lat + 90.0) / self.cell_size)), 0), self.n_lat_cells - 1)
+
+    def _lon_ranges(self, lat: float, lon: float, angular: float, lat_min: float, lat_max: float) -> list:
+        """
+        Liefert die Längengrad-Zellbereiche [first, last) des Suchkreises.
+        Schließt der Kreis einen Pol ein, wird das gesamte Breitenband durchsucht.
+        """
+        full = [(0, self.n_lon_cells)]
+        if lat_min <= -90.0 or lat_max >= 90.0:
+            return full
+
+        ratio = math.sin(angular) / math.cos(math.radians(lat))
+        if ratio >= 1.0:
+            return full
+
+        d_lon = math.degrees(math.asin(ratio))
+        first = int(math.floor((lon - d_lon + 180.0) / self.cell_size))
+        last = int(math.floor((lon + d_lon + 180.0) / self.cell_size)) + 1
+        if last - first >= self.n_lon_cells:
+            return full
+
+        length = last - first
+        first %= self.n_lon_cells
+        last = first + length
+        if last <= self.n_lon_cells:
+            return [(first, last)]
+        # Bereich läuft über die Datumsgrenze
+        return [(first, self.n_lon_cells), (0, last - self.n_lon_cells)]
+
+    def candidates(self, lat: float, lon: float, radius_km: float,
+                   start_year: Optional[int] = None, end_year: Optional[int] = None) -> np.ndarray:
+        """
+        Zeilennummern aller Stationen in Gitterzellen, die den Suchkreis berühren können.
+        Bei einem Jahresfilter werden Zellen übersprungen, in denen keine Station das
+        Intervall [start_year, end_year] abdecken kann. Der Filter auf Stationsebene
+        erfolgt anschließend im Aufrufer.
+        Negative Radien und nicht endliche Koordinaten treffen (wie beim linearen Durchlauf) keine Station.
+        """
+        if not radius_km >= 0 or not math.isfinite(lat) or not math.isfinite(lon):
+            return self.order[:0]
+        angular = radius_km / EARTH_RADIUS_KM
+        if angular >= math.pi:
+            lat_cells = range(self.n_lat_cells)
+            lon_ranges = [(0, self.n_lon_cells)]
+        else:
+            d_lat = math.degrees(angular)
+            lat_min = lat - d_lat
+            lat_max = lat + d_lat
+            lat_cells = range(self._lat_cell(lat_min), self._lat_cell(lat_max) + 1)
+            lon_ranges = self._lon_ranges(lat, lon, angular, lat_min, lat_max)
+
+        if start_year is None and end_year is None:
+            if angular >= math.pi:
+                return self.order
+            slices = []
+            for la in lat_cells:
+                base = la * self.n_lon_cells
+                for first, last in lon_ranges:
+                    start = self.cell_start[base + first]
+                    end = self.cell_start[base + last]
+                    if end > start:
+                        slices.append(self.order[start:end])
+            if not slices:
+                return self.order[:0]
+            return np.concatenate(slices)
+
+        ranges = [np.arange(la * self.n_lon_cells + first, la * self.n_lon_cells + last)
+                  for la in lat_cells for first, last in lon_ranges]
+        if not ranges:
+            return self.order[:0]
+        cells = np.concatenate(ranges)
+        keep = np.ones(len(cells), dtype=bool)
+        if start_year is not None:
+            keep &= self.cell_min_start[cells] <= start_year
+        if end_year is not None:
+            keep &= self.cell_max_end[cells] >= end_year
+        cells = cells[keep]
+        return self._gather(self.cell_start[cells], self.cell_start[cells + 1])
+
+    def _gather(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """
+        Verkettet order[starts[i]:ends[i]] für alle i ohne Python-Schleife.
+        """
+        lengths = (ends - starts).astype(np.int64)
+        total = int(lengths.sum())
+        if total == 0:
+            return self.order[:0]
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.arange(total) - np.repeat(offsets, lengths) + np.repeat(starts.astype(np.int64), lengths)
+        return self.order[positions]
+
+
+def select_nearest(hits: list, count: int) -> list:
+    """
+    Wählt aus (distanz, position)-Tupeln die 'count' nächsten aus.
+    Für count > 0 wird ein begrenzter Heap verwendet; ansonsten gilt die Slice-Semantik von results[:count].
+    """
+    if count > 0:
+        return heapq.nsmallest(count, hits)
+    hits.sort()
+    return hits[:count]
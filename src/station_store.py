@@ -0,0 +1,72 @@
+import os
+from typing import Optional
+import numpy as np
+from .dly_cache import _STATION_ID_PATTERN
+from .station_aggregates import ELEMENTS, MonthlyAggregates
+
+# Verzeichnis des lokalen Stationsspeichers (befüllt über ingest.py); leer = nicht verwenden
+STATION_STORE_DIR = os.environ.get("STATION_STORE_DIR", "")
+
+STORE_FORMAT_VERSION = 2
+STORE_SUFFIX = ".npz"
+
+
+class StationStore:
+    """
+    Lokaler, spaltenorientierter Speicher der Monatsaggregate (ELEMENTS) aller Stationen,
+    z.B. aus dem kompletten ghcnd_all.tar.gz (siehe ingest.py).
+    Partitioniert nach Länderkennung (die ersten zwei Zeichen der station_id):
+      <directory>/<CC>/<station_id>.npz  mit first_year, sums [Jahr, Monat, Element], counts
+    Jede Datei enthält die komplette Station; Zeiträume werden wie bei NOAA-Daten
+    über MonthlyAggregates.to_station_data ausgewählt.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path_for(self, station_id: str) -> str:
+        return os.path.join(self.directory, station_id[:2], f"{station_id}{STORE_SUFFIX}")
+
+    def load(self, station_id: str) -> Optional[MonthlyAggregates]:
+        """
+        Monatsaggregate der Station oder None, falls sie nicht (oder in einem alten Format) vorliegt.
+        """
+        if not _STATION_ID_PATTERN.match(station_id):
+            return None
+        try:
+            with np.load(self.path_for(station_id)) as data:
+                if int(data["format"]) != STORE_FORMAT_VERSION or tuple(data["elements"]) != ELEMENTS:
+                    return None
+                return MonthlyAggregates(int(data["first_year"]), data["sums"], data["counts"])
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def save(self, station_id: str, aggregates: MonthlyAggregates) -> None:
+        # Wie in load: nur gültige IDs als Dateinamen, sonst könnte z.B. ".." außerhalb des Speichers schreiben
+        if not _STATION_ID_PATTERN.match(station_id):
+            raise ValueError(f"Ungültige Stations-ID: {station_id!r}")
+        path = self.path_for(station_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, format=STORE_FORMAT_VERSION, elements=np.array(ELEMENTS),
+                     first_year=aggregates.first_year, sums=aggregates.sums, counts=aggregates.counts)
+        os.replace(tmp_path, path)
+
+
+def ingest_dly(directory: str, station_id: str, payload: bytes) -> int:
+    """
+    Parst eine .dly-Datei und legt ihre Monatsaggregate im Speicher ab (läuft in Worker-Prozessen).
+    Rückgabe: Anzahl der verarbeiteten Bytes.
+    """
+    StationStore(directory).save(station_id, MonthlyAggregates.from_dly(payload))
+    return len(payload)
+
+
+def ingest_dly_file(directory: str, path: str) -> int:
+    with open(path, "rb") as f:
+        payload = f.read()
+    return ingest_dly(directory, os.path.basename(path)[:-len(".dly")], payload)
+
+
+station_store = StationStore(STATION_STORE_DIR) if STATION_STORE_DIR else None
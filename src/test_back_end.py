@@ -1,13 +1,25 @@
+import asyncio
+import pytest
+from src.tests.ghcn_fixtures import GhcnStubServer, make_dly, make_inventory, make_station_list, make_stations_csv
+from src.dly_cache import DlyCache
 from src import fetch_stations_query, get_stations_in_radius, get_station_data_from_ghcn
-from src import load_station_data
-from src.load_station_inventory import load_station_inventory
+from src import StationCatalog
+from src.catalog_snapshot import build_catalog_snapshot
+
+
+def _load_catalog(tmp_path) -> tuple:
+    """
+    Lädt Stationsliste und Inventar wie beim Serverstart von NOAA; liefert (catalog, header).
+    """
+    return asyncio.run(build_catalog_snapshot(str(tmp_path / "station_catalog.bin")))
 
 # =============================
 # Tests für fetch_stations_query
 # =============================
 
-def test_fetch_stations_query():
-    result = fetch_stations_query(52.166, 20.967, 10, 1, load_station_data())
+def test_fetch_stations_query(tmp_path):
+    catalog, _ = _load_catalog(tmp_path)
+    result = fetch_stations_query(52.166, 20.967, 10, 1, catalog)
     assert len(result) > 0, "Es sollten Stationsdaten aus dem Backend zurückkommen"
     assert any(station["id"] == "PLM00012375" for station in result), "PLM00012375 sollte in den API-Daten enthalten sein"
 
@@ -15,8 +27,9 @@ def test_fetch_stations_query():
 # Tests für get_stations_in_radius
 # =============================
 
-def test_get_stations_in_radius():
-    result = get_stations_in_radius(load_station_data(), 52.166, 20.967, 10, 2)
+def test_get_stations_in_radius(tmp_path):
+    catalog, _ = _load_catalog(tmp_path)
+    result = get_stations_in_radius(catalog, 52.166, 20.967, 10, 2)
     assert len(result) > 0
 
 # =============================
@@ -24,51 +37,58 @@ def test_get_stations_in_radius():
 # =============================
 
 def test_get_station_data_north():
-    result = get_station_data_from_ghcn("PLM00012375", "2000", "2010", 52.166)
+    result = asyncio.run(get_station_data_from_ghcn("PLM00012375", "2000", "2010", 52.166))
     assert "data" in result
     assert isinstance(result["data"], list)
     assert len(result["data"]) > 0
 
 def test_get_station_data_south():
-    result = get_station_data_from_ghcn("ZI000067775", "2000", "2010", -17.917)
+    result = asyncio.run(get_station_data_from_ghcn("ZI000067775", "2000", "2010", -17.917))
     assert "data" in result
     assert isinstance(result["data"], list)
     assert len(result["data"]) > 0
 
 # =============================
-# Tests für load_station_data
+# Tests für das Laden der Stationsliste (build_catalog_snapshot)
 # =============================
 
-def test_load_station_data():
-    result = load_station_data()
-    assert len(result) > 0
+def test_load_station_data(tmp_path):
+    catalog, _ = _load_catalog(tmp_path)
+    assert len(catalog) > 0
 
-def test_load_station_data_valid():
-    result = load_station_data()
-    assert len(result) > 0
-    assert "id" in result[0]
+def test_load_station_data_valid(tmp_path):
+    catalog, _ = _load_catalog(tmp_path)
+    assert len(catalog) > 0
+    assert "id" in catalog[0]
 
-def test_load_station_data_invalid():
-    result = load_station_data()
-    assert isinstance(result, list)
+def test_load_station_data_invalid(tmp_path):
+    catalog, header = _load_catalog(tmp_path)
+    assert isinstance(catalog, StationCatalog)
+    assert (tmp_path / "station_catalog.bin").exists() and "stations" in header
 
 # =============================
-# Tests für load_station_inventory
+# Tests für das Inventar (Jahre im Katalog)
 # =============================
 
-def test_load_station_inventory():
-    result = load_station_inventory()
-    assert "PLM00012375" in result or "ZI000067775" in result
-    if "PLM00012375" in result:
-        assert result["PLM00012375"]["start_year"] <= 2000
-        assert result["PLM00012375"]["end_year"] >= 2010
-    if "ZI000067775" in result:
-        assert result["ZI000067775"]["start_year"] <= 2000
-        assert result["ZI000067775"]["end_year"] >= 2010
+def test_load_station_inventory(tmp_path):
+    catalog, _ = _load_catalog(tmp_path)
+    rows = {station_id: catalog.find(station_id) for station_id in ("PLM00012375", "ZI000067775")}
+    assert any(row is not None for row in rows.values())
+    for row in rows.values():
+        if row is not None:
+            assert catalog[row]["inventory_start_year"] <= 2000
+            assert catalog[row]["inventory_end_year"] >= 2010
 
-def test_load_station_inventory_invalid():
-    result = load_station_inventory()
-    assert isinstance(result, dict)
+def test_load_station_inventory_invalid(tmp_path, monkeypatch):
+    from src import catalog_snapshot
+    stations = make_station_list(20, seed=5)
+    # Ohne Inventar (404) wird der Katalog trotzdem aufgebaut, nur ohne Jahresangaben
+    with GhcnStubServer({"/ghcnd-stations.csv": make_stations_csv(stations)}) as server:
+        monkeypatch.setattr(catalog_snapshot, "STATIONS_CSV_URL", server.base_url + "/ghcnd-stations.csv")
+        monkeypatch.setattr(catalog_snapshot, "INVENTORY_URL", server.base_url + "/ghcnd-inventory.txt")
+        catalog, header = _load_catalog(tmp_path)
+    assert len(catalog) == 20 and header["inventory"] == {}
+    assert catalog[0]["inventory_start_year"] is None
 
 # =============================
 # Test für leere Stationsliste
@@ -76,4 +96,801 @@ def test_load_station_inventory_invalid():
 
 def test_fetch_stations_query_empty():
     result = fetch_stations_query(52.166, 20.967, 10, 1, [])
-    assert result == []
\ No newline at end of file
+    assert result == []
+
+# =============================
+# Tests für StationIndex (offline, synthetische Stationen)
+# =============================
+
+def _synthetic_stations(n: int = 5000, seed: int = 42) -> list:
+    import random
+    rnd = random.Random(seed)
+    stations = []
+    for i in range(n):
+        stations.append({
+            "id": f"SY{i:09d}",
+            "name": f"STATION {i}",
+            "latitude": round(rnd.uniform(-90, 90), 4),
+            "longitude": round(rnd.uniform(-180, 180), 4),
+            "distance": 0.0,
+            "inventory_start_year": rnd.randint(1850, 2000) if i % 7 else None,
+            "inventory_end_year": rnd.randint(2000, 2025),
+        })
+    return stations
+
+
+def _linear_reference(stations: list, lat: float, lon: float, radius: float, count: int) -> list:
+    from src.geo import haversine_distance
+    results = []
+    for st in stations:
+        dist = haversine_distance(lat, lon, st["latitude"], st["longitude"])
+        if dist <= radius:
+            st_copy = st.copy()
+            st_copy["distance"] = round(dist, 2)
+            results.append(st_copy)
+    results.sort(key=lambda s: s["distance"])
+    return results[:count]
+
+
+def test_station_index_matches_linear_scan():
+    stations = _synthetic_stations()
+    catalog = StationCatalog.from_dicts(stations)
+    queries = [
+        (52.166, 20.967, 500, 10),
+        (0.0, 179.9, 800, 25),      # Datumsgrenze
+        (89.5, 10.0, 300, 50),      # Nordpol im Suchkreis
+        (-88.0, -45.0, 1000, 5),    # Südpol im Suchkreis
+        (10.0, 10.0, 25000, 3),     # gesamte Erde
+        (45.0, 45.0, 50, 0),
+    ]
+    for lat, lon, radius, count in queries:
+        expected = _linear_reference(stations, lat, lon, radius, count)
+        assert get_stations_in_radius(catalog, lat, lon, radius, count) == expected
+
+
+def test_station_index_invalid_query():
+    nan = float("nan")
+    catalog = StationCatalog.from_dicts(_synthetic_stations(200))
+    for lat, lon, radius in ((10.0, 10.0, -5), (10.0, 10.0, nan), (nan, 10.0, 500), (10.0, float("inf"), 500)):
+        assert get_stations_in_radius(catalog, lat, lon, radius, 3) == []
+
+
+def test_station_index_tie_order():
+    stations = [
+        {"id": "A", "name": "A", "latitude": 1.0, "longitude": 1.0, "distance": 0.0,
+         "inventory_start_year": None, "inventory_end_year": None},
+        {"id": "B", "name": "B", "latitude": 1.0, "longitude": 1.0, "distance": 0.0,
+         "inventory_start_year": None, "inventory_end_year": None},
+        {"id": "C", "name": "C", "latitude": 1.0, "longitude": 1.0, "distance": 0.0,
+         "inventory_start_year": None, "inventory_end_year": None},
+    ]
+    result = get_stations_in_radius(StationCatalog.from_dicts(stations), 1.0, 1.0, 1, 2)
+    assert [st["id"] for st in result] == ["A", "B"]
+
+
+def test_station_catalog_roundtrip():
+    stations = _synthetic_stations(100)
+    catalog = StationCatalog.from_dicts(stations)
+    assert len(catalog) == 100
+    assert catalog[5] == stations[5]
+    assert catalog.find(stations[42]["id"]) == 42
+    assert catalog.find("UNKNOWN") is None
+    # Präfixe, zu lange IDs und IDs hinter der letzten Station werden nicht gefunden
+    assert catalog.find(stations[42]["id"][:-1]) is None and catalog.find(stations[42]["id"] + "0") is None
+    assert catalog.find("ZZZZZZZZZZZZZZZZ") is None and catalog.find("") is None
+    assert all(catalog.find(st["id"]) == row for row, st in enumerate(stations))
+    assert StationCatalog.from_dicts([]).find("A") is None
+    assert catalog.start_year.dtype.name == "int16"
+
+
+# =============================
+# Tests für den Katalog-Snapshot
+# =============================
+
+def test_catalog_snapshot_roundtrip(tmp_path):
+    from src.catalog_snapshot import write_catalog_snapshot, read_catalog_snapshot
+    stations = _synthetic_stations(500)
+    catalog = StationCatalog.from_dicts(stations)
+    path = str(tmp_path / "catalog.bin")
+    write_catalog_snapshot(catalog, {"stations": {"etag": '"abc"'}}, path)
+
+    loaded, header = read_catalog_snapshot(path)
+    assert header["stations"]["etag"] == '"abc"'
+    assert len(loaded) == 500
+    assert loaded[123] == stations[123]
+    assert loaded.find(stations[7]["id"]) == 7
+    # Die Sortierung nach ID kommt aus dem Snapshot und wird nicht je Worker neu aufgebaut
+    assert not loaded.id_order.flags.writeable
+    assert (get_stations_in_radius(loaded, 10.0, 10.0, 2000, 5)
+            == get_stations_in_radius(catalog, 10.0, 10.0, 2000, 5))
+
+
+def test_catalog_snapshot_refresh_not_modified(tmp_path, monkeypatch):
+    from src import catalog_snapshot
+
+    class NotModified:
+        status_code = 304
+
+    requested = []
+
+    async def fake_get(url, validators):
+        requested.append(validators)
+        return NotModified()
+
+    path = str(tmp_path / "catalog.bin")
+    header = {"created": 1.0, "stations": {"etag": '"s1"'}, "inventory": {"etag": '"i1"'}}
+    monkeypatch.setattr(catalog_snapshot, "_conditional_get", fake_get)
+    assert asyncio.run(catalog_snapshot.refresh_catalog_snapshot(header, path)) is None
+    assert requested == [{"etag": '"s1"'}, {"etag": '"i1"'}]
+
+
+def test_catalog_snapshot_refresh_compares_content(tmp_path, monkeypatch):
+    from src import catalog_snapshot
+
+    class FakeResponse:
+        def __init__(self, text, etag):
+            self.status_code = 200
+            self.text = text
+            self.content = text.encode()
+            self.headers = {"ETag": etag}
+
+    stations_csv = "AA000000001,10.0,20.0,5.0,,FIRST\nAA000000002,11.0,21.0,5.0,,SECOND\n"
+    files = {
+        catalog_snapshot.STATIONS_CSV_URL: FakeResponse(stations_csv, '"s2"'),
+        catalog_snapshot.INVENTORY_URL: FakeResponse("", '"i2"'),
+    }
+    parsed = []
+
+    async def fake_get(url, validators):
+        return files[url]
+
+    def parse(lines, inventory):
+        parsed.append(len(lines))
+        return parse_station_data(lines, inventory)
+
+    parse_station_data = catalog_snapshot.parse_station_data
+    path = str(tmp_path / "catalog.bin")
+    monkeypatch.setattr(catalog_snapshot, "_conditional_get", fake_get)
+    monkeypatch.setattr(catalog_snapshot, "parse_station_data", parse)
+    catalog, header = asyncio.run(catalog_snapshot.refresh_catalog_snapshot({"created": 1.0}, path))
+    assert header["stations"]["etag"] == '"s2"'
+    assert [st["id"] for st in catalog] == ["AA000000001", "AA000000002"]
+
+    # Gleicher Inhalt trotz 200: kein erneutes Parsen, der bisherige Katalog bleibt
+    assert asyncio.run(catalog_snapshot.refresh_catalog_snapshot(header, path)) is None
+    assert parsed == [2]
+
+    files[catalog_snapshot.STATIONS_CSV_URL] = FakeResponse(
+        "AA000000003,12.0,22.0,5.0,,THIRD\n" + stations_csv.replace("21.0", "21.5"), '"s3"')
+    catalog, header = asyncio.run(catalog_snapshot.refresh_catalog_snapshot(header, path))
+    assert [st["id"] for st in catalog] == ["AA000000003", "AA000000001", "AA000000002"]
+    assert catalog[2]["longitude"] == 21.5 and header["stations"]["etag"] == '"s3"'
+    on_disk, _ = catalog_snapshot.read_catalog_snapshot(path)
+    assert list(on_disk) == list(catalog)
+
+
+def test_catalog_snapshot_missing_or_invalid(tmp_path):
+    from src.catalog_snapshot import read_catalog_snapshot
+    assert read_catalog_snapshot(str(tmp_path / "missing.bin")) is None
+    broken = tmp_path / "broken.bin"
+    broken.write_bytes(b"not a snapshot")
+    assert read_catalog_snapshot(str(broken)) is None
+
+
+# =============================
+# Tests für den Jahresfilter in der räumlichen Suche
+# =============================
+
+def _year_filtered_reference(stations, lat, lon, radius, count, start_year, end_year):
+    filtered = []
+    for st in stations:
+        if start_year is not None:
+            if st["inventory_start_year"] is None or st["inventory_start_year"] > start_year:
+                continue
+        if end_year is not None:
+            if st["inventory_end_year"] is None or st["inventory_end_year"] < end_year:
+                continue
+        filtered.append(st)
+    return _linear_reference(filtered, lat, lon, radius, count)
+
+
+def test_stations_in_radius_year_filter():
+    stations = _synthetic_stations()
+    catalog = StationCatalog.from_dicts(stations)
+    queries = [
+        (52.166, 20.967, 1500, 10, 1900, 2020),
+        (0.0, -179.5, 2000, 20, 1950, None),
+        (89.0, 0.0, 800, 5, None, 2024),
+        (10.0, 10.0, 25000, 15, 1860, 2010),
+    ]
+    for lat, lon, radius, count, sy, ey in queries:
+        expected = _year_filtered_reference(stations, lat, lon, radius, count, sy, ey)
+        assert get_stations_in_radius(catalog, lat, lon, radius, count, sy, ey) == expected
+        assert fetch_stations_query(lat, lon, radius, count, catalog, sy, ey) == expected
+
+
+def test_stations_in_radius_year_filter_no_match():
+    catalog = StationCatalog.from_dicts(_synthetic_stations(200))
+    assert get_stations_in_radius(catalog, 0.0, 0.0, 25000, 10, 1700, None) == []
+
+
+def test_stations_in_radius_year_filter_invalid_radius():
+    stations = _synthetic_stations()
+    catalog = StationCatalog.from_dicts(stations)
+    assert get_stations_in_radius(catalog, 10.0, 10.0, -5, 3, 1950, 2000) == []
+    assert get_stations_in_radius(catalog, 10.0, 10.0, float("nan"), 3, 1950, 2000) == []
+    assert fetch_stations_query(10.0, 10.0, -5, 3, catalog, 1950, 2000) == []
+    # Radius 0 trifft nur Stationen genau am Suchpunkt
+    station = next(st for st in stations if (st["inventory_start_year"] or 9999) <= 1950)
+    result = get_stations_in_radius(catalog, station["latitude"], station["longitude"], 0, 3, 1950, 2000)
+    assert result == _year_filtered_reference(stations, station["latitude"], station["longitude"], 0, 3, 1950, 2000)
+    assert [st["id"] for st in result] == [station["id"]]
+
+
+def test_query_cache_lru_and_ttl(monkeypatch):
+    from src import query_cache
+    from src.query_cache import QueryCache, cached_stations_query
+    catalog = StationCatalog.from_dicts(_synthetic_stations(200))
+    cache = QueryCache(max_entries=2, ttl=60)
+    body = cached_stations_query(10.0, 10.0, 2000, 5, catalog, cache=cache)
+    assert body == cached_stations_query(10.000001, 10.0, 2000, 5, catalog, cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cached_stations_query(20.0, 20.0, 2000, 5, catalog, cache=cache)
+    cached_stations_query(30.0, 30.0, 2000, 5, catalog, cache=cache)
+    assert cache.stats()["entries"] == 2 and cache.evictions == 1
+
+    now = query_cache.time.monotonic()
+    monkeypatch.setattr(query_cache.time, "monotonic", lambda: now + 61)
+    cached_stations_query(30.0, 30.0, 2000, 5, catalog, cache=cache)
+    assert cache.misses == 4
+
+
+# =============================
+# Tests für den .dly-Cache (lokaler NOAA-Ersatz)
+# =============================
+
+@pytest.fixture
+def ghcn(tmp_path):
+    """
+    Startet einen GhcnStubServer mit den übergebenen Dateien und liefert (server, cache) mit einem
+    DlyCache in tmp_path; die Server werden nach dem Test beendet.
+    Verwendung: server, cache = ghcn({"/all/X.dly": payload}, delay=0.2, chunk_size=1000)
+    """
+    servers = []
+
+    def start(files: dict, delay: float = 0.0, **cache_options):
+        server = GhcnStubServer(files, delay=delay).__enter__()
+        servers.append(server)
+        return server, DlyCache(str(tmp_path), server.base_url + "/all", **cache_options)
+
+    yield start
+    for server in servers:
+        server.__exit__(None, None, None)
+
+
+def test_dly_cache_hit_and_revalidation(ghcn):
+    payload = make_dly("PLM00012375", 2000, 2002)
+    server, cache = ghcn({"/all/PLM00012375.dly": payload}, max_age=3600)
+    assert asyncio.run(cache.fetch("PLM00012375")) == payload
+    assert asyncio.run(cache.fetch("PLM00012375")) == payload
+    assert server.count("/all/PLM00012375.dly") == 1
+
+    # Abgelaufene Einträge werden per ETag revalidiert (304, kein erneuter Body)
+    cache.max_age = 0
+    assert asyncio.run(cache.fetch("PLM00012375")) == payload
+    assert server.count("/all/PLM00012375.dly") == 2
+
+
+def test_dly_cache_coalesces_concurrent_requests(ghcn):
+    payload = make_dly("PLM00012375", 2000, 2001)
+    server, cache = ghcn({"/all/PLM00012375.dly": payload}, delay=0.2)
+
+    async def fetch_all():
+        return await asyncio.gather(*(cache.fetch("PLM00012375") for _ in range(8)))
+
+    results = asyncio.run(fetch_all())
+    assert all(r == payload for r in results)
+    assert server.count("/all/PLM00012375.dly") == 1
+
+
+def test_dly_cache_downloads_run_concurrently(ghcn):
+    import time
+    files = {f"/all/ST{i:09d}.dly": make_dly(f"ST{i:09d}", 2000, 2000, seed=i) for i in range(4)}
+    _, cache = ghcn(files, delay=0.3)
+
+    async def fetch_all():
+        return await asyncio.gather(*(cache.fetch(f"ST{i:09d}") for i in range(4)))
+
+    started = time.perf_counter()
+    results = asyncio.run(fetch_all())
+    elapsed = time.perf_counter() - started
+    assert results == list(files.values())
+    # Vier Downloads à 0.3 s dürfen sich nicht gegenseitig blockieren
+    assert elapsed < 0.9
+
+
+def test_upstream_admission_rejects_when_queue_full(tmp_path, ghcn):
+    from fastapi import HTTPException
+    from src.admission import AdmissionLimiter
+    files = {f"/all/ST{i:09d}.dly": make_dly(f"ST{i:09d}", 2000, 2000, seed=i) for i in range(3)}
+    admission = AdmissionLimiter(max_concurrent=1, max_queue=1, queue_timeout=5, retry_after=7)
+    _, cache = ghcn(files, delay=0.3, admission=admission)
+
+    async def fetch_all():
+        return await asyncio.gather(*(get_station_data_from_ghcn(f"ST{i:09d}", "2000", "2000", cache=cache)
+                                      for i in range(3)), return_exceptions=True)
+
+    results = asyncio.run(fetch_all())
+    rejected = [r for r in results if isinstance(r, HTTPException)]
+    assert len(rejected) == 1 and rejected[0].status_code == 503
+    assert rejected[0].headers["Retry-After"] == "7"
+    assert sum(isinstance(r, dict) for r in results) == 2
+    assert admission.active == 0 and admission.queued == 0
+
+    # Abgelaufene Wartezeit führt ebenfalls zur Ablehnung, der Platz bleibt korrekt gezählt
+    async def timeout_in_queue():
+        limiter = AdmissionLimiter(max_concurrent=1, max_queue=4, queue_timeout=0.05)
+        async with limiter.slot():
+            with pytest.raises(Exception) as exc:
+                await limiter.acquire()
+        return limiter, exc.type.__name__
+
+    limiter, error = asyncio.run(timeout_in_queue())
+    assert error == "UpstreamOverloaded" and limiter.active == 0
+
+
+def test_dly_memory_budget_spills_to_cache_file(ghcn):
+    from src.station_aggregates import MonthlyAggregates, aggregate_dly_file
+    payload = make_dly("PLM00012375", 1990, 2005)
+    expected = MonthlyAggregates.from_dly(payload)
+    _, cache = ghcn({"/all/PLM00012375.dly": payload}, memory_budget=len(payload) // 4)
+    meta = asyncio.run(cache.ensure("PLM00012375"))
+    assert meta["stored"] and "payload" not in meta
+    assert asyncio.run(cache.fetch("PLM00012375")) == payload
+
+    # Blockweises Parsen der Cache-Datei liefert dieselben Monatsaggregate
+    aggregates = aggregate_dly_file(cache.data_path("PLM00012375"), block_bytes=len(payload) // 7)
+    assert aggregates.first_year == expected.first_year
+    assert (aggregates.sums == expected.sums).all() and (aggregates.counts == expected.counts).all()
+    assert aggregates.lines == payload.count(b"\n")
+
+
+def test_dly_cache_lru_eviction(tmp_path, ghcn):
+    import os
+    import time
+    files = {f"/all/ST{i:09d}.dly": make_dly(f"ST{i:09d}", 2000, 2000, seed=i) for i in range(3)}
+    size = len(next(iter(files.values())))
+    _, cache = ghcn(files, max_bytes=2 * size)
+    asyncio.run(cache.fetch("ST000000000"))
+    time.sleep(0.01)
+    asyncio.run(cache.fetch("ST000000001"))
+    time.sleep(0.01)
+    asyncio.run(cache.fetch("ST000000000"))  # ST0 ist jetzt der zuletzt genutzte Eintrag
+    time.sleep(0.01)
+    asyncio.run(cache.fetch("ST000000002"))
+    cached = sorted(name for name in os.listdir(tmp_path) if name.endswith(".dly"))
+    assert cached == ["ST000000000.dly", "ST000000002.dly"]
+
+
+def test_station_data_unknown_station_is_404(ghcn):
+    from fastapi import HTTPException
+    _, cache = ghcn({})
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(get_station_data_from_ghcn("XX000000000", "2000", "2001", cache=cache))
+    with pytest.raises(HTTPException):
+        asyncio.run(get_station_data_from_ghcn("../etc/passwd", "2000", "2001", cache=cache))
+    assert exc.value.status_code == 404
+
+
+# =============================
+# Tests für die Monatsaggregate (Jahres-/Jahreszeitenmittel)
+# =============================
+
+def _dly_line(station_id: str, year: int, month: int, element: str, values: list) -> str:
+    parts = [f"{station_id:<11}{year:04d}{month:02d}{element}"]
+    for day in range(31):
+        value = values[day] if day < len(values) else -9999
+        parts.append(f"{value:5d}   ")
+    return "".join(parts)
+
+
+def _seasonal_dly(station_id: str = "XX000000001") -> bytes:
+    # Jeder Monat hat konstante Werte: TMIN = Monat * 10, TMAX = Monat * 10 + 100 (Zehntel °C)
+    lines = []
+    for year in (1999, 2000):
+        for month in range(1, 13):
+            lines.append(_dly_line(station_id, year, month, "TMAX", [month * 10 + 100] * 28))
+            lines.append(_dly_line(station_id, year, month, "TMIN", [month * 10] * 28))
+    return ("\n".join(lines) + "\n").encode("ascii")
+
+
+def test_station_data_seasons_north_and_south(ghcn):
+    _, cache = ghcn({"/all/XX000000001.dly": _seasonal_dly()})
+    north = asyncio.run(get_station_data_from_ghcn("XX000000001", "2000", "2001", 50.0, cache=cache))
+    south = asyncio.run(get_station_data_from_ghcn("XX000000001", "2000", "2001", -20.0, cache=cache))
+
+    y2000 = north["data"][0]
+    assert y2000["year"] == 2000
+    assert y2000["annual"] == {"min": 6.5, "max": 16.5}
+    # Nordhalbkugel: Dezember 1999 zählt zum Winter 2000
+    assert y2000["winter"] == {"min": round((12 + 1 + 2) / 3, 1), "max": round((12 + 1 + 2) / 3 + 10, 1)}
+    assert y2000["spring"] == {"min": 4.0, "max": 14.0}
+    # Jahr 2001 hat keine Tageswerte, nur den Dezember 2000 im Winter
+    assert north["data"][1]["annual"] == {"min": None, "max": None}
+    assert north["data"][1]["winter"] == {"min": 12.0, "max": 22.0}
+
+    # Südhalbkugel: Dezember, Januar, Februar desselben Jahres → summer
+    s2000 = south["data"][0]
+    assert s2000["summer"] == {"min": 5.0, "max": 15.0}
+    assert s2000["winter"] == {"min": 7.0, "max": 17.0}
+    assert south["data"][1]["summer"] == {"min": None, "max": None}
+
+
+def test_station_data_reuses_stored_aggregates(tmp_path, monkeypatch, ghcn):
+    from src.station_aggregates import MonthlyAggregates
+    _, cache = ghcn({"/all/XX000000001.dly": _seasonal_dly()})
+    first = asyncio.run(get_station_data_from_ghcn("XX000000001", "1999", "2000", 50.0, cache=cache))
+
+    def fail(payload):
+        raise AssertionError("Die .dly-Datei darf nicht erneut geparst werden")
+
+    monkeypatch.setattr(MonthlyAggregates, "from_dly", classmethod(lambda cls, payload: fail(payload)))
+    again = asyncio.run(get_station_data_from_ghcn("XX000000001", "1999", "2000", 50.0, cache=cache))
+    narrow = asyncio.run(get_station_data_from_ghcn("XX000000001", "2000", "2000", 50.0, cache=cache))
+    assert again == first
+    assert narrow["data"] == first["data"][1:]
+    assert (tmp_path / "XX000000001.agg.npz").exists()
+
+
+def test_station_data_streaming_stops_after_end_year(tmp_path, ghcn):
+    from src.station_aggregates import MonthlyAggregates
+    payload = make_dly("XX000000002", 1950, 2020, seed=3)
+    full = MonthlyAggregates.from_dly(payload)
+    # Kleine, nicht zeilenbündige Blöcke: Zeilen werden über Blockgrenzen hinweg zusammengesetzt
+    server, cache = ghcn({"/all/XX000000002.dly": payload}, chunk_size=1000)
+
+    async def views():
+        first = await get_station_data_from_ghcn("XX000000002", "1950", "1955", 50.0, cache=cache)
+        # Der Download läuft nach der vorzeitigen Antwort im Hintergrund zu Ende
+        while cache.streaming("XX000000002"):
+            await asyncio.sleep(0.01)
+        again = [await get_station_data_from_ghcn("XX000000002", "1990", "2000", 50.0, cache=cache)
+                 for _ in range(3)]
+        return first, again
+
+    first, again = asyncio.run(views())
+    assert first["data"] == full.to_station_data(1950, 1955, 50.0)
+    assert all(r["data"] == full.to_station_data(1990, 2000, 50.0) for r in again)
+    assert server.count("/all/XX000000002.dly") == 1
+    assert (tmp_path / "XX000000002.dly").read_bytes() == payload
+    assert (tmp_path / "XX000000002.agg.npz").exists()
+
+
+def test_station_data_streaming_coalesces_concurrent_requests(ghcn):
+    from src.station_aggregates import MonthlyAggregates
+    payload = make_dly("XX000000002", 1950, 2020, seed=5)
+    expected = MonthlyAggregates.from_dly(payload).to_station_data(1990, 2000, 50.0)
+    server, cache = ghcn({"/all/XX000000002.dly": payload}, delay=0.2, chunk_size=1000)
+
+    async def fetch_all():
+        return await asyncio.gather(*(get_station_data_from_ghcn("XX000000002", "1990", "2000", 50.0, cache=cache)
+                                      for _ in range(8)))
+
+    results = asyncio.run(fetch_all())
+    assert all(r["data"] == expected for r in results)
+    assert server.count("/all/XX000000002.dly") == 1
+
+
+def test_station_data_streaming_fills_cache(tmp_path, ghcn):
+    from src.station_aggregates import MonthlyAggregates
+    payload = make_dly("XX000000002", 1990, 2000, seed=4)
+    full = MonthlyAggregates.from_dly(payload)
+    server, cache = ghcn({"/all/XX000000002.dly": payload}, chunk_size=777)
+    result = asyncio.run(get_station_data_from_ghcn("XX000000002", "1990", "2000", -10.0, cache=cache))
+    again = asyncio.run(get_station_data_from_ghcn("XX000000002", "1995", "1996", -10.0, cache=cache))
+    assert server.count("/all/XX000000002.dly") == 1
+    assert result["data"] == full.to_station_data(1990, 2000, -10.0)
+    assert again["data"] == full.to_station_data(1995, 1996, -10.0)
+    assert (tmp_path / "XX000000002.dly").read_bytes() == payload
+    assert (tmp_path / "XX000000002.agg.npz").exists()
+
+
+def test_station_data_streaming_releases_admission_slot(ghcn):
+    from src.admission import AdmissionLimiter
+    payload = make_dly("XX000000002", 1950, 2020, seed=6)
+    limiter = AdmissionLimiter(max_concurrent=1, max_queue=0)
+    server, cache = ghcn({"/all/XX000000002.dly": payload}, chunk_size=1000, admission=limiter)
+    # Der Server hält nach der Hälfte der Datei an, bis resume gesetzt wird
+    server.stall_after = len(payload) // 2
+
+    async def view():
+        result = await get_station_data_from_ghcn("XX000000002", "1950", "1955", 50.0, cache=cache)
+        # Niemand wartet mehr auf den Rest der Datei: der Download läuft weiter, belegt aber keinen Platz
+        still_streaming, active = cache.streaming("XX000000002"), limiter.active
+        server.resume.set()
+        while cache.streaming("XX000000002"):
+            await asyncio.sleep(0.01)
+        return result, still_streaming, active
+
+    result, still_streaming, active = asyncio.run(view())
+    assert len(result["data"]) == 6
+    assert still_streaming and active == 0
+    assert cache.has_entry("XX000000002") and server.count("/all/XX000000002.dly") == 1
+
+
+def test_stations_data_batch_bounded_concurrency(ghcn):
+    import time
+    from src import get_stations_data_from_ghcn
+    files = {f"/all/XX00000000{i}.dly": _seasonal_dly().replace(b"XX000000001", f"XX00000000{i}".encode())
+             for i in range(1, 5)}
+    stations = [{"id": f"XX00000000{i}", "latitude": 50.0} for i in range(1, 6)]
+    _, cache = ghcn(files, delay=0.2)
+    started = time.perf_counter()
+    result = asyncio.run(get_stations_data_from_ghcn(stations, "2000", "2000", concurrency=5, cache=cache))
+    elapsed = time.perf_counter() - started
+    assert [s["station_id"] for s in result["stations"]] == [f"XX00000000{i}" for i in range(1, 5)]
+    assert all(s["latitude"] == 50.0 and len(s["data"]) == 1 for s in result["stations"])
+    assert result["errors"][0]["station_id"] == "XX000000005"
+    # Fünf Downloads à 0.2 s laufen gleichzeitig statt nacheinander
+    assert elapsed < 0.8
+
+
+def test_station_data_process_pool(tmp_path, monkeypatch, ghcn):
+    from src import aggregate_pool, station_aggregates
+    from src.station_aggregates import MonthlyAggregates
+    payload = make_dly("XX000000002", 1990, 2000, seed=5)
+    expected = MonthlyAggregates.from_dly(payload).to_station_data(1990, 2000, 50.0)
+    monkeypatch.setattr(aggregate_pool, "AGGREGATE_WORKERS", 2)
+    try:
+        server, _ = ghcn({"/all/XX000000002.dly": payload})
+        # Streaming: jeder Block wird im Prozesspool aggregiert
+        cache = DlyCache(str(tmp_path / "stream"), server.base_url + "/all", chunk_size=4096)
+        streamed = asyncio.run(get_station_data_from_ghcn("XX000000002", "1990", "2000", 50.0, cache=cache))
+        # Gepuffert: an den Pool wird nur der Pfad der Cache-Datei übergeben
+        monkeypatch.setattr(station_aggregates, "DLY_STREAMING", False)
+        cache = DlyCache(str(tmp_path / "buffered"), server.base_url + "/all")
+        buffered = asyncio.run(get_station_data_from_ghcn("XX000000002", "1990", "2000", 50.0, cache=cache))
+        assert aggregate_pool._pool is not None
+    finally:
+        aggregate_pool.shutdown_aggregate_pool()
+    assert streamed["data"] == expected
+    assert buffered["data"] == expected
+
+
+def test_ingest_archive_and_serve_from_store(tmp_path):
+    import io
+    import tarfile
+    import ingest
+    from src.station_aggregates import MonthlyAggregates
+    from src.station_store import StationStore
+    payloads = {f"XX00000000{i}": make_dly(f"XX00000000{i}", 1990 + i, 2000, seed=i) for i in range(3)}
+    archive = tmp_path / "ghcnd_all.tar.gz"
+    with tarfile.open(archive, "w:gz") as tar:
+        for station_id, payload in payloads.items():
+            info = tarfile.TarInfo(f"ghcnd_all/{station_id}.dly")
+            info.size = len(payload)
+            tar.addfile(info, io.BytesIO(payload))
+        # "...dly" ergäbe die Stations-ID ".." und damit einen Pfad außerhalb des Speichers
+        info = tarfile.TarInfo("ghcnd_all/...dly")
+        info.size = len(payloads["XX000000000"])
+        tar.addfile(info, io.BytesIO(payloads["XX000000000"]))
+
+    progress = ingest.ingest(str(archive), str(tmp_path / "store"), workers=0, report_every=0)
+    assert progress.stations == 3 and progress.bytes == sum(len(p) for p in payloads.values())
+    assert progress.failed == 1 and not list(tmp_path.glob("*.npz"))
+    assert (tmp_path / "store" / "XX" / "XX000000002.npz").exists()
+
+    # Kein NOAA-Zugriff: der Cache zeigt auf einen nicht erreichbaren Server
+    store = StationStore(str(tmp_path / "store"))
+    cache = DlyCache(str(tmp_path / "dly"), "http://127.0.0.1:9/all")
+    result = asyncio.run(get_station_data_from_ghcn("XX000000001", "1991", "2000", -5.0, cache=cache, store=store))
+    expected = MonthlyAggregates.from_dly(payloads["XX000000001"]).to_station_data(1991, 2000, -5.0)
+    assert result["data"] == expected
+
+
+def test_ingest_directory_in_parallel(tmp_path):
+    import ingest
+    from src.station_store import StationStore
+    source = tmp_path / "all"
+    source.mkdir()
+    for i in range(4):
+        (source / f"YY00000000{i}.dly").write_bytes(make_dly(f"YY00000000{i}", 2000, 2001, seed=i))
+    progress = ingest.ingest(str(source), str(tmp_path / "store"), workers=2, report_every=0)
+    assert progress.stations == 4 and progress.failed == 0
+    assert StationStore(str(tmp_path / "store")).load("YY000000003").first_year == 2000
+    assert StationStore(str(tmp_path / "store")).load("../YY000000003") is None
+
+
+def test_synthetic_catalog_files_parse():
+    from src.load_station_data import parse_station_data
+    from src.load_station_inventory import parse_station_inventory
+    stations = make_station_list(50, seed=3)
+    inventory = parse_station_inventory(make_inventory(stations).decode().splitlines())
+    catalog = parse_station_data(make_stations_csv(stations).decode().splitlines(), inventory)
+    assert len(catalog) == 50
+    station_id, lat, lon, first_year, last_year = stations[7]
+    row = catalog.find(station_id)
+    assert (float(catalog.latitude[row]), float(catalog.longitude[row])) == (lat, lon)
+    assert inventory[station_id] == {"start_year": first_year, "end_year": last_year}
+
+
+# =============================
+# Tests für abgeleitete Kennzahlen (Monatsmittel, Anomalien, Trends)
+# =============================
+
+def test_derived_metrics_monthly_anomalies_trends():
+    import numpy as np
+    from src.derived_metrics import derived_metrics
+    from src.station_aggregates import ELEMENTS, MonthlyAggregates
+    years = np.arange(1961, 2021)
+    # Tageswerte: TMIN steigt um 0.2 °C pro Jahr, TMAX konstant 20 °C, PRCP 1.5 mm/Tag, kein TAVG
+    sums = np.zeros((len(years), 12, len(ELEMENTS)), dtype=np.int64)
+    counts = np.zeros_like(sums, dtype=np.int32)
+    sums[..., ELEMENTS.index("TMIN")] = (30 * (2 * (years - 1961)))[:, None]
+    sums[..., ELEMENTS.index("TMAX")] = 30 * 200
+    sums[..., ELEMENTS.index("PRCP")] = 30 * 15
+    for element in ("TMIN", "TMAX", "PRCP"):
+        counts[..., ELEMENTS.index(element)] = 30
+    aggregates = MonthlyAggregates(1961, sums, counts)
+
+    result = derived_metrics(aggregates, 1990, 2030, 50.0, ("monthly", "anomalies", "trends"), (1961, 1990))
+    assert [entry["year"] for entry in result["monthly"]] == list(range(1990, 2021))
+    first = result["monthly"][0]
+    assert first["TMIN"] == [5.8] * 12 and first["TAVG"] == [12.9] * 12 and first["PRCP"] == [1.5] * 12
+
+    # Mittel des Referenzzeitraums 1961-1990: TMIN 2.9 °C
+    anomaly = result["anomalies"][0]
+    assert anomaly["annual"]["TMIN"] == 2.9 and anomaly["annual"]["TMAX"] == 0.0
+    assert anomaly["monthly"]["TMIN"] == [2.9] * 12 and result["baseline"] == {"start": 1961, "end": 1990}
+    # Winter der Nordhalbkugel enthalten den Dezember des Vorjahres (auch im Referenzzeitraum)
+    assert abs(anomaly["winter"]["TMIN"] - 2.9) < 0.05
+
+    trends = result["trends"]
+    assert trends["annual"]["TMIN"] == {"per_decade": 2.0, "years": 31}
+    assert trends["summer"]["TMAX"]["per_decade"] == 0.0
+    assert trends["annual"]["TAVG"]["per_decade"] == 1.0
+    short = derived_metrics(aggregates, 2018, 2020, 50.0, ("trends",))
+    assert short["trends"]["annual"]["TMIN"]["per_decade"] is None
+
+
+def test_station_data_with_metrics(ghcn):
+    payload = make_dly("PLM00012375", 1955, 2000, elements=("TMAX", "TMIN", "PRCP"))
+    _, cache = ghcn({"/all/PLM00012375.dly": payload})
+    # Der Zeitraum endet vor dem Referenzzeitraum: der Download muss trotzdem bis 1990 reichen
+    result = asyncio.run(get_station_data_from_ghcn("PLM00012375", "1956", "1958", 52.166, cache=cache,
+                                                    metrics=("anomalies", "monthly")))
+    assert [entry["year"] for entry in result["data"]] == [1956, 1957, 1958]
+    assert len(result["monthly"]) == 3 and len(result["monthly"][0]["PRCP"]) == 12
+    assert result["anomalies"][0]["annual"]["TMIN"] is not None
+    assert "trends" not in result
+
+
+# =============================
+# Tests für Regionalmittel
+# =============================
+
+def test_region_data_weighted_and_streamed(tmp_path, monkeypatch, ghcn):
+    from src import get_region_data as region
+    from src.get_region_data import iter_region_data
+    from src import get_region_data_from_ghcn
+    stations = [{"id": f"RG{i:09d}", "latitude": 50.0, "distance": d} for i, d in enumerate((0.5, 10.0, 20.0))]
+    files = {f"/all/{s['id']}.dly": make_dly(s["id"], 2000, 2003, seed=i) for i, s in enumerate(stations)}
+    files["/all/RG000000001.dly"] = make_dly("RG000000001", 2002, 2003, seed=1)
+    # Stationen werden in Blöcken verrechnet; das Ergebnis hängt nicht von der Blockgröße ab
+    monkeypatch.setattr(region, "REGION_COMBINE_BLOCK", 2)
+    server, cache = ghcn(files)
+    per_station = [asyncio.run(get_station_data_from_ghcn(s["id"], "2000", "2003", 50.0, cache=cache))["data"]
+                   for s in stations]
+    plain = asyncio.run(get_region_data_from_ghcn(stations + [{"id": "RG000000099", "distance": 1.0}],
+                                                  2000, 2003, cache=cache))
+    idw = asyncio.run(get_region_data_from_ghcn(stations, 2000, 2003, "idw", 2.0, cache=cache))
+
+    async def streamed():
+        # Jede Station wird erst geladen, wenn ihr Event gesetzt ist: zuerst nur die erste, die übrigen
+        # nach dem ersten Zwischenergebnis. So hängt der Ablauf nicht von Wartezeiten ab.
+        cold = DlyCache(str(tmp_path / "cold"), server.base_url + "/all")
+        gates = {s["id"]: asyncio.Event() for s in stations}
+        load = region.load_station_aggregates
+
+        async def gated(station_id, *args):
+            await gates[station_id].wait()
+            return await load(station_id, *args)
+
+        monkeypatch.setattr(region, "load_station_aggregates", gated)
+        gates[stations[0]["id"]].set()
+        parts = []
+        async for part in iter_region_data(stations, 2000, 2003, concurrency=1, partial_interval=0.01, cache=cold):
+            parts.append(part)
+            for gate in gates.values():
+                gate.set()
+        return parts
+
+    parts = asyncio.run(streamed())
+
+    # 2000: nur zwei Stationen mit Daten; 2003: Mittel über alle drei
+    assert plain["data"][0]["annual"]["stations"] == 2 and plain["data"][3]["annual"]["stations"] == 3
+    expected = sum(data[3]["annual"]["max"] for data in per_station) / 3
+    assert abs(plain["data"][3]["annual"]["max"] - expected) <= 0.06
+    assert plain["stations_used"] == 3 and [e["station_id"] for e in plain["errors"]] == ["RG000000099"]
+
+    # Inverse Distanzgewichtung: die nächste Station (0.5 km → 1 km) dominiert
+    weights = [1.0, 1 / 100, 1 / 400]
+    expected = sum(w * data[3]["summer"]["min"] for w, data in zip(weights, per_station)) / sum(weights)
+    assert abs(idw["data"][3]["summer"]["min"] - expected) <= 0.06
+
+    assert parts[-1]["type"] == "result" and parts[-1]["data"] == plain["data"]
+    partial = [part for part in parts if part["type"] == "partial"]
+    assert partial[0]["stations_done"] == 1 and all(part["stations_done"] < 3 for part in partial)
+
+
+# =============================
+# Tests für Metriken und Anfrage-Profil
+# =============================
+
+def test_metrics_histogram_render():
+    from src.metrics import Histogram, REGISTRY
+    histogram = Histogram("test_seconds", "Test", ("stage",), buckets=(0.1, 1.0))
+    REGISTRY.remove(histogram)
+    histogram.observe(0.05, stage="a")
+    histogram.observe(0.5, stage="a")
+    assert histogram.render()[2:] == [
+        'test_seconds_bucket{stage="a",le="0.1"} 1',
+        'test_seconds_bucket{stage="a",le="1"} 2',
+        'test_seconds_bucket{stage="a",le="+Inf"} 2',
+        'test_seconds_sum{stage="a"} 0.55',
+        'test_seconds_count{stage="a"} 2',
+    ]
+
+
+def test_station_data_profile(ghcn):
+    from src.metrics import finish_profile, start_profile
+    payload = make_dly("PLM00012375", 2000, 2002)
+    _, cache = ghcn({"/all/PLM00012375.dly": payload})
+
+    async def profiled():
+        token = start_profile()
+        await get_station_data_from_ghcn("PLM00012375", "2000", "2002", 52.166, cache=cache)
+        return finish_profile(token)
+
+    timing = asyncio.run(profiled())
+    n_lines = payload.count(b"\n")
+    for name in ("download;dur=", "parse;dur=", "dly_miss", f'lines;desc="{n_lines}"',
+                 f'download_bytes;desc="{len(payload)}"'):
+        assert name in timing
+
+
+# =============================
+# Tests für den vektorisierten .dly-Parser
+# =============================
+
+def test_parse_dly_values_and_flags():
+    from src.dly_parser import parse_dly
+    line = _dly_line("XX000000001", 2000, 2, "TMAX", [12, -5, -9999, 0, 123])
+    # Tag 2 erhält ein Qualitäts-Flag (QFLAG = Spalte 6 des Tagesfelds)
+    qflag_pos = 21 + 8 * 1 + 6
+    flagged = line[:qflag_pos] + "I" + line[qflag_pos + 1:]
+    other = _dly_line("XX000000001", 2000, 2, "PRCP", [1, 2, 3])
+    payload = (flagged + "\r\n" + other + "\r\n").encode("ascii")
+
+    matrix = parse_dly(payload, ("TMIN", "TMAX"))
+    assert matrix.first_year == 2000
+    assert matrix.values[0, 1, 1, :5].tolist() == [12, -5, -9999, 0, 123]
+    assert matrix.valid[0, 1, 1, :6].tolist() == [True, True, False, True, True, False]
+    assert not matrix.valid[0, :, 0].any()
+
+    sums, counts = matrix.monthly_sums()
+    assert sums[0, 1, 1] == 130 and counts[0, 1, 1] == 4
+
+    masked = parse_dly(payload, ("TMIN", "TMAX"), mask_qflag=True)
+    assert masked.monthly_sums()[0][0, 1, 1] == 135
+
+
+def test_parse_dly_irregular_lines():
+    from src.dly_parser import parse_dly
+    good = _dly_line("XX000000001", 1999, 12, "TMIN", [10, 20])
+    payload = ("short line\n" + good + "   \n" + good.replace("1999", "19X9") + "\n").encode("ascii")
+    matrix = parse_dly(payload, ("TMIN", "TMAX"))
+    assert matrix.first_year == 1999 and matrix.n_years == 1
+    assert matrix.monthly_sums()[0][0, 11, 0] == 30
+    assert parse_dly(b"", ("TMIN", "TMAX")).n_years == 0
@@ -0,0 +1,288 @@
+from fastapi.testclient import TestClient
+import main
+from src import StationCatalog
+
+# =============================
+# Endpunkt-Tests ohne Netzwerk (Katalog wird direkt gesetzt)
+# =============================
+
+STATIONS = [
+    {"id": "PLM00012375", "name": "WARSZAWA-OKECIE", "latitude": 52.166, "longitude": 20.967,
+     "distance": 0.0, "inventory_start_year": 1952, "inventory_end_year": 2024},
+    {"id": "ZI000067775", "name": "HARARE", "latitude": -17.917, "longitude": 31.133,
+     "distance": 0.0, "inventory_start_year": 1950, "inventory_end_year": 2024},
+]
+
+
+def _client(monkeypatch) -> TestClient:
+    monkeypatch.setattr(main, "ALL_STATIONS", StationCatalog.from_dicts(STATIONS))
+    return TestClient(main.app)
+
+
+def test_stations_query_endpoint(monkeypatch):
+    response = _client(monkeypatch).get("/stations-query?latitude=52.166&longitude=20.967&radius=10&count=5")
+    assert response.status_code == 200
+    assert response.json() == [{"id": "PLM00012375", "name": "WARSZAWA-OKECIE",
+                                "latitude": 52.166, "longitude": 20.967, "distance": 0.0}]
+
+
+def test_station_data_unknown_id_rejected_before_download(monkeypatch):
+    async def fail(**kwargs):
+        raise AssertionError("Für unbekannte Stationen darf kein Download erfolgen")
+
+    monkeypatch.setattr(main, "get_station_data_from_ghcn", fail)
+    response = _client(monkeypatch).get("/station/data?stationId=INVALID_ID&startYear=2000&endYear=2010")
+    assert response.status_code == 404
+    assert response.json()["detail"]["station_id"] == "INVALID_ID"
+
+
+def test_station_data_passes_latitude(monkeypatch):
+    calls = []
+
+    async def fake(**kwargs):
+        calls.append(kwargs)
+        return {"station_id": kwargs["station_id"], "data": []}
+
+    monkeypatch.setattr(main, "get_station_data_from_ghcn", fake)
+    response = _client(monkeypatch).get("/station/data?stationId=ZI000067775&startYear=2000&endYear=2010")
+    assert response.status_code == 200
+    assert calls[0]["latitude"] == -17.917
+
+
+def test_station_data_metrics_parameter(monkeypatch):
+    calls = []
+
+    async def fake(**kwargs):
+        calls.append(kwargs)
+        return {"station_id": kwargs["station_id"], "data": []}
+
+    monkeypatch.setattr(main, "get_station_data_from_ghcn", fake)
+    client = _client(monkeypatch)
+    response = client.get("/station/data?stationId=ZI000067775&metrics=trends,monthly&baselineStart=1981&baselineEnd=2010")
+    assert response.status_code == 200
+    assert calls[0]["metrics"] == ("trends", "monthly") and calls[0]["baseline"] == (1981, 2010)
+    assert client.get("/station/data?stationId=ZI000067775&metrics=median").status_code == 400
+    assert client.get("/station/data?stationId=ZI000067775&metrics=trends&baselineStart=2000&baselineEnd=1990").status_code == 400
+    assert client.get("/station/data?stationId=ZI000067775&metrics=anomalies&baselineStart=-10000000"
+                      "&baselineEnd=1990").status_code == 400
+
+
+def test_stations_data_batch_by_ids(monkeypatch):
+    from fastapi import HTTPException
+    from src import get_stations_data
+    calls = []
+
+    async def fake(**kwargs):
+        calls.append(kwargs)
+        if kwargs["station_id"] == "ZI000067775":
+            raise HTTPException(status_code=404, detail={"station_id": "ZI000067775", "error": "Not Found",
+                                                         "message": "There is no station data available"})
+        return {"station_id": kwargs["station_id"], "data": [{"year": 2000}]}
+
+    monkeypatch.setattr(get_stations_data, "get_station_data_from_ghcn", fake)
+    response = _client(monkeypatch).get("/stations/data?stationIds=PLM00012375&stationIds=UNKNOWN"
+                                        "&stationIds=ZI000067775&stationIds=PLM00012375&startYear=2000&endYear=2000")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["stations"] == [{"station_id": "PLM00012375", "name": "WARSZAWA-OKECIE", "latitude": 52.166,
+                                 "longitude": 20.967, "data": [{"year": 2000}]}]
+    assert [e["station_id"] for e in body["errors"]] == ["UNKNOWN", "ZI000067775"]
+    assert sorted(c["station_id"] for c in calls) == ["PLM00012375", "ZI000067775"]
+    assert calls[0]["start_year"] == "2000" and calls[0]["end_year"] == "2000"
+
+
+def test_stations_data_batch_by_radius(monkeypatch):
+    from src import get_stations_data
+
+    async def fake(**kwargs):
+        return {"station_id": kwargs["station_id"], "data": [kwargs["latitude"]]}
+
+    monkeypatch.setattr(get_stations_data, "get_station_data_from_ghcn", fake)
+    client = _client(monkeypatch)
+    response = client.get("/stations/data?latitude=-17.9&longitude=31.1&radius=100&count=5&startYear=2000&endYear=2010")
+    assert response.status_code == 200
+    stations = response.json()["stations"]
+    assert [s["station_id"] for s in stations] == ["ZI000067775"]
+    assert stations[0]["data"] == [-17.917] and "distance" in stations[0]
+
+    assert client.get("/stations/data?latitude=1.0&longitude=2.0&startYear=2000&endYear=2010").status_code == 400
+
+
+def test_stations_data_batch_limits(monkeypatch):
+    from src import get_stations_data
+
+    async def fail(**kwargs):
+        raise AssertionError("Ungültige Sammelanfragen dürfen keine Station laden")
+
+    monkeypatch.setattr(get_stations_data, "get_station_data_from_ghcn", fail)
+    monkeypatch.setattr(main, "STATION_BATCH_MAX_STATIONS", 2)
+    client = _client(monkeypatch)
+    # Ohne Jahresbereich würde jede Station über 0..9999 aggregiert
+    assert client.get("/stations/data?stationIds=PLM00012375").status_code == 422
+    assert client.get("/stations/data?stationIds=PLM00012375&startYear=0&endYear=9999").status_code == 400
+    assert client.get("/stations/data?stationIds=PLM00012375&startYear=2010&endYear=2000").status_code == 400
+    # Die Obergrenze gilt vor dem Nachschlagen im Katalog, auch für unbekannte IDs
+    monkeypatch.setattr(main, "ALL_STATIONS", None)
+    response = client.get("/stations/data?stationIds=A&stationIds=B&stationIds=C&startYear=2000&endYear=2010")
+    assert response.status_code == 400
+
+
+def test_stations_query_cache_hits_and_invalidation(monkeypatch):
+    from src.query_cache import stations_query_cache
+    client = _client(monkeypatch)
+    before = stations_query_cache.stats()
+    first = client.get("/stations-query?latitude=52.166&longitude=20.967&radius=10&count=5")
+    # Abweichung unterhalb der Rundung (1e-5°) trifft denselben Eintrag
+    second = client.get("/stations-query?latitude=52.1660001&longitude=20.967&radius=10&count=5")
+    assert first.content == second.content
+    stats = client.get("/cache/stats").json()["stations_query"]
+    assert stats["hits"] == before["hits"] + 1
+    assert stats["misses"] == before["misses"] + 1
+
+    # Ein neuer Katalog (z.B. nach einer Aktualisierung) verwirft alle Einträge
+    monkeypatch.setattr(main, "ALL_STATIONS", StationCatalog.from_dicts(STATIONS[1:]))
+    assert client.get("/stations-query?latitude=52.166&longitude=20.967&radius=10&count=5").json() == []
+
+
+def test_fast_serialization_matches_schema():
+    from typing import List
+    from pydantic import TypeAdapter
+    from src import Station, get_stations_in_radius
+    from src.json_response import stations_json
+    stations = get_stations_in_radius(StationCatalog.from_dicts(STATIONS), 0.0, 25.0, 10000, 5)
+    adapter = TypeAdapter(List[Station])
+    assert stations_json(stations) == adapter.dump_json(adapter.validate_python(stations))
+
+    # Das öffentliche Schema bleibt in der OpenAPI-Dokumentation erhalten
+    schema = main.app.openapi()
+    response = schema["paths"]["/stations-query"]["get"]["responses"]["200"]
+    assert response["content"]["application/json"]["schema"]["items"]["$ref"] == "#/components/schemas/Station"
+
+
+def test_background_refresh_swaps_catalog(monkeypatch):
+    import asyncio
+    updated = StationCatalog.from_dicts(STATIONS[:1])
+    headers = []
+
+    async def fake_refresh(header):
+        headers.append(header)
+        return updated, {"created": 2.0}
+
+    monkeypatch.setattr(main, "ALL_STATIONS", StationCatalog.from_dicts(STATIONS))
+    monkeypatch.setattr(main, "refresh_catalog_snapshot", fake_refresh)
+    asyncio.run(main.refresh_station_catalog({"created": 1.0}, delay=0, interval=0))
+    assert main.ALL_STATIONS is updated
+    assert headers == [{"created": 1.0}]
+
+
+def test_metrics_and_profile_header(monkeypatch):
+    client = _client(monkeypatch)
+    response = client.get("/stations-query?latitude=-17.917&longitude=31.133&radius=10&count=5",
+                          headers={"X-Profile": "1"})
+    assert response.status_code == 200
+    timing = response.headers["Server-Timing"]
+    for name in ("query;dur=", "serialize;dur=", 'candidates;desc="1"', "total;dur="):
+        assert name in timing
+    assert "Server-Timing" not in client.get("/stations-query?latitude=-17.917&longitude=31.133&radius=10&count=5").headers
+
+    metrics = client.get("/metrics")
+    assert metrics.headers["content-type"].startswith("text/plain")
+    assert 'climatelens_stage_seconds_count{stage="query"}' in metrics.text
+    assert 'climatelens_request_seconds_count{path="/stations-query",status="200"}' in metrics.text
+    assert 'climatelens_cache_events_total{cache="stations_query",result="hit"}' in metrics.text
+
+
+def test_region_data_endpoint_streams_ndjson(monkeypatch):
+    import json
+    calls = []
+
+    async def fake(stations, start_year, end_year, weighting, power):
+        calls.append((stations, weighting))
+        yield {"type": "partial", "stations_done": 1, "data": []}
+        yield {"type": "result", "stations_used": 1, "data": []}
+
+    monkeypatch.setattr(main, "iter_region_data", fake)
+    client = _client(monkeypatch)
+    response = client.get("/region/data?latitude=52.166&longitude=20.967&radius=50&startYear=2000&endYear=2010"
+                          "&weighting=idw&stream=true")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["type"] for line in lines] == ["partial", "result"]
+    assert [s["id"] for s in calls[0][0]] == ["PLM00012375"] and calls[0][1] == "idw"
+    assert client.get("/region/data?latitude=0&longitude=0&radius=50&startYear=2000&endYear=2010"
+                      "&weighting=kriging").status_code == 400
+    assert client.get("/region/data?latitude=0&longitude=0&radius=50&startYear=1&endYear=9999").status_code == 400
+
+
+def test_stations_query_unavailable_while_catalog_loads(monkeypatch):
+    monkeypatch.setattr(main, "ALL_STATIONS", None)
+    client = TestClient(main.app)
+    response = client.get("/stations-query?latitude=52.166&longitude=20.967&radius=10&count=5")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"]
+    assert response.json()["detail"]["catalog"]["state"] != "ready"
+    # Ohne Katalog ist die Hemisphäre unbekannt, /station/data (ohne latitude) und /stations/data
+    # antworten ebenfalls mit 503
+    assert client.get("/station/data?stationId=ZI000067775").status_code == 503
+    assert client.get("/stations/data?stationIds=ZI000067775&startYear=2000&endYear=2010").status_code == 503
+
+    assert client.get("/health").status_code == 200
+    ready = client.get("/ready")
+    assert ready.status_code == 503 and ready.json()["catalog"]["stations"] is None
+
+    monkeypatch.setattr(main, "ALL_STATIONS", StationCatalog.from_dicts(STATIONS))
+    ready = client.get("/ready")
+    assert ready.status_code == 200 and ready.json()["catalog"]["stations"] == 2
+
+
+def test_station_data_with_latitude_while_catalog_loads(monkeypatch):
+    calls = []
+
+    async def fake(**kwargs):
+        calls.append(kwargs)
+        return {"station_id": kwargs["station_id"], "data": []}
+
+    monkeypatch.setattr(main, "get_station_data_from_ghcn", fake)
+    monkeypatch.setattr(main, "ALL_STATIONS", None)
+    client = TestClient(main.app)
+    response = client.get("/station/data?stationId=ZI000067775&startYear=2000&endYear=2010&latitude=-17.917")
+    assert response.status_code == 200
+    assert calls[0]["latitude"] == -17.917
+    assert client.get("/station/data?stationId=ZI000067775&latitude=nan").status_code == 400
+
+    # Mit geladenem Katalog bleibt dessen Breitengrad maßgeblich und unbekannte IDs werden abgewiesen
+    monkeypatch.setattr(main, "ALL_STATIONS", StationCatalog.from_dicts(STATIONS))
+    assert client.get("/station/data?stationId=ZI000067775&latitude=10").status_code == 200
+    assert calls[1]["latitude"] == -17.917
+    assert client.get("/station/data?stationId=UNKNOWN&latitude=10").status_code == 404
+
+
+def test_startup_without_noaa_keeps_serving(monkeypatch, tmp_path):
+    import asyncio
+    attempts = []
+
+    async def fake_build():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError("NOAA nicht erreichbar")
+        await asyncio.sleep(0.2)
+        return StationCatalog.from_dicts(STATIONS), {"created": 1.0}
+
+    async def fake_station_data(**kwargs):
+        return {"station_id": kwargs["station_id"], "latitude": kwargs["latitude"], "data": []}
+
+    monkeypatch.setattr(main, "ALL_STATIONS", None)
+    monkeypatch.setattr(main, "read_catalog_snapshot", lambda: None)
+    monkeypatch.setattr(main, "build_catalog_snapshot", fake_build)
+    monkeypatch.setattr(main, "get_station_data_from_ghcn", fake_station_data)
+    monkeypatch.setattr(main, "CATALOG_REFRESH_INTERVAL", 0)
+    monkeypatch.setattr(main.load_station_catalog, "__defaults__", (0.01, 0.01))
+    with TestClient(main.app) as client:
+        assert client.get("/health").json()["catalog"]["state"] != "ready"
+        # /station/data wartet auf den Katalog (nach dem zweiten Versuch geladen) und kennt dann die Hemisphäre
+        response = client.get("/station/data?stationId=ZI000067775")
+        assert response.status_code == 200 and response.json()["latitude"] == -17.917
+        response = client.get("/stations-query?latitude=52.166&longitude=20.967&radius=10&count=5")
+        assert response.status_code == 200 and len(response.json()) == 1
+        assert client.get("/ready").json()["catalog"]["attempts"] == 2
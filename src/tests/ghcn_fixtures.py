@@ -0,0 +1,151 @@
+"""
+Synthetische GHCN-Dateien und ein lokaler HTTP-Server als NOAA-Ersatz
+für Tests (und Benchmarks), damit diese ohne Netzwerkzugriff laufen.
+"""
+import hashlib
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+def make_dly(station_id: str, first_year: int, last_year: int, elements: tuple = ("TMAX", "TMIN"),
+             seed: int = 0, missing_ratio: float = 0.05) -> bytes:
+    """
+    Erzeugt eine .dly-Datei im GHCN-Fixed-Width-Format (269 Zeichen pro Zeile),
+    sortiert nach Jahr, Monat und Element wie bei NOAA.
+    """
+    rnd = random.Random(seed)
+    lines = []
+    for year in range(first_year, last_year + 1):
+        for month in range(1, 13):
+            for element in elements:
+                base = 150 if element == "TMAX" else 20
+                parts = [f"{station_id:<11}{year:04d}{month:02d}{element}"]
+                for _ in range(31):
+                    if rnd.random() < missing_ratio:
+                        parts.append("-9999   ")
+                    else:
+                        value = base + rnd.randint(-150, 150)
+                        parts.append(f"{value:5d}  S")
+                lines.append("".join(parts))
+    return ("\n".join(lines) + "\n").encode("ascii")
+
+
+def make_station_list(n: int, seed: int = 0, prefix: str = "SY") -> list:
+    """
+    Erzeugt n Stationen (station_id, Breite, Länge, erstes Jahr, letztes Jahr),
+    zufällig über die Landfläche verteilt wie bei NOAA (ohne die Polkappen).
+    """
+    rnd = random.Random(seed)
+    stations = []
+    for i in range(n):
+        first_year = rnd.randint(1850, 2000)
+        stations.append((f"{prefix}{i:09d}", round(rnd.uniform(-60, 80), 4), round(rnd.uniform(-180, 180), 4),
+                         first_year, rnd.randint(first_year, 2024)))
+    return stations
+
+
+def make_stations_csv(stations: list) -> bytes:
+    """
+    ghcnd-stations.csv zu make_station_list: id, Breite, Länge, Höhe, Bundesstaat, Name, ...
+    """
+    lines = [f"{station_id},{lat},{lon},100.0,,SYNTHETIC STATION {i},,," for i, (station_id, lat, lon, _, _)
+             in enumerate(stations)]
+    return ("\n".join(lines) + "\n").encode("ascii")
+
+
+def make_inventory(stations: list, elements: tuple = ("TMAX", "TMIN")) -> bytes:
+    """
+    ghcnd-inventory.txt (Fixed-Width) zu make_station_list, eine Zeile je Station und Element.
+    """
+    lines = [f"{station_id:<11} {lat:8.4f} {lon:9.4f} {element} {first_year:4d} {last_year:4d}"
+             for station_id, lat, lon, first_year, last_year in stations for element in elements]
+    return ("\n".join(lines) + "\n").encode("ascii")
+
+
+class GhcnStubServer:
+    """
+    Minimaler HTTP-Server, der Dateien aus einem Dict (Pfad → Inhalt) ausliefert.
+    Unterstützt ETag/If-None-Match, zählt Anfragen je Pfad und kann Antworten verzögern.
+    Mit stall_after hält der Server jeden Body nach so vielen Bytes an, bis resume gesetzt wird.
+    Verwendung:
+        with GhcnStubServer({"/all/X.dly": payload}) as server:
+            url = server.base_url + "/all"
+    """
+
+    def __init__(self, files: Optional[dict] = None, delay: float = 0.0):
+        self.files = dict(files or {})
+        self.delay = delay
+        self.stall_after: Optional[int] = None
+        self.resume = threading.Event()
+        self.requests: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "GhcnStubServer":
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests[self.path] = stub.requests.get(self.path, 0) + 1
+                if stub.delay:
+                    threading.Event().wait(stub.delay)
+
+                payload = stub.files.get(self.path)
+                if payload is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                etag = '"' + hashlib.md5(payload).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                try:
+                    if stub.stall_after is not None:
+                        self.wfile.write(payload[:stub.stall_after])
+                        self.wfile.flush()
+                        stub.resume.wait()
+                        payload = payload[stub.stall_after:]
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Client hat den Download vorzeitig beendet (z.B. Streaming mit end_year)
+                    self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.resume.set()
+        self._server.shutdown()
+        self._server.server_close()
+        return False
+
+    def count(self, path: str) -> int:
+        with self._lock:
+            return self.requests.get(path, 0)